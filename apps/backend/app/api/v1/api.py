@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends
-from app.api.v1.endpoints import topics, auth, models, onboard, tests, perturbations, criteria
+from app.api.v1.endpoints import topics, auth, models, onboard, tests, perturbations, criteria, jobs
 from app.core.firebase_auth import verify_firebase_token
 
 api_router = APIRouter()
@@ -15,5 +15,6 @@ protected_router.include_router(onboard.router, prefix="/onboard", tags=["onboar
 protected_router.include_router(tests.router, prefix="/tests", tags=["tests"])
 protected_router.include_router(perturbations.router, prefix="/perturbations", tags=["perturbations"])
 protected_router.include_router(criteria.router, prefix="/criteria", tags=["criteria"])
+protected_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 
 api_router.include_router(protected_router)
@@ -24,8 +24,11 @@ class SaveUserCriteriaInput(BaseModel):
 
 @router.post("/user/save")
 def save_user_criteria(body: SaveUserCriteriaInput, user=Depends(verify_firebase_token)):
-    return criteria_service.save_user_criteria(user["uid"], body.topic, body.types)
+    try:
+        return criteria_service.save_user_criteria(user["uid"], body.topic, body.types)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 @router.get("/user/{topic}")
-def get_user_criteria(topic: str, user=Depends(verify_firebase_token)):
-    return criteria_service.get_user_criteria(user["uid"], topic)
+async def get_user_criteria(topic: str, user=Depends(verify_firebase_token)):
+    return await criteria_service.aget_user_criteria(user["uid"], topic)
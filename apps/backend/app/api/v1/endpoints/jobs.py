@@ -0,0 +1,18 @@
+# app/api/v1/endpoints/jobs.py
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.firebase_auth import verify_firebase_token
+from app.services import jobs_service
+
+router = APIRouter()
+
+@router.get("/{job_id}")
+def get_job(job_id: str, user=Depends(verify_firebase_token)):
+    """
+    Report any background job's status and progress (e.g. topic or tests deletes).
+    """
+    job = jobs_service.get_job(user["uid"], job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -2,7 +2,7 @@
 
 from app.models.schemas import ModelSelectInput
 from fastapi import APIRouter, Depends
-from app.core.firebase_auth import verify_firebase_token
+from app.core.firebase_auth import is_admin, require_admin, verify_firebase_token
 from app.services import models_service
 
 router = APIRouter()
@@ -12,9 +12,17 @@ def get_available_models():
     return models_service.get_available_models()
 
 @router.get("/current")
-def get_current_model(user=Depends(verify_firebase_token)):
-    return models_service.get_current_model(user["uid"])
+async def get_current_model(user=Depends(verify_firebase_token)):
+    return await models_service.aget_current_model(user["uid"])
 
 @router.post("/select")
 def select_model(body: ModelSelectInput, user=Depends(verify_firebase_token)):
     return models_service.select_model(user["uid"], body.id)
+
+@router.get("/rate-limit")
+def get_rate_limit_status(user=Depends(verify_firebase_token)):
+    return models_service.get_rate_limit_status(user["uid"], include_shared=is_admin(user))
+
+@router.get("/cache-stats")
+def get_cache_stats(user=Depends(require_admin)):
+    return models_service.get_cache_stats()
@@ -1,29 +1,84 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
 from app.core.firebase_auth import verify_firebase_token
-from app.services import perturbations_service
+from app.services import perturbations_service, sync_service
+from app.utils.sse import sse_response
+from app.utils.pagination import MAX_PAGE_SIZE, json_listing_response, parse_fields
 
 router = APIRouter()
 
 class GeneratePerturbationsInput(BaseModel):
     topic: str
     test_ids: List[str]
-    batch_size: int = 10  # Default batch size for API calls
+    batch_size: Optional[int] = None  # Fixed batch size for API calls; sized from the model's token budget when omitted
 
-@router.post("/generate")
+@router.post("/generate", status_code=202)
 def generate_perturbations(body: GeneratePerturbationsInput, user=Depends(verify_firebase_token)):
     """
-    Generate perturbations using user-defined criteria for a specific topic and list of test IDs.
-    The backend fetches the user's criteria configuration for the topic and applies each selected type.
+    Queue perturbation generation using user-defined criteria for a specific topic and list of test IDs.
+    Returns a job id right away; poll /api/v1/perturbations/jobs/{job_id} for progress and
+    /api/v1/perturbations/jobs/{job_id}/results for the perturbations.
     """
-    return perturbations_service.generate_perturbations(user["uid"], body.topic, body.test_ids, body.batch_size)
+    return perturbations_service.start_perturbation_job(user["uid"], body.topic, body.test_ids, body.batch_size)
+
+@router.post("/generate/stream")
+def stream_perturbations(body: GeneratePerturbationsInput, user=Depends(verify_firebase_token)):
+    """
+    Generate perturbations and stream each one as a server-sent `result` event as soon as its
+    batch is stored, followed by a `summary` event.
+    """
+    return sse_response(perturbations_service.iter_generate_perturbations(user["uid"], body.topic, body.test_ids, body.batch_size))
+
+@router.get("/jobs/{job_id}")
+def get_perturbation_job(job_id: str, user=Depends(verify_firebase_token)):
+    """
+    Report a perturbation job's status, completed/failed/remaining task counts and ETA.
+    """
+    job = perturbations_service.get_perturbation_job(user["uid"], job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}/results")
+def get_perturbation_job_results(job_id: str, user=Depends(verify_firebase_token)):
+    """
+    Fetch the perturbations a job has generated so far.
+    """
+    results = perturbations_service.get_perturbation_job_results(user["uid"], job_id)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return results
 
 @router.get("/topic/{topic}")
-def get_perturbations_by_topic(topic: str, user=Depends(verify_firebase_token)):
+async def get_perturbations_by_topic(
+    topic: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    user=Depends(verify_firebase_token)
+):
     """
     Fetch all perturbations for a specific topic.
     Returns all cached perturbations that were previously generated for the topic.
+    With `limit`, returns one page after `cursor` and a `next_cursor`; with `stream=true`,
+    streams the full listing as it is read. `fields` is a comma-separated projection.
+    """
+    if stream:
+        head, perturbations = await perturbations_service.astream_perturbations_by_topic(user["uid"], topic, parse_fields(fields))
+        return json_listing_response(head, "perturbations", perturbations)
+    return await perturbations_service.aget_perturbations_by_topic(user["uid"], topic, limit, cursor, parse_fields(fields))
+
+
+@router.get("/topic/{topic}/changes")
+async def get_perturbation_changes(topic: str, since: datetime, topic_id: Optional[str] = None,
+                                   user=Depends(verify_firebase_token)):
+    """
+    Perturbations of a topic changed after `since` and ids of perturbations deleted after it.
+    Pass the response's `server_time` as the next `since` and its `topic_id` as `topic_id`;
+    reload the listing on `reset`.
     """
-    return perturbations_service.get_perturbations_by_topic(user["uid"], topic)
\ No newline at end of file
+    return await sync_service.aget_changes(user["uid"], "perturbations", topic, since, topic_id)
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from app.core.firebase_auth import verify_firebase_token
-from app.services import tests_service
+from app.services import sync_service, tests_service
+from app.utils.sse import sse_response
+from app.utils.pagination import MAX_PAGE_SIZE, json_listing_response, parse_fields
 from app.models.schemas import (
     AddTestsRequest,
     DeleteTestsRequest,
@@ -14,24 +17,54 @@ from app.models.schemas import (
 router = APIRouter()
 
 @router.post("/topics/generate-statements")
-def generate_statements_for_topic(generation_data: dict, user=Depends(verify_firebase_token)):
+async def generate_statements_for_topic(generation_data: dict, user=Depends(verify_firebase_token)):
     """
     Generate new statements for an existing topic using AI
     """
     try:
-        return tests_service.generate_statements(user["uid"], generation_data)
+        return await tests_service.agenerate_statements(user["uid"], generation_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Get tests by topic
 @router.get("/topic/{topic}")
-def get_tests_by_topic(topic: str, user=Depends(verify_firebase_token)):
-    return tests_service.get_tests_by_topic(user["uid"], topic)
+async def get_tests_by_topic(
+    topic: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    user=Depends(verify_firebase_token)
+):
+    """
+    Tests of a topic. With `limit`, one page after `cursor` and a `next_cursor`; with
+    `stream=true`, the full listing streamed as it is read. `fields` is a comma-separated
+    projection (e.g. `title,label`).
+    """
+    if stream:
+        head, tests = await tests_service.astream_tests_by_topic(user["uid"], topic, parse_fields(fields))
+        return json_listing_response(head, "tests", tests)
+    return await tests_service.aget_tests_by_topic(user["uid"], topic, limit, cursor, parse_fields(fields))
+
+
+
+@router.get("/topic/{topic}/changes")
+async def get_test_changes(topic: str, since: datetime, topic_id: Optional[str] = None,
+                           user=Depends(verify_firebase_token)):
+    """
+    Tests of a topic changed after `since` and ids of tests deleted after it.
+    Pass the response's `server_time` as the next `since` and its `topic_id` as `topic_id`;
+    reload the listing on `reset`.
+    """
+    return await sync_service.aget_changes(user["uid"], "tests", topic, since, topic_id)
 
 
 @router.post("/add")
 def add_tests(payload: AddTestsRequest, user=Depends(verify_firebase_token)):
-    return tests_service.add_tests(user["uid"], payload.topic, payload.tests)
+    try:
+        return tests_service.add_tests(user["uid"], payload.topic, payload.tests)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.delete("/delete")
@@ -44,6 +77,15 @@ def grade_tests(payload: GradeTestsRequest, user=Depends(verify_firebase_token))
     return tests_service.auto_grade_tests(user["uid"], payload.test_ids)
 
 
+@router.post("/auto-grade/stream")
+def stream_grade_tests(payload: GradeTestsRequest, user=Depends(verify_firebase_token)):
+    """
+    Grade tests and stream each assessment as a server-sent `result` event as soon as its
+    batch is stored, followed by a `summary` event.
+    """
+    return sse_response(tests_service.iter_auto_grade_tests(user["uid"], payload.test_ids))
+
+
 @router.put("/edit")
 def edit_tests(payload: EditTestsRequest, user=Depends(verify_firebase_token)):
     return tests_service.edit_tests(user["uid"], payload.tests)
@@ -10,8 +10,8 @@ from app.services import topics_service
 router = APIRouter()
 
 @router.get("")
-def get_topics(user=Depends(verify_firebase_token)):
-    return topics_service.get_topics(user["uid"])
+async def get_topics(user=Depends(verify_firebase_token)):
+    return await topics_service.aget_topics(user["uid"])
 
 @router.post("/add")
 def add_topic(body: AddTopicInput, user=Depends(verify_firebase_token)):
@@ -33,7 +33,7 @@ def edit_topic_api(body: EditTopicInput, user=Depends(verify_firebase_token)):
         )
 
 @router.post("/test-prompt")
-def test_topic_prompt(body: TestPromptInput, user=Depends(verify_firebase_token)):
-    return topics_service.test_prompt(user["uid"], body.prompt, body.test)
+async def test_topic_prompt(body: TestPromptInput, user=Depends(verify_firebase_token)):
+    return await topics_service.atest_prompt(user["uid"], body.prompt, body.test)
 
 
@@ -1,6 +1,10 @@
 import os
 import json
-from fastapi import Request, HTTPException, status
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi import Depends, Request, HTTPException, status
 import firebase_admin
 from firebase_admin import credentials, auth
 from dotenv import load_dotenv
@@ -16,14 +20,94 @@ if not firebase_admin._apps:
     firebase_admin.initialize_app(creds)
 
 
+# Verified tokens kept in memory until their own expiry. Revocation is not checked on
+# verification either, so serving a cached token until "exp" accepts exactly what
+# verify_id_token would.
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+# Users allowed to read process-wide statistics, besides those with an "admin" custom claim
+ADMIN_UIDS = {uid.strip() for uid in os.getenv("ADMIN_UIDS", "").split(",") if uid.strip()}
+
+_tokens = OrderedDict()  # sha256(token) -> decoded token
+_tokens_lock = threading.Lock()
+_token_stats = {"hits": 0, "misses": 0, "failures": 0, "verify_seconds": 0.0}
+
+
+def _verify_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    now = time.time()
+    with _tokens_lock:
+        decoded_token = _tokens.get(key)
+        if decoded_token is not None:
+            if decoded_token.get("exp", 0) > now:
+                _tokens.move_to_end(key)
+                _token_stats["hits"] += 1
+                return decoded_token
+            del _tokens[key]
+
+    started = time.perf_counter()
+    try:
+        decoded_token = auth.verify_id_token(token)
+    except Exception:
+        with _tokens_lock:
+            _token_stats["failures"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _tokens_lock:
+            _token_stats["verify_seconds"] += elapsed
+
+    with _tokens_lock:
+        _token_stats["misses"] += 1
+        if decoded_token.get("exp", 0) > now and TOKEN_CACHE_MAX_ENTRIES > 0:
+            _tokens[key] = decoded_token
+            while len(_tokens) > TOKEN_CACHE_MAX_ENTRIES:
+                _tokens.popitem(last=False)
+    return decoded_token
+
+
+def get_token_cache_stats() -> dict:
+    """Verified-token cache hits and time spent verifying tokens in this process"""
+    with _tokens_lock:
+        stats = dict(_token_stats)
+        entries = len(_tokens)
+    verified = stats["misses"] + stats["failures"]
+    lookups = stats["hits"] + verified
+    return {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "failures": stats["failures"],
+        "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        "avg_verify_ms": round(stats["verify_seconds"] * 1000 / verified, 2) if verified else 0.0,
+        "entries": entries,
+        "max_entries": TOKEN_CACHE_MAX_ENTRIES,
+    }
+
+
 def verify_firebase_token(request: Request):
+    """
+    Decoded Firebase ID token of the request
+
+    Declared both on the protected router and on endpoints; FastAPI resolves a dependency
+    once per request, and verified tokens are reused across requests until they expire.
+    """
     auth_header = request.headers.get("Authorization")
     if not auth_header:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing Authorization Header")
 
     token = auth_header.split("Bearer ")[-1]
     try:
-        decoded_token = auth.verify_id_token(token)
-        return decoded_token  # contains uid, email, etc.
+        return _verify_token(token)  # contains uid, email, etc.
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid token: {str(e)}")
+
+
+def is_admin(user: dict) -> bool:
+    return user.get("admin") is True or user.get("uid") in ADMIN_UIDS
+
+
+def require_admin(user=Depends(verify_firebase_token)):
+    """Decoded token of an admin; other users get 403"""
+    if not is_admin(user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return user
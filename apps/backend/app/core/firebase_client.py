@@ -2,7 +2,7 @@
 import os
 import json
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
 
 # Only initialize once
 if not firebase_admin._apps:
@@ -11,3 +11,6 @@ if not firebase_admin._apps:
 
 # Global Firestore client
 db = firestore.client()
+
+# Async client for `async def` endpoints, so Firestore waits don't hold threadpool workers
+async_db = firestore_async.client()
@@ -0,0 +1,31 @@
+# app/core/rate_limit_config.py
+
+# Provider allowances per model name: requests per minute (rpm) and tokens per minute (tpm).
+# Buckets start full, so a model can burst up to one minute's allowance before being paced.
+MODEL_RATE_LIMITS = {
+    "llama3-8b-8192": {"rpm": 30, "tpm": 6000},
+    "gemma2-9b-it": {"rpm": 30, "tpm": 15000},
+    "gemini-2.5-flash": {"rpm": 60, "tpm": 250000},
+}
+
+# Used for any model not listed above
+DEFAULT_RATE_LIMIT = {"rpm": 30, "tpm": 6000}
+
+
+def get_rate_limit(model: str) -> dict:
+    return MODEL_RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT)
+
+
+# Context window and maximum completion length per model name, in tokens
+MODEL_CONTEXT_LIMITS = {
+    "llama3-8b-8192": {"context_window": 8192, "max_output_tokens": 8192},
+    "gemma2-9b-it": {"context_window": 8192, "max_output_tokens": 8192},
+    "gemini-2.5-flash": {"context_window": 1048576, "max_output_tokens": 65536},
+}
+
+# Used for any model not listed above
+DEFAULT_CONTEXT_LIMITS = {"context_window": 8192, "max_output_tokens": 4096}
+
+
+def get_context_limits(model: str) -> dict:
+    return MODEL_CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_LIMITS)
@@ -91,13 +91,10 @@ class TopicTestsResponse(BaseModel):
 
 class CachedAssessment(BaseModel):
     id: Optional[str] = None
-    user_id: str
-    topic: str
     model_id: str
-    test_id: str
-    statement: str
-    ai_assessment: Literal["pass", "fail"]
-    created_at: Optional[str] = None
+    prompt_hash: str
+    statement_hash: str
+    ai_assessment: Literal["acceptable", "unacceptable"]
     updated_at: Optional[str] = None
 
 
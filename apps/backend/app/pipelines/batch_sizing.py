@@ -0,0 +1,136 @@
+# app/pipelines/batch_sizing.py
+
+"""
+Token-budget-aware batch sizing for batched LLM operations.
+
+Batches are packed item by item from estimated prompt and completion tokens so that
+each request fits the model's context window, its maximum completion length and a share
+of its per-minute token budget. The packing adapts per model and operation: truncated
+replies shrink batches and raise the completion estimate, frequent parse failures shrink
+batches, and clean replies let them grow back.
+"""
+
+import threading
+from typing import List
+from app.core.rate_limit_config import get_context_limits, get_rate_limit
+from app.pipelines.rate_limiter import estimate_text_tokens
+
+# Token estimates per batched operation:
+#   prompt_overhead   - instructions and formatting shared by the whole batch
+#   item_overhead     - numbering and separators per item
+#   completion_base   - completion tokens per item regardless of its length
+#   completion_ratio  - completion tokens per prompt token of the item
+#   max_items         - upper bound on items per request at full scale
+OPERATION_PROFILES = {
+    "batch_grade": {"prompt_overhead": 150, "item_overhead": 4, "completion_base": 8, "completion_ratio": 0.0, "max_items": 100},
+    "batch_perturb": {"prompt_overhead": 150, "item_overhead": 6, "completion_base": 12, "completion_ratio": 1.2, "max_items": 50},
+}
+
+# Share of a model's tokens-per-minute budget one request may use, so concurrent work can proceed
+TPM_SHARE = 0.5
+
+# Headroom added to the estimated completion when setting max_tokens
+COMPLETION_MARGIN = 1.25
+
+# Adaptation bounds
+MIN_SCALE = 0.1
+MAX_COMPLETION_FACTOR = 4.0
+FAILURE_RATE_THRESHOLD = 0.2
+
+
+class BatchSizer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def _get_state(self, model: str, operation: str) -> dict:
+        """Adaptive state of a model and operation (lock held)"""
+        return self._state.setdefault((model, operation), {
+            "scale": 1.0,
+            "completion_factor": 1.0,
+            "batches": 0,
+            "items": 0,
+            "truncated_batches": 0,
+            "failed_items": 0,
+        })
+
+    def _item_tokens(self, profile: dict, text: str, completion_factor: float) -> tuple:
+        prompt_tokens = estimate_text_tokens(text) + profile["item_overhead"]
+        completion_tokens = (profile["completion_base"] + profile["completion_ratio"] * prompt_tokens) * completion_factor
+        return prompt_tokens, completion_tokens
+
+    def plan(self, model: str, operation: str, texts: List[str]) -> List[List[int]]:
+        """
+        Split texts into consecutive batches sized for one request each
+
+        Returns:
+            List of batches, each a list of indices into `texts`
+        """
+        profile = OPERATION_PROFILES[operation]
+        limits = get_context_limits(model)
+        with self._lock:
+            state = dict(self._get_state(model, operation))
+
+        token_budget = min(limits["context_window"], get_rate_limit(model)["tpm"] * TPM_SHARE) * state["scale"]
+        max_items = max(1, int(profile["max_items"] * state["scale"]))
+        max_completion = limits["max_output_tokens"] / COMPLETION_MARGIN
+
+        batches, current = [], []
+        used, completion = profile["prompt_overhead"], 0.0
+        for i, text in enumerate(texts):
+            prompt_tokens, completion_tokens = self._item_tokens(profile, text, state["completion_factor"])
+            if current and (
+                used + prompt_tokens + completion_tokens > token_budget
+                or completion + completion_tokens > max_completion
+                or len(current) >= max_items
+            ):
+                batches.append(current)
+                current, used, completion = [], profile["prompt_overhead"], 0.0
+            current.append(i)
+            used += prompt_tokens + completion_tokens
+            completion += completion_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def completion_tokens(self, model: str, operation: str, texts: List[str]) -> int:
+        """max_tokens for one batched request over `texts`"""
+        profile = OPERATION_PROFILES[operation]
+        with self._lock:
+            completion_factor = self._get_state(model, operation)["completion_factor"]
+        estimate = sum(self._item_tokens(profile, text, completion_factor)[1] for text in texts)
+        return min(get_context_limits(model)["max_output_tokens"], int(estimate * COMPLETION_MARGIN) + 20)
+
+    def record(self, model: str, operation: str, items: int, truncated: bool, failed: int):
+        """Adapt sizing from one batched reply: whether it hit max_tokens and how many items failed to parse"""
+        if items <= 0:
+            return
+        with self._lock:
+            state = self._get_state(model, operation)
+            state["batches"] += 1
+            state["items"] += items
+            state["failed_items"] += failed
+
+            if truncated:
+                state["truncated_batches"] += 1
+                state["scale"] = max(MIN_SCALE, state["scale"] * 0.5)
+                state["completion_factor"] = min(MAX_COMPLETION_FACTOR, state["completion_factor"] * 1.25)
+                print(f"{operation} reply truncated for {model}, batch scale now {state['scale']:.2f}")
+            elif failed / items > FAILURE_RATE_THRESHOLD:
+                state["scale"] = max(MIN_SCALE, state["scale"] * 0.75)
+                print(f"{operation} lost {failed}/{items} items for {model}, batch scale now {state['scale']:.2f}")
+            elif failed == 0:
+                state["scale"] = min(1.0, state["scale"] * 1.1)
+
+    def status(self, model: str) -> dict:
+        """Current sizing state per operation for a model"""
+        with self._lock:
+            return {operation: dict(state) for (m, operation), state in self._state.items() if m == model}
+
+    def reset(self):
+        with self._lock:
+            self._state.clear()
+
+
+# Process-wide sizer shared by all pipelines
+batch_sizer = BatchSizer()
@@ -0,0 +1,114 @@
+# app/pipelines/batching.py
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+# Follow-up requests allowed for items a batch response left out or answered invalidly
+MAX_RETRY_ROUNDS = 2
+
+
+class BatchResult(list):
+    """
+    Per-item results of a batch operation, in input order.
+
+    Behaves like a plain list; additionally `retried` holds the indices that had to be
+    re-requested in a follow-up batch and `failed` the indices still invalid after
+    the last round.
+    """
+
+    def __init__(self, items: list, retried: Optional[List[int]] = None, failed: Optional[List[int]] = None):
+        super().__init__(items)
+        self.retried = retried or []
+        self.failed = failed or []
+
+
+def _log_round(operation: str, round_number: int, missing: List[int], total: int):
+    print(f"{operation}: re-requesting {len(missing)}/{total} missing items (round {round_number})")
+
+
+def request_with_retries(
+    items: list,
+    request_batch: Callable[[list], list],
+    is_valid: Callable[[Any], bool],
+    operation: str,
+    max_rounds: int = MAX_RETRY_ROUNDS,
+) -> BatchResult:
+    """
+    Run `request_batch` on all items, then re-request only the items whose result is
+    invalid, for at most `max_rounds` smaller follow-up batches. A request that returns
+    no valid item at all is treated as a failed call and not repeated.
+    """
+    results = list(request_batch(items))
+    retried = set()
+    requested = range(len(items))
+
+    for round_number in range(1, max_rounds + 1):
+        missing = [i for i in requested if not is_valid(results[i])]
+        # Nothing to re-request, or the last request returned nothing usable (a failed call, not a partial answer)
+        if not missing or len(missing) == len(requested):
+            break
+        _log_round(operation, round_number, missing, len(items))
+        retried.update(missing)
+        for i, result in zip(missing, request_batch([items[i] for i in missing])):
+            results[i] = result
+        requested = missing
+
+    failed = [i for i, result in enumerate(results) if not is_valid(result)]
+    return BatchResult(results, retried=sorted(retried), failed=failed)
+
+
+async def arequest_with_retries(
+    items: list,
+    request_batch: Callable[[list], Awaitable[list]],
+    is_valid: Callable[[Any], bool],
+    operation: str,
+    max_rounds: int = MAX_RETRY_ROUNDS,
+) -> BatchResult:
+    """Async variant of request_with_retries"""
+    results = list(await request_batch(items))
+    retried = set()
+    requested = range(len(items))
+
+    for round_number in range(1, max_rounds + 1):
+        missing = [i for i in requested if not is_valid(results[i])]
+        # Nothing to re-request, or the last request returned nothing usable (a failed call, not a partial answer)
+        if not missing or len(missing) == len(requested):
+            break
+        _log_round(operation, round_number, missing, len(items))
+        retried.update(missing)
+        for i, result in zip(missing, await request_batch([items[i] for i in missing])):
+            results[i] = result
+        requested = missing
+
+    failed = [i for i, result in enumerate(results) if not is_valid(result)]
+    return BatchResult(results, retried=sorted(retried), failed=failed)
+
+
+def _merge_batches(size: int, batches: List[List[int]], batch_results: List[BatchResult]) -> BatchResult:
+    results, retried, failed = [None] * size, [], []
+    for batch, batch_result in zip(batches, batch_results):
+        for i, value in zip(batch, batch_result):
+            results[i] = value
+        retried.extend(batch[j] for j in getattr(batch_result, "retried", []))
+        failed.extend(batch[j] for j in getattr(batch_result, "failed", []))
+    return BatchResult(results, retried=sorted(retried), failed=sorted(failed))
+
+
+def request_in_batches(items: list, batches: List[List[int]], run_batch: Callable[[list], BatchResult]) -> BatchResult:
+    """Run `run_batch` over planned batches of item indices and merge the results in input order"""
+    batch_results = [run_batch([items[i] for i in batch]) for batch in batches]
+    return _merge_batches(len(items), batches, batch_results)
+
+
+async def arequest_in_batches(items: list, batches: List[List[int]], run_batch: Callable[[list], Awaitable[BatchResult]]) -> BatchResult:
+    """Async variant of request_in_batches; batches run concurrently within the rate limiter's budget"""
+    batch_results = await asyncio.gather(*(run_batch([items[i] for i in batch]) for batch in batches))
+    return _merge_batches(len(items), batches, list(batch_results))
+
+
+def is_valid_grade(grade: Any) -> bool:
+    return grade in ["acceptable", "unacceptable"]
+
+
+def is_valid_perturbation(text: Any) -> bool:
+    return isinstance(text, str) and bool(text.strip())
@@ -2,11 +2,18 @@
 
 import os
 import json
+import asyncio
 import tempfile
 from typing import Optional, Union
 from google.cloud import aiplatform
 from vertexai.generative_models import GenerativeModel
 import vertexai
+from google.api_core.exceptions import ResourceExhausted
+from app.pipelines.rate_limiter import rate_limiter, estimate_text_tokens
+from app.pipelines.response_cache import response_cache
+from app.pipelines.batching import BatchResult, request_with_retries, request_in_batches, is_valid_grade, is_valid_perturbation
+from app.pipelines.batch_sizing import batch_sizer
+from app.pipelines.structured_output import STRUCTURED_OUTPUT, batch_grade_schema, batch_perturb_schema, clean_grade, json_instruction, parse_items
 
 class GCPPipeline:
     def __init__(self, model: str = "gemini-2.5-flash"):
@@ -16,6 +23,9 @@ class GCPPipeline:
         self.location = "us-central1"  # Default location for Vertex AI
         self.model = None
         self.credentials_set = False
+        self.rate_limiter = rate_limiter
+        self.structured_output = STRUCTURED_OUTPUT
+        self.batch_sizer = batch_sizer
         
         # Set up credentials from environment variable
         self._setup_credentials()
@@ -52,7 +62,129 @@ class GCPPipeline:
             print(f"Error setting up GCP credentials: {e}")
             self.credentials_set = False
         
+    def rate_limit_status(self) -> dict:
+        """Current request/token budget, wait estimate and adaptive batch sizing for this model"""
+        return {**self.rate_limiter.status(self.model_name, self.project_id), "batch_sizing": self.batch_sizer.status(self.model_name)}
+
+    def _generate_content(self, full_prompt: str, generation_config: dict, operation: str):
+        """Call Vertex AI within the shared rate limit budget, retrying once after a quota error"""
+        tokens = estimate_text_tokens(full_prompt) + generation_config.get("max_output_tokens", 0)
+        self.rate_limiter.acquire(self.model_name, self.project_id, tokens)
+
+        try:
+            response = self.model.generate_content(full_prompt, generation_config=generation_config)
+        except ResourceExhausted as e:
+            retry_after = 2.0
+            print(f"Vertex AI quota exceeded for {operation}, retrying after {retry_after}s: {e}")
+            self.rate_limiter.penalize(self.model_name, self.project_id, retry_after)
+            self.rate_limiter.acquire(self.model_name, self.project_id, tokens)
+            response = self.model.generate_content(full_prompt, generation_config=generation_config)
+
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and getattr(usage, "total_token_count", None):
+            self.rate_limiter.record_usage(self.model_name, self.project_id, tokens, usage.total_token_count)
+        return response
+
+    def _batch_generation_config(self, generation_config: dict) -> dict:
+        """Ask Vertex AI for a JSON reply in structured output mode"""
+        if self.structured_output:
+            return {**generation_config, "response_mime_type": "application/json"}
+        return generation_config
+
+    def _is_truncated(self, response) -> bool:
+        candidates = getattr(response, "candidates", None) or []
+        return bool(candidates) and getattr(candidates[0].finish_reason, "name", "") == "MAX_TOKENS"
+
+    def plan_batches(self, operation: str, texts: list) -> list:
+        """Split texts into batches sized for this model's context and token budget (lists of indices)"""
+        return self.batch_sizer.plan(self.model_name, operation, texts)
+
+    def _cache_request(self, **inputs) -> dict:
+        """Request identity for the response cache; prompts and sampling are fixed per operation"""
+        return {"provider": "vertex", "model": self.model_name, **inputs}
+
     def grade(self, statement: str, topic_prompt: Optional[str] = None) -> str:
+        return response_cache.cached(
+            "grade",
+            self._cache_request(statement=statement, topic_prompt=topic_prompt),
+            lambda: self._grade(statement, topic_prompt),
+            lambda label: label != "unknown",
+        )
+
+    def custom_perturb(self, prompt: str) -> Union[str, None]:
+        """
+        Generate a perturbed version of text based on the given prompt
+        """
+        return response_cache.cached(
+            "custom_perturb",
+            self._cache_request(prompt=prompt),
+            lambda: self._custom_perturb(prompt),
+            lambda text: text is not None,
+        )
+
+    def batch_perturb(self, prompts: list) -> BatchResult:
+        """
+        Generate multiple perturbations in as few API calls as the model's token budget allows
+        Returns list of perturbed texts (or None for failures) in the same order as input prompts.
+        Items missing from the response are re-requested in smaller follow-up batches;
+        their indices are listed in the result's `retried` attribute.
+        """
+        if not prompts:
+            return BatchResult([])
+
+        def request_batch(items):
+            return response_cache.cached(
+                "batch_perturb",
+                self._cache_request(prompts=items, structured=self.structured_output),
+                lambda: self._batch_perturb(items),
+                lambda texts: None not in texts,
+            )
+
+        return request_in_batches(
+            prompts,
+            self.plan_batches("batch_perturb", prompts),
+            lambda items: request_with_retries(items, request_batch, is_valid_perturbation, "batch perturbation"),
+        )
+
+    def batch_grade(self, statements: list, topic: str) -> BatchResult:
+        """
+        Grade multiple statements in as few API calls as the model's token budget allows
+        Returns list of grades ("acceptable"/"unacceptable"/"unknown") in the same order as input.
+        Statements missing from the response are re-requested in smaller follow-up batches;
+        their indices are listed in the result's `retried` attribute.
+        """
+        if not statements:
+            return BatchResult([])
+
+        def request_batch(items):
+            return response_cache.cached(
+                "batch_grade",
+                self._cache_request(statements=items, topic=topic, structured=self.structured_output),
+                lambda: self._batch_grade(items, topic),
+                lambda grades: "unknown" not in grades,
+            )
+
+        return request_in_batches(
+            statements,
+            self.plan_batches("batch_grade", statements),
+            lambda items: request_with_retries(items, request_batch, is_valid_grade, "batch grading"),
+        )
+
+    # The Vertex SDK calls are blocking, so the async variants run them in a worker thread
+
+    async def agrade(self, statement: str, topic_prompt: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self.grade, statement, topic_prompt)
+
+    async def acustom_perturb(self, prompt: str) -> Union[str, None]:
+        return await asyncio.to_thread(self.custom_perturb, prompt)
+
+    async def abatch_perturb(self, prompts: list) -> BatchResult:
+        return await asyncio.to_thread(self.batch_perturb, prompts)
+
+    async def abatch_grade(self, statements: list, topic: str) -> BatchResult:
+        return await asyncio.to_thread(self.batch_grade, statements, topic)
+
+    def _grade(self, statement: str, topic_prompt: Optional[str] = None) -> str:
         # Check if credentials are properly set up
         if not self.credentials_set or not self.model:
             print("GCP credentials not properly configured, returning unknown")
@@ -72,13 +204,14 @@ class GCPPipeline:
             full_prompt = f"{system_message}\n\n{instruction}"
             
             # Generate response
-            response = self.model.generate_content(
+            response = self._generate_content(
                 full_prompt,
                 generation_config={
                     "max_output_tokens": 10,
                     "temperature": 0.6,
                     "top_p": 0.9,
-                }
+                },
+                operation="grading"
             )
             
             # Extract and process the response
@@ -97,10 +230,7 @@ class GCPPipeline:
             print(f"Error calling Vertex AI API: {e}")
             return "unknown"
 
-    def custom_perturb(self, prompt: str) -> Union[str, None]:
-        """
-        Generate a perturbed version of text based on the given prompt
-        """
+    def _custom_perturb(self, prompt: str) -> Union[str, None]:
         # Check if credentials are properly set up
         if not self.credentials_set or not self.model:
             print("GCP credentials not properly configured, returning None")
@@ -114,13 +244,14 @@ class GCPPipeline:
             full_prompt = f"{system_message}\n\n{prompt}"
             
             # Generate response
-            response = self.model.generate_content(
+            response = self._generate_content(
                 full_prompt,
                 generation_config={
                     "max_output_tokens": 150,
                     "temperature": 0.7,
                     "top_p": 0.9,
-                }
+                },
+                operation="perturbation"
             )
             
             # Extract and return the perturbed text
@@ -131,11 +262,7 @@ class GCPPipeline:
             print(f"Error calling Vertex AI API for perturbation: {e}")
             return None
 
-    def batch_perturb(self, prompts: list) -> list:
-        """
-        Generate multiple perturbations in a single API call for better efficiency
-        Returns list of perturbed texts (or None for failures) in the same order as input prompts
-        """
+    def _batch_perturb(self, prompts: list) -> list:
         if not self.credentials_set or not self.model:
             print("GCP credentials not properly configured for batch perturbation")
             return [None] * len(prompts)
@@ -144,48 +271,36 @@ class GCPPipeline:
             return []
         
         try:
-            # Create a single prompt that processes all perturbations
-            batch_prompt = "Process the following perturbation requests. For each numbered request, apply the specified transformation and return only the transformed text on a new line. Format your response as:\n1. [transformed text 1]\n2. [transformed text 2]\n...\n\nRequests:\n"
+            if self.structured_output:
+                batch_prompt = "Process the following perturbation requests. For each numbered request, apply the specified transformation and return only the transformed text under the request's number. " + json_instruction({"1": "transformed text 1", "2": "transformed text 2"}) + "\n\nRequests:\n"
+                system_message = "You are a text perturbation assistant. Process multiple perturbation requests and return a JSON object mapping each request number to its transformed text. Do not provide explanations."
+            else:
+                # Create a single prompt that processes all perturbations
+                batch_prompt = "Process the following perturbation requests. For each numbered request, apply the specified transformation and return only the transformed text on a new line. Format your response as:\n1. [transformed text 1]\n2. [transformed text 2]\n...\n\nRequests:\n"
+                system_message = "You are a text perturbation assistant. Process multiple perturbation requests and return only the transformed texts, numbered as requested. Do not provide explanations."
             
             for i, prompt in enumerate(prompts, 1):
                 batch_prompt += f"{i}. {prompt}\n"
-
-            # System message
-            system_message = "You are a text perturbation assistant. Process multiple perturbation requests and return only the transformed texts, numbered as requested. Do not provide explanations."
             
             # Combine system message with user prompt
             full_prompt = f"{system_message}\n\n{batch_prompt}"
             
             # Generate response
-            response = self.model.generate_content(
+            response = self._generate_content(
                 full_prompt,
-                generation_config={
-                    "max_output_tokens": min(4000, len(prompts) * 50),
+                generation_config=self._batch_generation_config({
+                    "max_output_tokens": self.batch_sizer.completion_tokens(self.model_name, "batch_perturb", prompts),
                     "temperature": 0.7,
                     "top_p": 0.9,
-                }
+                }),
+                operation=f"batch perturbation ({len(prompts)} items)"
             )
             
             response_text = response.text.strip()
             
-            # Parse the numbered responses
+            schema = batch_perturb_schema(len(prompts)) if self.structured_output else None
+            response_map = parse_items(response_text, len(prompts), schema)
             perturbed_texts = []
-            lines = response_text.split('\n')
-            
-            # Create a mapping of line numbers to responses
-            response_map = {}
-            for line in lines:
-                line = line.strip()
-                if line and line[0].isdigit():
-                    # Extract number and text
-                    parts = line.split('.', 1)
-                    if len(parts) == 2:
-                        try:
-                            num = int(parts[0].strip())
-                            text = parts[1].strip()
-                            response_map[num] = text
-                        except ValueError:
-                            continue
             
             # Build results in the correct order
             for i in range(1, len(prompts) + 1):
@@ -195,17 +310,14 @@ class GCPPipeline:
                     print(f"Missing response for batch perturbation {i}")
                     perturbed_texts.append(None)
             
+            self.batch_sizer.record(self.model_name, "batch_perturb", len(prompts), self._is_truncated(response), perturbed_texts.count(None))
             return perturbed_texts
             
         except Exception as e:
             print(f"Error in GCP batch perturbation: {e}")
             return [None] * len(prompts)
 
-    def batch_grade(self, statements: list, topic: str) -> list:
-        """
-        Grade multiple statements in a single API call for better efficiency
-        Returns list of grades ("acceptable"/"unacceptable"/"unknown") in the same order as input
-        """
+    def _batch_grade(self, statements: list, topic: str) -> list:
         if not self.credentials_set or not self.model:
             print("GCP credentials not properly configured for batch grading")
             return ["unknown"] * len(statements)
@@ -214,49 +326,36 @@ class GCPPipeline:
             return []
         
         try:
-            # Create a single prompt that processes all gradings
-            batch_prompt = f"Grade the following statements as 'acceptable' or 'unacceptable' for the topic: {topic}\n\nFormat your response as:\n1. acceptable/unacceptable\n2. acceptable/unacceptable\n...\n\nStatements to grade:\n"
+            if self.structured_output:
+                batch_prompt = f"Grade the following statements as 'acceptable' or 'unacceptable' for the topic: {topic}\n\n" + json_instruction({"1": "acceptable", "2": "unacceptable"}) + "\n\nStatements to grade:\n"
+                system_message = "Grade each statement as 'acceptable' or 'unacceptable'. Return a JSON object mapping each statement number to its grade. Do not provide explanations."
+            else:
+                # Create a single prompt that processes all gradings
+                batch_prompt = f"Grade the following statements as 'acceptable' or 'unacceptable' for the topic: {topic}\n\nFormat your response as:\n1. acceptable/unacceptable\n2. acceptable/unacceptable\n...\n\nStatements to grade:\n"
+                system_message = "Grade each statement as 'acceptable' or 'unacceptable'. Return only the grades in numbered format. Do not provide explanations."
             
             for i, statement in enumerate(statements, 1):
                 batch_prompt += f"{i}. {statement}\n"
-
-            # System message
-            system_message = "Grade each statement as 'acceptable' or 'unacceptable'. Return only the grades in numbered format. Do not provide explanations."
             
             # Combine system message with user prompt
             full_prompt = f"{system_message}\n\n{batch_prompt}"
             
             # Generate response
-            response = self.model.generate_content(
+            response = self._generate_content(
                 full_prompt,
-                generation_config={
-                    "max_output_tokens": min(1000, len(statements) * 10),
+                generation_config=self._batch_generation_config({
+                    "max_output_tokens": self.batch_sizer.completion_tokens(self.model_name, "batch_grade", statements),
                     "temperature": 0.6,
                     "top_p": 0.9,
-                }
+                }),
+                operation=f"batch grading ({len(statements)} items)"
             )
             
             response_text = response.text.strip()
             
-            # Parse the numbered responses
+            schema = batch_grade_schema(len(statements)) if self.structured_output else None
+            grade_map = parse_items(response_text, len(statements), schema, clean=clean_grade)
             grades = []
-            lines = response_text.split('\n')
-            
-            # Create a mapping of line numbers to grades
-            grade_map = {}
-            for line in lines:
-                line = line.strip()
-                if line and line[0].isdigit():
-                    # Extract number and grade
-                    parts = line.split('.', 1)
-                    if len(parts) == 2:
-                        try:
-                            num = int(parts[0].strip())
-                            grade = parts[1].strip().lower()
-                            if grade in ["acceptable", "unacceptable"]:
-                                grade_map[num] = grade
-                        except ValueError:
-                            continue
             
             # Build results in the correct order
             for i in range(1, len(statements) + 1):
@@ -266,6 +365,7 @@ class GCPPipeline:
                     print(f"Missing or invalid grade for statement {i}")
                     grades.append("unknown")
             
+            self.batch_sizer.record(self.model_name, "batch_grade", len(statements), self._is_truncated(response), grades.count("unknown"))
             return grades
             
         except Exception as e:
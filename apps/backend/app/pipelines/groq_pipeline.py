@@ -2,36 +2,30 @@
 
 import os
 import re
-import time
-import json
-import requests
+import httpx
 from typing import Optional, Union
-
-class GroqRateLimiter:
-    """Global rate limiter for Groq API - 30 RPM = 1 call every 2 seconds"""
-    _last_call_time = 0
-    _min_interval = 2.0  # 2 seconds between calls for 30 RPM
-    
-    @classmethod
-    def wait_if_needed(cls):
-        """Wait if necessary to respect rate limits"""
-        current_time = time.time()
-        time_since_last = current_time - cls._last_call_time
-        
-        if time_since_last < cls._min_interval:
-            sleep_time = cls._min_interval - time_since_last
-            print(f"Rate limiter: waiting {sleep_time:.2f}s before next API call")
-            time.sleep(sleep_time)
-        
-        cls._last_call_time = time.time()
+from app.pipelines.transport import HTTPTransport
+from app.pipelines.rate_limiter import rate_limiter, estimate_request_tokens
+from app.pipelines.response_cache import response_cache
+from app.pipelines.batching import (
+    BatchResult, request_with_retries, arequest_with_retries, request_in_batches, arequest_in_batches,
+    is_valid_grade, is_valid_perturbation
+)
+from app.pipelines.batch_sizing import batch_sizer
+from app.pipelines.structured_output import (
+    STRUCTURED_OUTPUT, batch_grade_schema, batch_perturb_schema, clean_grade, json_instruction, parse_items, parse_statements
+)
+from app.core.criteria_config import GENERATION_PROMPTS
 
 class GroqPipeline:
     def __init__(self, model: str):
         self.api_key = os.getenv("GROQ_API_KEY")
         self.base_url = "https://api.groq.com/openai/v1/chat/completions"
         self.model = model
-        self.rate_limiter = GroqRateLimiter()
-    
+        self.rate_limiter = rate_limiter
+        self.structured_output = STRUCTURED_OUTPUT
+        self.batch_sizer = batch_sizer
+
     def _parse_retry_after(self, error_response: dict) -> float:
         """Parse retry-after time from Groq error response"""
         try:
@@ -43,52 +37,147 @@ class GroqPipeline:
         except Exception:
             pass
         return 2.0  # Default fallback
-    
-    def _make_api_call(self, payload: dict, operation: str) -> Union[dict, None]:
-        """Make API call with proper rate limiting and retry logic"""
-        headers = {
+
+    def _headers(self) -> dict:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
-        # Apply global rate limiting
-        self.rate_limiter.wait_if_needed()
-        
+
+    def _check_api_key(self):
+        if not self.api_key:
+            raise ValueError("GROQ_API_KEY not found in environment variables")
+
+    def _log_request_error(self, e: Exception, operation: str):
+        if isinstance(e, httpx.HTTPError):
+            print(f"Error calling Groq API for {operation}: {e}")
+            response = getattr(e, "response", None) if isinstance(e, httpx.HTTPStatusError) else None
+            if response is not None:
+                print(f"Response status: {response.status_code}")
+                print(f"Response text: {response.text}")
+        else:
+            print(f"Unexpected error in API call for {operation}: {e}")
+
+    def _failed_json_generation(self, response: httpx.Response) -> Union[dict, None]:
+        """
+        Groq rejects JSON-mode replies that are not valid JSON with a 400 carrying the raw
+        output; wrap that output like a normal completion so the text parser can use it.
+        """
+        try:
+            error = response.json().get("error", {})
+        except ValueError:
+            return None
+        if error.get("code") != "json_validate_failed" or not error.get("failed_generation"):
+            return None
+        print("Groq JSON mode validation failed, parsing the raw output instead")
+        return {"choices": [{"message": {"content": error["failed_generation"]}}]}
+
+    def _record_usage(self, result: dict, reserved_tokens: int):
+        usage = result.get("usage") or {}
+        if "total_tokens" in usage:
+            self.rate_limiter.record_usage(self.model, self.api_key, reserved_tokens, usage["total_tokens"])
+
+    def _cache_request(self, payload: dict) -> dict:
+        """
+        Request identity for the response cache: provider plus the payload (model, prompts, sampling).
+        max_tokens is left out since batch sizing adapts it; truncated replies are never cached.
+        """
+        return {"provider": "groq", **{k: v for k, v in payload.items() if k != "max_tokens"}}
+
+    def _is_truncated(self, result: dict) -> bool:
+        return result.get("choices", [{}])[0].get("finish_reason") == "length"
+
+    def plan_batches(self, operation: str, texts: list) -> list:
+        """Split texts into batches sized for this model's context and token budget (lists of indices)"""
+        return self.batch_sizer.plan(self.model, operation, texts)
+
+    def rate_limit_status(self) -> dict:
+        """Current request/token budget, wait estimate and adaptive batch sizing for this model"""
+        return {**self.rate_limiter.status(self.model, self.api_key), "batch_sizing": self.batch_sizer.status(self.model)}
+
+    def _make_api_call(self, payload: dict, operation: str) -> Union[dict, None]:
+        """Make API call with proper rate limiting and retry logic"""
+        client = HTTPTransport.get_client()
+        tokens = estimate_request_tokens(payload)
+
+        # Wait for room in this model's request and token budgets
+        self.rate_limiter.acquire(self.model, self.api_key, tokens)
+
         try:
             print(f"Making Groq API call for {operation}")
-            response = requests.post(self.base_url, headers=headers, json=payload)
-            
+            response = client.post(self.base_url, headers=self._headers(), json=payload)
+
             if response.status_code == 429:
                 # Parse the retry-after time from the error response
                 try:
-                    error_data = response.json()
-                    retry_after = self._parse_retry_after(error_data)
+                    retry_after = self._parse_retry_after(response.json())
                     print(f"Rate limit hit, retrying after {retry_after}s")
-                    time.sleep(retry_after)
-                    
+                    self.rate_limiter.penalize(self.model, self.api_key, retry_after)
+                    self.rate_limiter.acquire(self.model, self.api_key, tokens)
+
                     # Retry once
-                    response = requests.post(self.base_url, headers=headers, json=payload)
+                    response = client.post(self.base_url, headers=self._headers(), json=payload)
                 except Exception as e:
                     print(f"Error parsing rate limit response: {e}")
                     return None
-            
+
+            if response.status_code == 400 and "response_format" in payload:
+                failed_generation = self._failed_json_generation(response)
+                if failed_generation is not None:
+                    return failed_generation
+
             response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Error calling Groq API for {operation}: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response status: {e.response.status_code}")
-                print(f"Response text: {e.response.text}")
+            result = response.json()
+            self._record_usage(result, tokens)
+            return result
+
+        except Exception as e:
+            self._log_request_error(e, operation)
             return None
+
+    async def _amake_api_call(self, payload: dict, operation: str) -> Union[dict, None]:
+        """Async variant of _make_api_call that never blocks the event loop"""
+        client = HTTPTransport.get_async_client()
+        tokens = estimate_request_tokens(payload)
+
+        # Wait for room in this model's request and token budgets
+        await self.rate_limiter.acquire_async(self.model, self.api_key, tokens)
+
+        try:
+            print(f"Making Groq API call for {operation}")
+            response = await client.post(self.base_url, headers=self._headers(), json=payload)
+
+            if response.status_code == 429:
+                # Parse the retry-after time from the error response
+                try:
+                    retry_after = self._parse_retry_after(response.json())
+                    print(f"Rate limit hit, retrying after {retry_after}s")
+                    self.rate_limiter.penalize(self.model, self.api_key, retry_after)
+                    await self.rate_limiter.acquire_async(self.model, self.api_key, tokens)
+
+                    # Retry once
+                    response = await client.post(self.base_url, headers=self._headers(), json=payload)
+                except Exception as e:
+                    print(f"Error parsing rate limit response: {e}")
+                    return None
+
+            if response.status_code == 400 and "response_format" in payload:
+                failed_generation = self._failed_json_generation(response)
+                if failed_generation is not None:
+                    return failed_generation
+
+            response.raise_for_status()
+            result = response.json()
+            self._record_usage(result, tokens)
+            return result
+
         except Exception as e:
-            print(f"Unexpected error in API call for {operation}: {e}")
+            self._log_request_error(e, operation)
             return None
-        
-    def grade(self, statement: str, topic_prompt: Optional[str] = None) -> str:
-        if not self.api_key:
-            raise ValueError("GROQ_API_KEY not found in environment variables")
-        
+
+    # ----------- Grading -----------
+
+    def _grade_payload(self, statement: str, topic_prompt: Optional[str]) -> dict:
         instruction = f"{topic_prompt} {statement}" if topic_prompt else f"Is this statement acceptable or unacceptable? {statement}"
 
         messages = [
@@ -102,7 +191,7 @@ class GroqPipeline:
             }
         ]
 
-        payload = {
+        return {
             "model": self.model,
             "messages": messages,
             "max_tokens": 10,
@@ -110,12 +199,11 @@ class GroqPipeline:
             "top_p": 0.9,
         }
 
-        result = self._make_api_call(payload, f"grading: {statement[:50]}...")
-        
+    def _parse_grade(self, result: Union[dict, None], statement: str) -> str:
         if result is None:
             print(f"API call failed for grading: {statement[:50]}...")
             return "unknown"
-        
+
         try:
             prediction = result["choices"][0]["message"]["content"].strip().lower()
 
@@ -133,15 +221,28 @@ class GroqPipeline:
             print(f"Error parsing Groq API response for grading: {e}")
             return "unknown"
 
+    def grade(self, statement: str, topic_prompt: Optional[str] = None) -> str:
+        self._check_api_key()
+        payload = self._grade_payload(statement, topic_prompt)
+        return response_cache.cached(
+            "grade",
+            self._cache_request(payload),
+            lambda: self._parse_grade(self._make_api_call(payload, f"grading: {statement[:50]}..."), statement),
+            lambda label: label != "unknown",
+        )
 
-    def custom_perturb(self, prompt: str) -> Union[str, None]:
-        """
-        Generate a perturbed version of text based on the given prompt
-        Returns None if perturbation fails
-        """
-        if not self.api_key:
-            raise ValueError("GROQ_API_KEY not found in environment variables")
-        
+    async def agrade(self, statement: str, topic_prompt: Optional[str] = None) -> str:
+        self._check_api_key()
+        payload = self._grade_payload(statement, topic_prompt)
+
+        async def compute():
+            return self._parse_grade(await self._amake_api_call(payload, f"grading: {statement[:50]}..."), statement)
+
+        return await response_cache.acached("grade", self._cache_request(payload), compute, lambda label: label != "unknown")
+
+    # ----------- Single perturbation -----------
+
+    def _custom_perturb_payload(self, prompt: str) -> dict:
         messages = [
             {
                 "role": "system",
@@ -153,7 +254,7 @@ class GroqPipeline:
             }
         ]
 
-        payload = {
+        return {
             "model": self.model,
             "messages": messages,
             "max_tokens": 150,
@@ -161,51 +262,71 @@ class GroqPipeline:
             "top_p": 0.9,
         }
 
+    def _parse_custom_perturb(self, result: Union[dict, None], prompt: str) -> Union[str, None]:
         # Extract original text for comparison
         original_text = prompt.split(": ", 1)[-1] if ": " in prompt else prompt
 
-        result = self._make_api_call(payload, f"perturbation: {prompt[:100]}...")
-        
         if result is None:
             print(f"API call failed for perturbation: {prompt[:100]}...")
             return None
-        
+
         try:
             perturbed_text = result["choices"][0]["message"]["content"].strip()
-            
+
             # Check if the perturbation actually changed the text
             if perturbed_text == original_text:
                 print(f"Warning: Perturbation returned same text as original: {original_text}")
             else:
                 print(f"Successfully perturbed: '{original_text}' -> '{perturbed_text}'")
-            
+
             return perturbed_text
-            
+
         except (KeyError, IndexError) as e:
             print(f"Error parsing Groq API response for perturbation: {e}")
             return None
 
-    def batch_perturb(self, prompts: list) -> list:
+    def custom_perturb(self, prompt: str) -> Union[str, None]:
         """
-        Generate multiple perturbations in a single API call for better efficiency
-        Returns list of perturbed texts (or None for failures) in the same order as input prompts
+        Generate a perturbed version of text based on the given prompt
+        Returns None if perturbation fails
         """
-        if not self.api_key:
-            raise ValueError("GROQ_API_KEY not found in environment variables")
-        
-        if not prompts:
-            return []
-        
-        # Create a single prompt that processes all perturbations
-        batch_prompt = "Process the following perturbation requests. For each numbered request, apply the specified transformation and return only the transformed text on a new line. Format your response as:\n1. [transformed text 1]\n2. [transformed text 2]\n...\n\nRequests:\n"
-        
+        self._check_api_key()
+        payload = self._custom_perturb_payload(prompt)
+        return response_cache.cached(
+            "custom_perturb",
+            self._cache_request(payload),
+            lambda: self._parse_custom_perturb(self._make_api_call(payload, f"perturbation: {prompt[:100]}..."), prompt),
+            lambda text: text is not None,
+        )
+
+    async def acustom_perturb(self, prompt: str) -> Union[str, None]:
+        """Async variant of custom_perturb"""
+        self._check_api_key()
+        payload = self._custom_perturb_payload(prompt)
+
+        async def compute():
+            return self._parse_custom_perturb(await self._amake_api_call(payload, f"perturbation: {prompt[:100]}..."), prompt)
+
+        return await response_cache.acached("custom_perturb", self._cache_request(payload), compute, lambda text: text is not None)
+
+    # ----------- Batch perturbation -----------
+
+    def _batch_perturb_payload(self, prompts: list) -> dict:
+        if self.structured_output:
+            batch_prompt = "Process the following perturbation requests. For each numbered request, apply the specified transformation and return only the transformed text under the request's number. " + json_instruction({"1": "transformed text 1", "2": "transformed text 2"}) + "\n\nRequests:\n"
+            system_content = "You are a text perturbation assistant. Process multiple perturbation requests and return a JSON object mapping each request number to its transformed text. Do not provide explanations. Make sure each transformed text is different from the original."
+        else:
+            # Create a single prompt that processes all perturbations
+            batch_prompt = "Process the following perturbation requests. For each numbered request, apply the specified transformation and return only the transformed text on a new line. Format your response as:\n1. [transformed text 1]\n2. [transformed text 2]\n...\n\nRequests:\n"
+            system_content = "You are a text perturbation assistant. Process multiple perturbation requests and return only the transformed texts, numbered as requested. Do not provide explanations. Only return the transformed text, and make sure it is different from the original."
+
         for i, prompt in enumerate(prompts, 1):
             batch_prompt += f"{i}. {prompt}\n"
 
         messages = [
             {
                 "role": "system",
-                "content": "You are a text perturbation assistant. Process multiple perturbation requests and return only the transformed texts, numbered as requested. Do not provide explanations. Only return the transformed text, and make sure it is different from the original."
+                "content": system_content
             },
             {
                 "role": "user",
@@ -216,82 +337,113 @@ class GroqPipeline:
         payload = {
             "model": self.model,
             "messages": messages,
-            "max_tokens": min(4000, len(prompts) * 50),  # Estimate tokens needed
+            "max_tokens": self.batch_sizer.completion_tokens(self.model, "batch_perturb", prompts),
             "temperature": 0.7,
             "top_p": 0.9,
         }
+        if self.structured_output:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
 
-        result = self._make_api_call(payload, f"batch perturbation ({len(prompts)} items)")
-        
+    def _parse_batch_perturb(self, result: Union[dict, None], prompts: list) -> list:
         if result is None:
             print(f"Batch API call failed for {len(prompts)} perturbations")
             return [None] * len(prompts)
-        
+
         try:
             response_text = result["choices"][0]["message"]["content"].strip()
-            
-            # Parse the numbered responses
-            perturbed_texts = []
-            lines = response_text.split('\n')
-            
-            # Create a mapping of line numbers to responses
-            response_map = {}
-            for line in lines:
-                line = line.strip()
-                if line and line[0].isdigit():
-                    # Extract number and text
-                    parts = line.split('.', 1)
-                    if len(parts) == 2:
-                        try:
-                            num = int(parts[0].strip())
-                            text = parts[1].strip()
-                            response_map[num] = text
-                        except ValueError:
-                            continue
-            
+            schema = batch_perturb_schema(len(prompts)) if self.structured_output else None
+            response_map = parse_items(response_text, len(prompts), schema)
+
             # Build results in the correct order
+            perturbed_texts = []
             for i in range(1, len(prompts) + 1):
                 if i in response_map:
                     original_text = prompts[i-1].split(": ", 1)[-1] if ": " in prompts[i-1] else prompts[i-1]
                     perturbed_text = response_map[i]
-                    
+
                     if perturbed_text == original_text:
                         print(f"Warning: Batch perturbation {i} returned same text as original")
                     else:
                         print(f"Batch perturbation {i} successful: '{original_text[:30]}...' -> '{perturbed_text[:30]}...'")
-                    
+
                     perturbed_texts.append(perturbed_text)
                 else:
                     print(f"Missing response for batch perturbation {i}")
                     perturbed_texts.append(None)
-            
+
+            self.batch_sizer.record(self.model, "batch_perturb", len(prompts), self._is_truncated(result), perturbed_texts.count(None))
             return perturbed_texts
-            
+
         except (KeyError, IndexError) as e:
             print(f"Error parsing batch perturbation response: {e}")
             return [None] * len(prompts)
 
-    def batch_grade(self, statements: list, topic: str) -> list:
+    def _batch_perturb_once(self, prompts: list) -> list:
+        payload = self._batch_perturb_payload(prompts)
+        return response_cache.cached(
+            "batch_perturb",
+            self._cache_request(payload),
+            lambda: self._parse_batch_perturb(self._make_api_call(payload, f"batch perturbation ({len(prompts)} items)"), prompts),
+            lambda texts: None not in texts,
+        )
+
+    async def _abatch_perturb_once(self, prompts: list) -> list:
+        payload = self._batch_perturb_payload(prompts)
+
+        async def compute():
+            return self._parse_batch_perturb(await self._amake_api_call(payload, f"batch perturbation ({len(prompts)} items)"), prompts)
+
+        return await response_cache.acached("batch_perturb", self._cache_request(payload), compute, lambda texts: None not in texts)
+
+    def batch_perturb(self, prompts: list) -> BatchResult:
         """
-        Grade multiple statements in a single API call for better efficiency
-        Returns list of grades ("acceptable"/"unacceptable"/"unknown") in the same order as input
+        Generate multiple perturbations in as few API calls as the model's token budget allows
+        Returns list of perturbed texts (or None for failures) in the same order as input prompts.
+        Items missing from the response are re-requested in smaller follow-up batches;
+        their indices are listed in the result's `retried` attribute.
         """
-        if not self.api_key:
-            raise ValueError("GROQ_API_KEY not found in environment variables")
-        
-        if not statements:
-            return []
-        
-        # Create a single prompt that processes all gradings
-        batch_prompt = f"Grade the following statements as 'acceptable' or 'unacceptable' for the topic: {topic}\n\nFormat your response as:\n1. acceptable/unacceptable\n2. acceptable/unacceptable\n...\n\nStatements to grade:\n"
-        
+        self._check_api_key()
+
+        if not prompts:
+            return BatchResult([])
+
+        return request_in_batches(
+            prompts,
+            self.plan_batches("batch_perturb", prompts),
+            lambda items: request_with_retries(items, self._batch_perturb_once, is_valid_perturbation, "batch perturbation"),
+        )
+
+    async def abatch_perturb(self, prompts: list) -> BatchResult:
+        """Async variant of batch_perturb"""
+        self._check_api_key()
+
+        if not prompts:
+            return BatchResult([])
+
+        async def run_batch(items):
+            return await arequest_with_retries(items, self._abatch_perturb_once, is_valid_perturbation, "batch perturbation")
+
+        return await arequest_in_batches(prompts, self.plan_batches("batch_perturb", prompts), run_batch)
+
+    # ----------- Batch grading -----------
+
+    def _batch_grade_payload(self, statements: list, topic: str) -> dict:
+        if self.structured_output:
+            batch_prompt = f"Grade the following statements as 'acceptable' or 'unacceptable' for the topic: {topic}\n\n" + json_instruction({"1": "acceptable", "2": "unacceptable"}) + "\n\nStatements to grade:\n"
+            system_content = "Grade each statement as 'acceptable' or 'unacceptable'. Return a JSON object mapping each statement number to its grade. Do not provide explanations."
+        else:
+            # Create a single prompt that processes all gradings
+            batch_prompt = f"Grade the following statements as 'acceptable' or 'unacceptable' for the topic: {topic}\n\nFormat your response as:\n1. acceptable/unacceptable\n2. acceptable/unacceptable\n...\n\nStatements to grade:\n"
+            system_content = "Grade each statement as 'acceptable' or 'unacceptable'. Return only the grades in numbered format. Do not provide explanations."
+
         for i, statement in enumerate(statements, 1):
             batch_prompt += f"{i}. {statement}\n"
 
         messages = [
             {
                 "role": "system",
-                "content": "Grade each statement as 'acceptable' or 'unacceptable'. Return only the grades in numbered format. Do not provide explanations."
+                "content": system_content
             },
             {
                 "role": "user",
@@ -302,41 +454,26 @@ class GroqPipeline:
         payload = {
             "model": self.model,
             "messages": messages,
-            "max_tokens": min(1000, len(statements) * 10),  # Estimate tokens needed
+            "max_tokens": self.batch_sizer.completion_tokens(self.model, "batch_grade", statements),
             "temperature": 0.6,
             "top_p": 0.9,
         }
+        if self.structured_output:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
 
-        result = self._make_api_call(payload, f"batch grading ({len(statements)} items)")
-        
+    def _parse_batch_grade(self, result: Union[dict, None], statements: list) -> list:
         if result is None:
             print(f"Batch grading API call failed for {len(statements)} statements")
             return ["unknown"] * len(statements)
-        
+
         try:
             response_text = result["choices"][0]["message"]["content"].strip()
-            
-            # Parse the numbered responses
-            grades = []
-            lines = response_text.split('\n')
-            
-            # Create a mapping of line numbers to grades
-            grade_map = {}
-            for line in lines:
-                line = line.strip()
-                if line and line[0].isdigit():
-                    # Extract number and grade
-                    parts = line.split('.', 1)
-                    if len(parts) == 2:
-                        try:
-                            num = int(parts[0].strip())
-                            grade = parts[1].strip().lower()
-                            if grade in ["acceptable", "unacceptable"]:
-                                grade_map[num] = grade
-                        except ValueError:
-                            continue
-            
+            schema = batch_grade_schema(len(statements)) if self.structured_output else None
+            grade_map = parse_items(response_text, len(statements), schema, clean=clean_grade)
+
             # Build results in the correct order
+            grades = []
             for i in range(1, len(statements) + 1):
                 if i in grade_map:
                     grade = grade_map[i]
@@ -345,44 +482,82 @@ class GroqPipeline:
                 else:
                     print(f"Missing or invalid grade for statement {i}: '{statements[i-1][:50]}...'")
                     grades.append("unknown")
-            
+
+            self.batch_sizer.record(self.model, "batch_grade", len(statements), self._is_truncated(result), grades.count("unknown"))
             return grades
-            
+
         except (KeyError, IndexError) as e:
             print(f"Error parsing batch grading response: {e}")
             return ["unknown"] * len(statements)
-    
-    def generate(self, existing_statements: list, topic_prompt: str, criteria: str = "base", num_statements: int = 5) -> list:
+
+    def _batch_grade_once(self, statements: list, topic: str) -> list:
+        payload = self._batch_grade_payload(statements, topic)
+        return response_cache.cached(
+            "batch_grade",
+            self._cache_request(payload),
+            lambda: self._parse_batch_grade(self._make_api_call(payload, f"batch grading ({len(statements)} items)"), statements),
+            lambda grades: "unknown" not in grades,
+        )
+
+    async def _abatch_grade_once(self, statements: list, topic: str) -> list:
+        payload = self._batch_grade_payload(statements, topic)
+
+        async def compute():
+            return self._parse_batch_grade(await self._amake_api_call(payload, f"batch grading ({len(statements)} items)"), statements)
+
+        return await response_cache.acached("batch_grade", self._cache_request(payload), compute, lambda grades: "unknown" not in grades)
+
+    def batch_grade(self, statements: list, topic: str) -> BatchResult:
         """
-        Generate new statements based on existing statements and criteria
-        Similar to the old LlamaGeneratorPipeline implementation
+        Grade multiple statements in as few API calls as the model's token budget allows
+        Returns list of grades ("acceptable"/"unacceptable"/"unknown") in the same order as input.
+        Statements missing from the response are re-requested in smaller follow-up batches;
+        their indices are listed in the result's `retried` attribute.
         """
-        if not self.api_key:
-            raise ValueError("GROQ_API_KEY not found in environment variables")
-        
+        self._check_api_key()
+
+        if not statements:
+            return BatchResult([])
+
+        return request_in_batches(
+            statements,
+            self.plan_batches("batch_grade", statements),
+            lambda items: request_with_retries(
+                items, lambda retry_items: self._batch_grade_once(retry_items, topic), is_valid_grade, "batch grading"
+            ),
+        )
+
+    async def abatch_grade(self, statements: list, topic: str) -> BatchResult:
+        """Async variant of batch_grade"""
+        self._check_api_key()
+
+        if not statements:
+            return BatchResult([])
+
+        async def request_batch(items):
+            return await self._abatch_grade_once(items, topic)
+
+        async def run_batch(items):
+            return await arequest_with_retries(items, request_batch, is_valid_grade, "batch grading")
+
+        return await arequest_in_batches(statements, self.plan_batches("batch_grade", statements), run_batch)
+
+    # ----------- Statement generation -----------
+
+    def _generate_payload(self, existing_statements: list, topic_prompt: str, criteria: str, num_statements: int) -> dict:
         # Prepare the context from existing statements
         context_statements = "\n".join([f"- {stmt}" for stmt in existing_statements[:10]])  # Use up to 10 examples
-        
-        # Define criteria prompts similar to the old implementation
-        criteria_prompts = {
-            'base': "Generate new test statements similar to the examples provided. Create variations that test the same concept but with different wording or context.",
-            'paraphrase': "Generate paraphrased versions of the example statements using different words but maintaining the same meaning.",
-            'synonyms': "Generate new statements by replacing key words with synonyms in the example statements.",
-            'antonyms': "Generate new statements by replacing key words with antonyms to create opposite meanings from the examples.",
-            'negation': "Generate new statements by adding negation (like 'not') to make the statements express the opposite of the examples.",
-            'spanish': "Generate Spanish translations or Spanish versions of similar statements to the examples.",
-            'english': "Generate English versions or translations of similar statements to the examples.",
-            'spanglish': "Generate Spanglish (mixed English-Spanish) versions of similar statements to the examples.",
-            'nouns': "Generate new statements by changing only the nouns in the example statements while keeping the structure.",
-            'cognates': "Generate new statements using cognates (words that sound similar in different languages) based on the examples.",
-            'colloquial': "Generate new statements using colloquial or informal language based on the examples.",
-            'loan_word': "Generate new statements incorporating loanwords (words borrowed from other languages) based on the examples.",
-            'dialect': "Generate new statements using different dialects or regional variations based on the examples."
-        }
-        
+
         # Get the appropriate prompt for the criteria
-        generation_instruction = criteria_prompts.get(criteria, criteria_prompts['base'])
-        
+        generation_instruction = GENERATION_PROMPTS.get(criteria, GENERATION_PROMPTS['base'])
+
+        if self.structured_output:
+            output_format = f"Do not include explanations or additional text. {json_instruction({'statements': ['statement 1', 'statement 2']})}"
+            system_content = "You are a helpful assistant that generates test statements. Only provide the requested statements as a JSON object with a \"statements\" list. Do not include explanations or additional commentary."
+        else:
+            output_format = "Each statement should be on a new line and start with a number (1., 2., etc.). Do not include explanations or additional text."
+            system_content = "You are a helpful assistant that generates test statements. Only provide the requested statements, one per line, numbered. Do not include explanations or additional commentary."
+
         # Construct the full prompt
         full_prompt = f"""Based on the following topic and example statements, {generation_instruction}
 
@@ -391,12 +566,12 @@ Topic Context: {topic_prompt}
 Example Statements:
 {context_statements}
 
-Generate {num_statements} new statements that are similar in style and content to the examples. Each statement should be on a new line and start with a number (1., 2., etc.). Do not include explanations or additional text."""
+Generate {num_statements} new statements that are similar in style and content to the examples. {output_format}"""
 
         messages = [
             {
                 "role": "system",
-                "content": "You are a helpful assistant that generates test statements. Only provide the requested statements, one per line, numbered. Do not include explanations or additional commentary."
+                "content": system_content
             },
             {
                 "role": "user",
@@ -404,11 +579,6 @@ Generate {num_statements} new statements that are similar in style and content t
             }
         ]
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-
         payload = {
             "model": self.model,
             "messages": messages,
@@ -416,37 +586,43 @@ Generate {num_statements} new statements that are similar in style and content t
             "temperature": 0.7,
             "top_p": 0.9,
         }
+        if self.structured_output:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
+
+    def _parse_generate(self, result: Union[dict, None], num_statements: int) -> list:
+        if result is None:
+            print("API call failed for generation")
+            return []
 
         try:
-            response = requests.post(self.base_url, headers=headers, json=payload)
-            response.raise_for_status()
-            result = response.json()
             generated_text = result["choices"][0]["message"]["content"].strip()
-            
-            # Parse the generated statements
-            statements = []
-            lines = generated_text.split('\n')
-            
-            for line in lines:
-                line = line.strip()
-                if line and (line[0].isdigit() or line.startswith('-') or line.startswith('•')):
-                    # Remove numbering and clean up
-                    clean_statement = line
-                    # Remove common prefixes like "1.", "2.", "-", "•", etc.
-                    import re
-                    clean_statement = re.sub(r'^\d+\.\s*', '', clean_statement)
-                    clean_statement = re.sub(r'^[-•]\s*', '', clean_statement)
-                    clean_statement = clean_statement.strip()
-                    
-                    if clean_statement and len(clean_statement) > 10:  # Basic quality filter
-                        statements.append(clean_statement)
-            
-            # Ensure we don't return more than requested
-            return statements[:num_statements]
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Error calling Groq API for generation: {e}")
-            return []
+            return parse_statements(generated_text, num_statements, self.structured_output)
+
         except (KeyError, IndexError) as e:
             print(f"Error parsing Groq API response for generation: {e}")
             return []
+
+    def generate(self, existing_statements: list, topic_prompt: str, criteria: str = "base", num_statements: int = 5) -> list:
+        """
+        Generate new statements based on existing statements and criteria
+        Similar to the old LlamaGeneratorPipeline implementation
+        """
+        self._check_api_key()
+        payload = self._generate_payload(existing_statements, topic_prompt, criteria, num_statements)
+        return response_cache.cached(
+            "generate",
+            self._cache_request(payload),
+            lambda: self._parse_generate(self._make_api_call(payload, f"generation ({criteria}, {num_statements} statements)"), num_statements),
+            lambda statements: bool(statements),
+        )
+
+    async def agenerate(self, existing_statements: list, topic_prompt: str, criteria: str = "base", num_statements: int = 5) -> list:
+        """Async variant of generate"""
+        self._check_api_key()
+        payload = self._generate_payload(existing_statements, topic_prompt, criteria, num_statements)
+
+        async def compute():
+            return self._parse_generate(await self._amake_api_call(payload, f"generation ({criteria}, {num_statements} statements)"), num_statements)
+
+        return await response_cache.acached("generate", self._cache_request(payload), compute, lambda statements: bool(statements))
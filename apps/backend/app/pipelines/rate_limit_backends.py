@@ -0,0 +1,317 @@
+# app/pipelines/rate_limit_backends.py
+
+"""
+Storage backends for rate limiter state.
+
+The in-memory backend only coordinates threads of one process. The SQLite backend
+shares budgets between all worker processes on a host, and the Redis backend shares
+them between hosts (e.g. several Cloud Run instances).
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+# (bucket name, capacity, refill rate per second, amount requested)
+BucketSpec = Tuple[str, float, float, float]
+
+
+def refill(tokens: float, updated_at: float, capacity: float, refill_rate: float, now: float) -> float:
+    elapsed = max(0.0, now - updated_at)
+    return min(capacity, tokens + elapsed * refill_rate)
+
+
+def wait_for(tokens: float, amount: float, capacity: float, refill_rate: float) -> float:
+    amount = min(amount, capacity)
+    if tokens >= amount:
+        return 0.0
+    return (amount - tokens) / refill_rate
+
+
+class RateLimitBackend(ABC):
+    """
+    Interface for rate limiter state.
+
+    Every method must be atomic with respect to other callers sharing the backend,
+    whether they are threads, worker processes or other hosts.
+    """
+
+    @abstractmethod
+    def try_acquire(self, key: str, buckets: List[BucketSpec], now: float, take: bool = True) -> float:
+        """
+        Refill every bucket of `key`, then take the requested amounts if all of them
+        (and any 429 block) allow it. Returns 0 on success, otherwise the seconds to
+        wait; nothing is taken unless the whole request fits. With take=False this
+        only reports the wait.
+        """
+
+    @abstractmethod
+    def adjust(self, key: str, bucket: BucketSpec, delta: float, now: float):
+        """Add `delta` tokens (negative to charge) to one bucket, capped at capacity"""
+
+    @abstractmethod
+    def block(self, key: str, until: float):
+        """Refuse every acquire on `key` until the given timestamp"""
+
+    @abstractmethod
+    def snapshot(self, key: str, buckets: List[BucketSpec], now: float) -> Dict[str, float]:
+        """Current token count per bucket, plus `blocked_until`"""
+
+
+class MemoryBackend(RateLimitBackend):
+    """Per-process state; only correct when the API runs as a single worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}  # (key, bucket name) -> (tokens, updated_at)
+        self._blocked_until = {}
+
+    def _load(self, key: str, spec: BucketSpec, now: float) -> float:
+        name, capacity, refill_rate, _ = spec
+        tokens, updated_at = self._state.get((key, name), (capacity, now))
+        return refill(tokens, updated_at, capacity, refill_rate, now)
+
+    def try_acquire(self, key, buckets, now, take=True):
+        with self._lock:
+            levels = [self._load(key, spec, now) for spec in buckets]
+            wait = max(
+                [wait_for(tokens, spec[3], spec[1], spec[2]) for tokens, spec in zip(levels, buckets)]
+                + [self._blocked_until.get(key, 0.0) - now, 0.0]
+            )
+            if take and wait == 0:
+                levels = [tokens - min(spec[3], spec[1]) for tokens, spec in zip(levels, buckets)]
+            for tokens, spec in zip(levels, buckets):
+                self._state[(key, spec[0])] = (tokens, now)
+            return wait
+
+    def adjust(self, key, bucket, delta, now):
+        with self._lock:
+            tokens = self._load(key, bucket, now)
+            self._state[(key, bucket[0])] = (min(bucket[1], tokens + delta), now)
+
+    def block(self, key, until):
+        with self._lock:
+            self._blocked_until[key] = max(self._blocked_until.get(key, 0.0), until)
+
+    def snapshot(self, key, buckets, now):
+        with self._lock:
+            result = {spec[0]: self._load(key, spec, now) for spec in buckets}
+            result["blocked_until"] = self._blocked_until.get(key, 0.0)
+            return result
+
+
+class SQLiteBackend(RateLimitBackend):
+    """
+    State in a SQLite file shared by every process on the host.
+
+    Each operation runs in a BEGIN IMMEDIATE transaction, which takes SQLite's
+    write lock, so concurrent workers see a consistent budget.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            " key TEXT NOT NULL, bucket TEXT NOT NULL, tokens REAL NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (key, bucket))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_blocks ("
+            " key TEXT PRIMARY KEY, blocked_until REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._connect()
+        return _ImmediateTransaction(conn)
+
+    def _load(self, conn, key: str, spec: BucketSpec, now: float) -> float:
+        name, capacity, refill_rate, _ = spec
+        row = conn.execute(
+            "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ? AND bucket = ?", (key, name)
+        ).fetchone()
+        tokens, updated_at = row if row else (capacity, now)
+        return refill(tokens, updated_at, capacity, refill_rate, now)
+
+    def _store(self, conn, key: str, name: str, tokens: float, now: float):
+        conn.execute(
+            "INSERT OR REPLACE INTO rate_limit_buckets (key, bucket, tokens, updated_at) VALUES (?, ?, ?, ?)",
+            (key, name, tokens, now),
+        )
+
+    def _blocked_until(self, conn, key: str) -> float:
+        row = conn.execute("SELECT blocked_until FROM rate_limit_blocks WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0.0
+
+    def try_acquire(self, key, buckets, now, take=True):
+        with self._transaction() as conn:
+            levels = [self._load(conn, key, spec, now) for spec in buckets]
+            wait = max(
+                [wait_for(tokens, spec[3], spec[1], spec[2]) for tokens, spec in zip(levels, buckets)]
+                + [self._blocked_until(conn, key) - now, 0.0]
+            )
+            if take and wait == 0:
+                levels = [tokens - min(spec[3], spec[1]) for tokens, spec in zip(levels, buckets)]
+            for tokens, spec in zip(levels, buckets):
+                self._store(conn, key, spec[0], tokens, now)
+            return wait
+
+    def adjust(self, key, bucket, delta, now):
+        with self._transaction() as conn:
+            tokens = self._load(conn, key, bucket, now)
+            self._store(conn, key, bucket[0], min(bucket[1], tokens + delta), now)
+
+    def block(self, key, until):
+        with self._transaction() as conn:
+            until = max(until, self._blocked_until(conn, key))
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_blocks (key, blocked_until) VALUES (?, ?)", (key, until)
+            )
+
+    def snapshot(self, key, buckets, now):
+        with self._transaction() as conn:
+            result = {spec[0]: self._load(conn, key, spec, now) for spec in buckets}
+            result["blocked_until"] = self._blocked_until(conn, key)
+            return result
+
+
+class _ImmediateTransaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+# Token-bucket acquire as a single Redis script so it is atomic across hosts.
+# KEYS[1] = state hash; ARGV = now, take (0/1), then name, capacity, rate, amount per bucket.
+_REDIS_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local take = tonumber(ARGV[2])
+local wait = 0
+local levels = {}
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+if blocked - now > wait then wait = blocked - now end
+local i = 3
+local n = 0
+while ARGV[i] do
+  local name, capacity, rate, amount = ARGV[i], tonumber(ARGV[i+1]), tonumber(ARGV[i+2]), tonumber(ARGV[i+3])
+  local tokens = tonumber(redis.call('HGET', KEYS[1], name .. ':tokens') or capacity)
+  local updated = tonumber(redis.call('HGET', KEYS[1], name .. ':ts') or now)
+  tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+  amount = math.min(amount, capacity)
+  if tokens < amount and (amount - tokens) / rate > wait then wait = (amount - tokens) / rate end
+  n = n + 1
+  levels[n] = {name, tokens, amount}
+  i = i + 4
+end
+for _, level in ipairs(levels) do
+  local tokens = level[2]
+  if take == 1 and wait == 0 then tokens = tokens - level[3] end
+  redis.call('HSET', KEYS[1], level[1] .. ':tokens', tostring(tokens), level[1] .. ':ts', tostring(now))
+end
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+_REDIS_ADJUST_SCRIPT = """
+local now, capacity, rate, delta = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local name = ARGV[1]
+local tokens = tonumber(redis.call('HGET', KEYS[1], name .. ':tokens') or capacity)
+local updated = tonumber(redis.call('HGET', KEYS[1], name .. ':ts') or now)
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate + delta)
+redis.call('HSET', KEYS[1], name .. ':tokens', tostring(tokens), name .. ':ts', tostring(now))
+return tostring(tokens)
+"""
+
+_REDIS_BLOCK_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+if tonumber(ARGV[1]) > current then redis.call('HSET', KEYS[1], 'blocked_until', ARGV[1]) end
+return 1
+"""
+
+
+class RedisBackend(RateLimitBackend):
+    """
+    State in Redis, shared by every instance of the API.
+
+    `client` is anything exposing redis-py's `eval(script, numkeys, *keys_and_args)`
+    and `hgetall(key)`, so a compatible stand-in can be used in its place.
+    """
+
+    def __init__(self, client, prefix: str = "aibat:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def try_acquire(self, key, buckets, now, take=True):
+        args = [now, 1 if take else 0]
+        for spec in buckets:
+            args.extend(spec)
+        return float(self.client.eval(_REDIS_ACQUIRE_SCRIPT, 1, self._key(key), *args))
+
+    def adjust(self, key, bucket, delta, now):
+        name, capacity, refill_rate, _ = bucket
+        self.client.eval(_REDIS_ADJUST_SCRIPT, 1, self._key(key), name, now, capacity, refill_rate, delta)
+
+    def block(self, key, until):
+        self.client.eval(_REDIS_BLOCK_SCRIPT, 1, self._key(key), until)
+
+    def snapshot(self, key, buckets, now):
+        state = {
+            (k.decode() if isinstance(k, bytes) else k): float(v)
+            for k, v in (self.client.hgetall(self._key(key)) or {}).items()
+        }
+        result = {}
+        for name, capacity, refill_rate, _ in buckets:
+            tokens = state.get(f"{name}:tokens", capacity)
+            updated_at = state.get(f"{name}:ts", now)
+            result[name] = refill(tokens, updated_at, capacity, refill_rate, now)
+        result["blocked_until"] = state.get("blocked_until", 0.0)
+        return result
+
+
+def create_backend_from_env() -> RateLimitBackend:
+    """
+    Build the backend selected by RATE_LIMIT_BACKEND ("memory", "sqlite" or "redis").
+
+    sqlite uses RATE_LIMIT_SQLITE_PATH (defaults to a file in the temp directory);
+    redis uses RATE_LIMIT_REDIS_URL and requires the optional `redis` package.
+    """
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+
+    if backend == "sqlite":
+        path = os.getenv("RATE_LIMIT_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "aibat_rate_limits.sqlite3"))
+        print(f"Rate limiter: sharing budgets through SQLite at {path}")
+        return SQLiteBackend(path)
+
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            print("Warning: RATE_LIMIT_BACKEND=redis but the redis package is not installed, using in-memory rate limits")
+            return MemoryBackend()
+        url = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+        print(f"Rate limiter: sharing budgets through Redis at {url}")
+        return RedisBackend(redis.Redis.from_url(url))
+
+    return MemoryBackend()
@@ -0,0 +1,106 @@
+# app/pipelines/rate_limiter.py
+
+import time
+import asyncio
+import hashlib
+from typing import List, Optional
+from app.core.rate_limit_config import get_rate_limit
+from app.pipelines.rate_limit_backends import BucketSpec, RateLimitBackend, MemoryBackend, create_backend_from_env
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Rough token estimate: ~4 characters per token"""
+    return len(text) // 4
+
+
+def estimate_request_tokens(payload: dict) -> int:
+    """Rough token estimate for a chat payload: prompt tokens plus the completion budget"""
+    prompt_tokens = sum(estimate_text_tokens(m.get("content", "")) for m in payload.get("messages", []))
+    return prompt_tokens + payload.get("max_tokens", 0)
+
+
+class RateLimiter:
+    """
+    Request (RPM) and token (TPM) budgets per model and API key.
+
+    Each (model, API key) pair gets its own pair of token buckets sized to the provider
+    allowance in rate_limit_config, so traffic on one model never throttles another.
+    Buckets start full, which allows bursts up to one minute's allowance. Bucket state
+    lives in a RateLimitBackend so that several workers can share one budget.
+    """
+
+    def __init__(self, backend: Optional[RateLimitBackend] = None):
+        self.backend = backend or MemoryBackend()
+
+    def _key(self, model: str, api_key: Optional[str]) -> str:
+        # Never keep raw API keys in the shared state
+        key_hash = hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+        return f"{model}:{key_hash}"
+
+    def _buckets(self, model: str, tokens: int) -> List[BucketSpec]:
+        limits = get_rate_limit(model)
+        return [
+            ("requests", limits["rpm"], limits["rpm"] / 60.0, 1),
+            ("tokens", limits["tpm"], limits["tpm"] / 60.0, tokens),
+        ]
+
+    def try_acquire(self, model: str, api_key: Optional[str] = None, tokens: int = 0) -> float:
+        """
+        Take one request and `tokens` tokens if both are available.
+
+        Never blocks. Returns 0 when acquired, otherwise the estimated seconds to wait
+        before trying again (nothing is taken in that case).
+        """
+        return self.backend.try_acquire(self._key(model, api_key), self._buckets(model, tokens), time.time())
+
+    def acquire(self, model: str, api_key: Optional[str] = None, tokens: int = 0) -> float:
+        """Block until the request fits in the budget; returns the total time waited"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(model, api_key, tokens)
+            if wait == 0:
+                return waited
+            print(f"Rate limiter: waiting {wait:.2f}s before next {model} API call")
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, model: str, api_key: Optional[str] = None, tokens: int = 0) -> float:
+        """Async variant of acquire that yields to the event loop while waiting"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(model, api_key, tokens)
+            if wait == 0:
+                return waited
+            print(f"Rate limiter: waiting {wait:.2f}s before next {model} API call")
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def wait_estimate(self, model: str, api_key: Optional[str] = None, tokens: int = 0) -> float:
+        """Seconds a request of `tokens` tokens would currently have to wait"""
+        return self.backend.try_acquire(self._key(model, api_key), self._buckets(model, tokens), time.time(), take=False)
+
+    def record_usage(self, model: str, api_key: Optional[str], reserved_tokens: int, actual_tokens: int):
+        """Reconcile the token estimate taken at acquire time with the usage the provider reported"""
+        tokens_bucket = self._buckets(model, 0)[1]
+        self.backend.adjust(self._key(model, api_key), tokens_bucket, reserved_tokens - actual_tokens, time.time())
+
+    def penalize(self, model: str, api_key: Optional[str], retry_after: float):
+        """Hold back every caller of this budget for `retry_after` seconds after a 429"""
+        self.backend.block(self._key(model, api_key), time.time() + retry_after)
+
+    def status(self, model: str, api_key: Optional[str] = None) -> dict:
+        """Current budget for a model, suitable for returning from an endpoint"""
+        limits = get_rate_limit(model)
+        state = self.backend.snapshot(self._key(model, api_key), self._buckets(model, 0), time.time())
+        return {
+            "model": model,
+            "requests_available": max(0, int(state["requests"])),
+            "requests_per_minute": limits["rpm"],
+            "tokens_available": max(0, int(state["tokens"])),
+            "tokens_per_minute": limits["tpm"],
+            "wait_estimate_seconds": round(self.wait_estimate(model, api_key), 2),
+        }
+
+
+# Process-wide limiter shared by all pipelines; the backend decides how far the budget is shared
+rate_limiter = RateLimiter(create_backend_from_env())
@@ -0,0 +1,224 @@
+# app/pipelines/response_cache.py
+
+"""
+Content-addressed cache for LLM responses.
+
+Entries are keyed by a hash of the normalized request (provider, model, prompts and
+sampling parameters), so identical requests from any user or service are answered
+without spending rate limit budget. An in-memory LRU tier is bounded by size, and an
+optional SQLite tier keeps entries across restarts.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+# Seconds an entry stays valid per operation; 0 disables caching for that operation.
+# Generation and perturbation are sampled and never cached, because users expect fresh
+# output each time they regenerate.
+OPERATION_TTLS = {
+    "grade": 7 * 24 * 3600,
+    "batch_grade": 7 * 24 * 3600,
+    "custom_perturb": 0,
+    "batch_perturb": 0,
+    "generate": 0,
+}
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_key(operation: str, request: dict) -> str:
+    """Stable hash of an operation and its normalized request"""
+    canonical = json.dumps(
+        {"operation": operation, "request": _normalize(request)},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, disk_path: Optional[str] = None, ttls: Optional[dict] = None):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.ttls = ttls if ttls is not None else OPERATION_TTLS
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (serialized value, expires_at)
+        self._size = 0
+        self._local = threading.local()
+        self._stats = {}
+        self._evictions = 0
+
+        if disk_path:
+            self._disk().execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+                " key TEXT PRIMARY KEY, operation TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    # ----------- Tiers -----------
+
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        if not self.disk_path:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, operation: str, counter: str):
+        op_stats = self._stats.setdefault(operation, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0})
+        op_stats[counter] += 1
+
+    def _remember(self, key: str, serialized: str, expires_at: float):
+        """Insert into the memory tier and evict least recently used entries beyond max_bytes (lock held)"""
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key)[0])
+        self._entries[key] = (serialized, expires_at)
+        self._size += len(serialized)
+        while self._size > self.max_bytes and self._entries:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._evictions += 1
+
+    def get(self, operation: str, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                serialized, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._count(operation, "memory_hits")
+                    return json.loads(serialized)
+                self._size -= len(serialized)
+                del self._entries[key]
+
+        disk = self._disk()
+        if disk is not None:
+            try:
+                row = disk.execute("SELECT value, expires_at FROM llm_response_cache WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Error reading LLM response cache: {e}")
+                row = None
+            if row and row[1] > now:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                    self._count(operation, "disk_hits")
+                return json.loads(row[0])
+
+        with self._lock:
+            self._count(operation, "misses")
+        return None
+
+    def put(self, operation: str, key: str, value: Any):
+        ttl = self.ttls.get(operation, 0)
+        if ttl <= 0:
+            return
+        serialized = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + ttl
+
+        with self._lock:
+            self._remember(key, serialized, expires_at)
+            self._count(operation, "stores")
+
+        disk = self._disk()
+        if disk is not None:
+            try:
+                disk.execute(
+                    "INSERT OR REPLACE INTO llm_response_cache (key, operation, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, operation, serialized, expires_at),
+                )
+            except sqlite3.Error as e:
+                print(f"Error writing LLM response cache: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        disk = self._disk()
+        if disk is not None:
+            disk.execute("DELETE FROM llm_response_cache")
+
+    # ----------- Call wrappers -----------
+
+    def cached(self, operation: str, request: dict, compute: Callable[[], Any], is_valid: Callable[[Any], bool]) -> Any:
+        """
+        Return the cached result for `request`, or run `compute` and cache its result
+        when `is_valid` accepts it (failed or partial LLM answers are never cached).
+        """
+        if self.ttls.get(operation, 0) <= 0:
+            return compute()
+
+        key = make_key(operation, request)
+        hit = self.get(operation, key)
+        if hit is not None:
+            print(f"Response cache hit for {operation}")
+            return hit
+
+        value = compute()
+        if is_valid(value):
+            self.put(operation, key, value)
+        return value
+
+    async def acached(self, operation: str, request: dict, compute: Callable[[], Awaitable[Any]], is_valid: Callable[[Any], bool]) -> Any:
+        """Async variant of cached"""
+        if self.ttls.get(operation, 0) <= 0:
+            return await compute()
+
+        key = make_key(operation, request)
+        hit = self.get(operation, key)
+        if hit is not None:
+            print(f"Response cache hit for {operation}")
+            return hit
+
+        value = await compute()
+        if is_valid(value):
+            self.put(operation, key, value)
+        return value
+
+    # ----------- Reporting -----------
+
+    def stats(self) -> dict:
+        with self._lock:
+            operations = {op: dict(counters) for op, counters in self._stats.items()}
+            totals = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+            for counters in operations.values():
+                for name in totals:
+                    totals[name] += counters[name]
+            lookups = totals["memory_hits"] + totals["disk_hits"] + totals["misses"]
+            return {
+                **totals,
+                "evictions": self._evictions,
+                "hit_rate": round((totals["memory_hits"] + totals["disk_hits"]) / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "disk_enabled": bool(self.disk_path),
+                "operations": operations,
+            }
+
+
+# Process-wide cache shared by all pipelines.
+# LLM_CACHE_DB_PATH enables the on-disk tier; LLM_CACHE_MAX_BYTES bounds the memory tier.
+response_cache = ResponseCache(
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+    disk_path=os.getenv("LLM_CACHE_DB_PATH") or None,
+)
@@ -0,0 +1,192 @@
+# app/pipelines/structured_output.py
+
+"""
+JSON-mode output for batched LLM operations.
+
+Batch prompts ask for a JSON object keyed by item id ("1", "2", ...) and the reply is
+validated against a small JSON schema. Replies that are not valid JSON fall back to the
+numbered-line text parser, so models without a JSON response format keep working.
+"""
+
+import os
+import re
+import json
+from typing import Any, Callable, Dict, Optional
+
+GRADE_LABELS = ["acceptable", "unacceptable"]
+
+# Set LLM_STRUCTURED_OUTPUT=false to send the plain numbered-list prompts
+STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() not in ("0", "false", "no")
+
+_NUMBERED_LINE = re.compile(r"^\s*(?:\*\*)?\(?(\d+)(?:\*\*)?\s*[.):\]-]\s*(.*)$")
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+# ----------- Schemas -----------
+
+def keyed_items_schema(count: int, item_schema: dict) -> dict:
+    """Schema of an object with one entry per item id "1".."count" """
+    ids = [str(i) for i in range(1, count + 1)]
+    return {
+        "type": "object",
+        "properties": {item_id: item_schema for item_id in ids},
+        "required": ids,
+    }
+
+
+def batch_grade_schema(count: int) -> dict:
+    return keyed_items_schema(count, {"type": "string", "enum": GRADE_LABELS})
+
+
+def batch_perturb_schema(count: int) -> dict:
+    return keyed_items_schema(count, {"type": "string", "minLength": 1})
+
+
+def generate_schema(count: int) -> dict:
+    return {
+        "type": "object",
+        "properties": {
+            "statements": {"type": "array", "items": {"type": "string", "minLength": 1}, "maxItems": count}
+        },
+        "required": ["statements"],
+    }
+
+
+def validate(value: Any, schema: dict) -> bool:
+    """Check a value against the subset of JSON schema used here (type, enum, properties, items, lengths)"""
+    expected = schema.get("type")
+    if expected == "object":
+        if not isinstance(value, dict):
+            return False
+        if any(key not in value for key in schema.get("required", [])):
+            return False
+        return all(validate(value[key], sub) for key, sub in schema.get("properties", {}).items() if key in value)
+    if expected == "array":
+        if not isinstance(value, list) or len(value) > schema.get("maxItems", len(value)):
+            return False
+        return all(validate(item, schema.get("items", {})) for item in value)
+    if expected == "string":
+        if not isinstance(value, str) or len(value.strip()) < schema.get("minLength", 0):
+            return False
+    if "enum" in schema and value not in schema["enum"]:
+        return False
+    return True
+
+
+def clean_grade(text: str) -> Optional[str]:
+    """Text fallback for grades: accept "acceptable"/"unacceptable" with stray punctuation or emphasis"""
+    grade = text.strip(" .*").lower()
+    return grade if grade in GRADE_LABELS else None
+
+
+def json_instruction(example: dict) -> str:
+    """Prompt suffix asking for a JSON reply shaped like `example`"""
+    return f"Respond with a JSON object only, exactly in this shape: {json.dumps(example)}"
+
+
+# ----------- Parsing -----------
+
+def extract_json(text: str) -> Optional[Any]:
+    """Parse a JSON reply, tolerating code fences and text around the object"""
+    text = _CODE_FENCE.sub("", text.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return json.loads(text[start:end + 1])
+        except ValueError:
+            pass
+    return None
+
+
+def parse_keyed_items(text: str, schema: dict) -> Optional[Dict[int, str]]:
+    """
+    Parse a JSON reply keyed by item id
+
+    Returns:
+        Mapping of 1-based item id to value for every entry that matches its item schema
+        (so a partially valid reply still yields the good items), or None when the reply
+        is not a JSON object at all.
+    """
+    data = extract_json(text)
+    if not isinstance(data, dict):
+        return None
+    if not validate(data, schema):
+        print(f"Structured response does not match schema ({len(data)} entries)")
+
+    items = {}
+    for item_id, item_schema in schema["properties"].items():
+        value = data.get(item_id)
+        if isinstance(value, str):
+            value = value.strip()
+            if item_schema.get("enum"):
+                value = value.lower()
+        if value is not None and validate(value, item_schema):
+            items[int(item_id)] = value
+    return items
+
+
+def parse_numbered_lines(text: str) -> Dict[int, str]:
+    """
+    Text fallback: parse "1. text", "1) text", "1: text" or "**1.** text" lines.
+    Lines without a number continue the previous item, so multi-line answers stay whole.
+    """
+    items = {}
+    current = None
+    for line in text.split("\n"):
+        match = _NUMBERED_LINE.match(line)
+        if match:
+            current = int(match.group(1))
+            items[current] = match.group(2).strip()
+        elif current is not None and line.strip():
+            items[current] = f"{items[current]} {line.strip()}".strip()
+    return items
+
+
+def parse_items(text: str, count: int, schema: Optional[dict], clean: Callable[[str], Optional[str]] = lambda value: value) -> Dict[int, str]:
+    """
+    Parse a batch reply, preferring the structured JSON form and falling back to numbered lines
+
+    `clean` normalizes text-parsed values and returns None to reject one.
+    """
+    if schema is not None:
+        items = parse_keyed_items(text, schema)
+        if items is not None:
+            return items
+        print("Structured response was not valid JSON, falling back to the text parser")
+
+    items = {}
+    for item_id, value in parse_numbered_lines(text).items():
+        if 1 <= item_id <= count:
+            value = clean(value)
+            if value:
+                items[item_id] = value
+    return items
+
+
+def parse_statements(text: str, count: int, structured: bool) -> list:
+    """Parse generated statements from a {"statements": [...]} reply or a numbered/bulleted list"""
+    if structured:
+        data = extract_json(text)
+        if isinstance(data, dict) and isinstance(data.get("statements"), list):
+            if not validate(data, generate_schema(count)):
+                print(f"Structured response does not match schema ({len(data['statements'])} statements)")
+            statements = [s.strip() for s in data["statements"] if isinstance(s, str) and s.strip()]
+            return statements[:count]
+        print("Structured response was not valid JSON, falling back to the text parser")
+
+    statements = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if line and (line[0].isdigit() or line.startswith('-') or line.startswith('•')):
+            # Remove common prefixes like "1.", "2)", "-", "•", etc.
+            clean_statement = re.sub(r'^\d+[.):]\s*', '', line)
+            clean_statement = re.sub(r'^[-•]\s*', '', clean_statement)
+            clean_statement = clean_statement.strip()
+
+            if clean_statement and len(clean_statement) > 10:  # Basic quality filter
+                statements.append(clean_statement)
+    return statements[:count]
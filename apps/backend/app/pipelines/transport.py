@@ -0,0 +1,76 @@
+# app/pipelines/transport.py
+
+import os
+import asyncio
+import threading
+import weakref
+import httpx
+
+# Keep-alive pool shared by every pipeline instance in the process
+DEFAULT_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=20,
+    keepalive_expiry=30.0,
+)
+
+
+class HTTPTransport:
+    """
+    Process-wide HTTP clients for LLM provider calls.
+
+    A single sync client is shared by all threads, and one async client is kept
+    per running event loop (httpx async pools are bound to the loop that created
+    them). Both reuse TCP/TLS connections across calls.
+    """
+    _lock = threading.Lock()
+    _pid = None
+    _sync_client = None
+    _async_clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def _reset_if_forked(cls):
+        # Connections must not be shared across a fork (e.g. gunicorn/uvicorn workers)
+        if cls._pid != os.getpid():
+            cls._pid = os.getpid()
+            cls._sync_client = None
+            cls._async_clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get_client(cls) -> httpx.Client:
+        """Return the shared sync client, creating it on first use"""
+        with cls._lock:
+            cls._reset_if_forked()
+            if cls._sync_client is None or cls._sync_client.is_closed:
+                cls._sync_client = httpx.Client(timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS)
+            return cls._sync_client
+
+    @classmethod
+    def get_async_client(cls) -> httpx.AsyncClient:
+        """Return the async client bound to the current event loop"""
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            cls._reset_if_forked()
+            client = cls._async_clients.get(loop)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS)
+                cls._async_clients[loop] = client
+            return client
+
+    @classmethod
+    async def aclose(cls):
+        """Close all pooled connections (called on application shutdown)"""
+        with cls._lock:
+            sync_client = cls._sync_client
+            async_clients = list(cls._async_clients.values())
+            cls._sync_client = None
+            cls._async_clients = weakref.WeakKeyDictionary()
+
+        if sync_client is not None:
+            sync_client.close()
+        for client in async_clients:
+            try:
+                await client.aclose()
+            except RuntimeError:
+                # Client belongs to a loop that is already closed
+                pass
@@ -1,178 +1,463 @@
 # app/services/assessment_cache_service.py
 
-from datetime import datetime
-from typing import Dict, List, Optional
+"""
+Content-addressed cache of AI assessments.
+
+Entries live in the top-level assessment_cache collection under a deterministic id
+derived from the model, a hash of the topic prompt and a hash of the normalized
+statement. Identical statements graded with the same prompt and model share one entry
+across tests and users, editing a statement or prompt simply misses the old entry, and
+every lookup is a direct document get (get_all for many statements).
+
+Each user also has a small index document per model, assessment_cache_index/{model_id},
+listing the topics graded with that model. Clearing a topic records "cleared_at" for it
+there, and that user's lookups for the topic skip entries written before then, so its
+statements are graded again.
+
+An in-process LRU tier with a TTL sits in front of Firestore: reads check it first and
+writes go through both tiers. Since entries are keyed by content, an edited or deleted
+test never leaves a stale entry behind. Shared entries are never deleted on behalf of one
+user; each carries an "expires_at" for a Firestore TTL policy, refreshed when it is
+written again.
+
+Verdicts cached before the shared collection existed live in users/{uid}/assessment_cache
+with unreliable model and prompt labels, so they are not carried over; drop_legacy_cache
+deletes them. Run it for every user with `python -m app.services.assessment_cache_service`.
+"""
+
+import os
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
 from app.models.schemas import CachedAssessment
 
+# Only real verdicts are cached; anything else would be served to every user grading the same statement
+CACHEABLE_ASSESSMENTS = ["acceptable", "unacceptable"]
+
+CACHE_COLLECTION = "assessment_cache"
+
+# Per-user collection used before the cache was shared
+LEGACY_CACHE_COLLECTION = "assessment_cache"
+
+# Days a shared entry is kept after its last write ("expires_at", for a Firestore TTL policy)
+RETENTION_DAYS = int(os.getenv("ASSESSMENT_CACHE_RETENTION_DAYS", "90"))
+
+# Memory tier bounds; entries are a 64-character key and a verdict, so the count bounds memory
+MEMORY_MAX_ENTRIES = int(os.getenv("ASSESSMENT_CACHE_MAX_ENTRIES", "50000"))
+MEMORY_TTL_SECONDS = int(os.getenv("ASSESSMENT_CACHE_TTL_SECONDS", "3600"))
+
 # Optional imports for Firebase-dependent functionality
 FIREBASE_AVAILABLE = False
 try:
+    from firebase_admin import firestore
     from app.core.firebase_client import db
+    from app.utils.bulk_write import bulk_delete_query, bulk_write, set_op, update_op
+    from app.services.topic_ids import get_topics_by_id, topic_prompt
+    from app.utils.request_loader import load_documents
     FIREBASE_AVAILABLE = True
 except (ImportError, KeyError, Exception):
     # Firebase dependencies not available
     pass
 
-def get_cached_assessment(user_id: str, topic: str, model_id: str, test_id: str) -> Optional[str]:
+
+# ----------- Memory tier -----------
+
+class _MemoryTier:
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (ai_assessment, expires_at)
+        self._stats = {"memory_hits": 0, "firestore_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+                else:
+                    del self._entries[key]
+            self._stats["memory_hits"] += len(found)
+        return found
+
+    def put_many(self, assessments: Dict[str, str]):
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            for key, ai_assessment in assessments.items():
+                self._entries.pop(key, None)
+                self._entries[key] = (ai_assessment, expires_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._stats["invalidations"] += 1
+
+    def count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+        lookups = stats["memory_hits"] + stats["firestore_hits"] + stats["misses"]
+        return {
+            **stats,
+            "memory_hit_rate": round(stats["memory_hits"] / lookups, 4) if lookups else 0.0,
+            "firestore_hit_rate": round(stats["firestore_hits"] / lookups, 4) if lookups else 0.0,
+            "hit_rate": round((stats["memory_hits"] + stats["firestore_hits"]) / lookups, 4) if lookups else 0.0,
+            "memory_entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+_memory = _MemoryTier(MEMORY_MAX_ENTRIES, MEMORY_TTL_SECONDS)
+
+
+def get_cache_stats() -> dict:
+    """Per-tier hit counters of the assessment cache in this process"""
+    return _memory.stats()
+
+
+# ----------- Keys -----------
+
+def normalize_statement(statement: str) -> str:
+    """Unicode-normalize and collapse whitespace, so formatting-only edits keep their entry"""
+    return " ".join(unicodedata.normalize("NFKC", statement).split())
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def assessment_key(model_id: str, prompt: str, statement: str) -> str:
+    """Cache document id of a statement graded by a model with a topic prompt"""
+    return _sha256(f"{model_id}\n{_sha256(prompt)}\n{_sha256(normalize_statement(statement))}")
+
+
+def _timestamp(moment) -> float:
+    # Stored datetimes are naive UTC when written, timezone-aware when read back
+    if moment is None:
+        return 0.0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+# ----------- Statement-level API -----------
+
+def get_cached_assessments_for_statements(model_id: str, prompt: str, statements: Iterable[str],
+                                          cleared_at: Optional[float] = None) -> Dict[str, str]:
     """
-    Get cached AI assessment for a specific test, topic, and model combination
-    
+    Look up cached verdicts for statements graded with `prompt` by `model_id`
+
+    Args:
+        cleared_at: Skip entries written at or before this timestamp (see get_cleared_topics)
+
     Returns:
-        AI assessment ("pass" or "fail") if cached, None if not found
+        Dictionary mapping each cached statement to its ai_assessment
     """
     if not FIREBASE_AVAILABLE:
-        return None
-    
+        return {}
+
+    keys = {}
+    for statement in statements:
+        if statement:
+            keys.setdefault(assessment_key(model_id, prompt, statement), []).append(statement)
+    if not keys:
+        return {}
+
+    found = _memory.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        try:
+            cache_ref = db.collection(CACHE_COLLECTION)
+            stored = {}
+            for doc in db.get_all([cache_ref.document(key) for key in missing]):
+                if doc.exists:
+                    data = doc.to_dict()
+                    stored[doc.id] = (data.get("ai_assessment"), _timestamp(data.get("updated_at")))
+            _memory.put_many(stored)
+            _memory.count("firestore_hits", len(stored))
+            found.update(stored)
+        except Exception as e:
+            print(f"Error getting cached assessments: {e}")
+    if cleared_at is not None:
+        found = {key: entry for key, entry in found.items() if entry[1] > cleared_at}
+    _memory.count("misses", len(keys) - len(found))
+
+    return {statement: entry[0] for key, entry in found.items() for statement in keys[key]}
+
+
+def cache_statement_assessments(model_id: str, prompt: str, assessments: Dict[str, str],
+                                user_id: Optional[str] = None, topic_id: Optional[str] = None) -> int:
+    """
+    Cache verdicts for statements graded with `prompt` by `model_id`
+
+    Args:
+        assessments: Dictionary mapping statement to ai_assessment
+        user_id, topic_id: Topic the statements belong to, recorded in the user's topic index
+
+    Returns:
+        Number of cached assessments
+    """
+    if not FIREBASE_AVAILABLE:
+        return 0
+
+    cache_ref = db.collection(CACHE_COLLECTION)
+    prompt_hash = _sha256(prompt)
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=RETENTION_DAYS)
+    writes = {}
+    for statement, ai_assessment in assessments.items():
+        if statement and ai_assessment in CACHEABLE_ASSESSMENTS:
+            key = assessment_key(model_id, prompt, statement)
+            writes[key] = set_op(cache_ref.document(key), {
+                "model_id": model_id,
+                "prompt_hash": prompt_hash,
+                "statement_hash": _sha256(normalize_statement(statement)),
+                "ai_assessment": ai_assessment,
+                "updated_at": now,
+                "expires_at": expires_at
+            })
+
     try:
-        # Query for cached assessment
-        cache_ref = db.collection("users").document(user_id).collection("assessment_cache")
-        query = cache_ref.where("topic", "==", topic)\
-                        .where("model_id", "==", model_id)\
-                        .where("test_id", "==", test_id)\
-                        .limit(1)
-        
-        docs = query.stream()
-        for doc in docs:
-            data = doc.to_dict()
-            return data.get("ai_assessment")
-        
+        result = bulk_write(writes.values())
+    except Exception as e:
+        print(f"Error caching assessments: {e}")
+        return 0
+
+    failed_keys = set(result.failed_ids)
+    stored = {key: (op.data["ai_assessment"], _timestamp(now)) for key, op in writes.items() if key not in failed_keys}
+    _memory.put_many(stored)
+    _memory.count("stores", len(stored))
+    if stored and user_id and topic_id:
+        update_topic_index(user_id, model_id, topic_id, cached=True)
+    return result.written
+
+
+# ----------- Topic index -----------
+
+def _topic_index_ref(user_id: str, model_id: str):
+    return db.collection("users").document(user_id).collection("assessment_cache_index").document(model_id)
+
+
+def update_topic_index(user_id: str, model_id: str, topic_id: str, cached: bool):
+    """Add a topic to, or remove it from, the user's index of topics cached for a model"""
+    change = firestore.ArrayUnion([topic_id]) if cached else firestore.ArrayRemove([topic_id])
+    try:
+        _topic_index_ref(user_id, model_id).set({"topic_ids": change, "updated_at": datetime.utcnow()}, merge=True)
+    except Exception as e:
+        print(f"Error updating cached topic index: {e}")
+
+
+def remove_topic_from_indexes(user_id: str, topic_id: str):
+    """Drop a deleted topic from the user's index documents for every model"""
+    query = db.collection("users").document(user_id).collection("assessment_cache_index").where("topic_ids", "array_contains", topic_id)
+    return bulk_write(
+        update_op(doc.reference, {"topic_ids": firestore.ArrayRemove([topic_id])})
+        for doc in query.select([]).stream()
+    )
+
+
+def get_cached_topics_for_model(user_id: str, model_id: str) -> List[str]:
+    """
+    Get list of topics that have cached assessments for a specific model (one document read)
+
+    Returns:
+        List of topic ids
+    """
+    if not FIREBASE_AVAILABLE:
+        return []
+
+    try:
+        doc = _topic_index_ref(user_id, model_id).get()
+        return list(doc.to_dict().get("topic_ids", [])) if doc.exists else []
+    except Exception as e:
+        print(f"Error getting cached topics for model: {e}")
+        return []
+
+
+def get_cleared_topics(user_id: str, model_id: str) -> Dict[str, float]:
+    """
+    When the user last cleared each topic's cache for a model
+
+    Returns:
+        Dictionary mapping topic_id to a timestamp; entries written before it are not served
+    """
+    if not FIREBASE_AVAILABLE:
+        return {}
+
+    try:
+        doc = _topic_index_ref(user_id, model_id).get()
+        cleared = doc.to_dict().get("cleared_at", {}) if doc.exists else {}
+        return {topic_id: _timestamp(moment) for topic_id, moment in cleared.items()}
+    except Exception as e:
+        print(f"Error getting cleared topics for model: {e}")
+        return {}
+
+
+# ----------- Test-level API -----------
+
+def _topic_grading_prompt(user_id: str, topic_id: str) -> str:
+    return topic_prompt(get_topics_by_id(user_id, [topic_id]).get(topic_id, {}), topic_id)
+
+
+def _test_statements(user_id: str, topic_id: str, test_ids: Optional[List[str]] = None) -> Dict[str, str]:
+    """Current statement per test of a topic (all of its tests, or the given ones)"""
+    tests_ref = db.collection("users").document(user_id).collection("tests")
+    if test_ids is None:
+        docs = tests_ref.where("topic_id", "==", topic_id).stream()
+    else:
+        docs = (doc for doc in load_documents(tests_ref.document(test_id) for test_id in test_ids) if doc.exists)
+    return {doc.id: doc.to_dict().get("title", "") for doc in docs}
+
+
+def get_cached_assessment(user_id: str, topic_id: str, model_id: str, test_id: str) -> Optional[str]:
+    """
+    Get cached AI assessment for a test's current statement under its topic's prompt and a model
+
+    Returns:
+        AI assessment if cached, None if not found
+    """
+    if not FIREBASE_AVAILABLE:
         return None
+
+    try:
+        statement = _test_statements(user_id, topic_id, [test_id]).get(test_id)
+        if not statement:
+            return None
+        prompt = _topic_grading_prompt(user_id, topic_id)
+        cleared_at = get_cleared_topics(user_id, model_id).get(topic_id)
+        return get_cached_assessments_for_statements(model_id, prompt, [statement], cleared_at).get(statement)
     except Exception as e:
         print(f"Error getting cached assessment: {e}")
         return None
 
-def get_cached_assessments_for_topic(user_id: str, topic: str, model_id: str) -> Dict[str, str]:
+def get_cached_assessments_for_topic(user_id: str, topic_id: str, model_id: str) -> Dict[str, str]:
     """
-    Get all cached AI assessments for a topic and model combination
-    
+    Get all cached AI assessments for a topic's tests and a model
+
     Returns:
         Dictionary mapping test_id to ai_assessment
     """
     if not FIREBASE_AVAILABLE:
         return {}
-    
+
     try:
-        cache_ref = db.collection("users").document(user_id).collection("assessment_cache")
-        query = cache_ref.where("topic", "==", topic).where("model_id", "==", model_id)
-        
-        cached_assessments = {}
-        docs = query.stream()
-        for doc in docs:
-            data = doc.to_dict()
-            test_id = data.get("test_id")
-            ai_assessment = data.get("ai_assessment")
-            if test_id and ai_assessment:
-                cached_assessments[test_id] = ai_assessment
-        
-        return cached_assessments
+        statements = _test_statements(user_id, topic_id)
+        prompt = _topic_grading_prompt(user_id, topic_id)
+        cleared_at = get_cleared_topics(user_id, model_id).get(topic_id)
+        cached = get_cached_assessments_for_statements(model_id, prompt, statements.values(), cleared_at)
+        return {test_id: cached[statement] for test_id, statement in statements.items() if statement in cached}
     except Exception as e:
         print(f"Error getting cached assessments for topic: {e}")
         return {}
 
-def cache_assessment(user_id: str, topic: str, model_id: str, test_id: str, statement: str, ai_assessment: str) -> bool:
+def cache_assessment(user_id: str, topic_id: str, model_id: str, test_id: str, statement: str, ai_assessment: str) -> bool:
     """
     Cache an AI assessment for future use
-    
+
     Returns:
         True if successfully cached, False otherwise
     """
-    if not FIREBASE_AVAILABLE:
-        return False
-    
-    try:
-        cache_ref = db.collection("users").document(user_id).collection("assessment_cache")
-        
-        # Create a unique document ID based on topic, model, and test
-        doc_id = f"{topic}_{model_id}_{test_id}".replace("/", "_").replace(" ", "_")
-        
-        cache_data = {
-            "user_id": user_id,
-            "topic": topic,
-            "model_id": model_id,
-            "test_id": test_id,
-            "statement": statement,
-            "ai_assessment": ai_assessment,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        
-        cache_ref.document(doc_id).set(cache_data)
-        return True
-    except Exception as e:
-        print(f"Error caching assessment: {e}")
-        return False
+    return cache_multiple_assessments(user_id, topic_id, model_id, [
+        {"test_id": test_id, "statement": statement, "ai_assessment": ai_assessment}
+    ]) == 1
 
-def cache_multiple_assessments(user_id: str, topic: str, model_id: str, assessments: List[Dict]) -> int:
+def cache_multiple_assessments(user_id: str, topic_id: str, model_id: str, assessments: List[Dict]) -> int:
     """
-    Cache multiple AI assessments at once
-    
+    Cache multiple AI assessments of a topic's statements at once
+
     Args:
         assessments: List of dicts with keys: test_id, statement, ai_assessment
-    
+
     Returns:
         Number of successfully cached assessments
     """
     if not FIREBASE_AVAILABLE:
         return 0
-    
-    cached_count = 0
-    for assessment in assessments:
-        test_id = assessment.get("test_id")
-        statement = assessment.get("statement")
-        ai_assessment = assessment.get("ai_assessment")
-        
-        if test_id and statement and ai_assessment:
-            if cache_assessment(user_id, topic, model_id, test_id, statement, ai_assessment):
-                cached_count += 1
-    
-    return cached_count
-
-def clear_cached_assessments_for_topic_model(user_id: str, topic: str, model_id: str) -> bool:
-    """
-    Clear all cached assessments for a specific topic and model combination
-    
+
+    try:
+        prompt = _topic_grading_prompt(user_id, topic_id)
+    except Exception as e:
+        print(f"Error caching assessments: {e}")
+        return 0
+    return cache_statement_assessments(model_id, prompt, {
+        assessment.get("statement"): assessment.get("ai_assessment")
+        for assessment in assessments
+        if assessment.get("statement")
+    }, user_id=user_id, topic_id=topic_id)
+
+def clear_cached_assessments_for_topic_model(user_id: str, topic_id: str, model_id: str) -> bool:
+    """
+    Forget a topic's cached assessments for a model for this user
+
+    The shared entries may be other users' verdicts too, so they are kept (until they
+    expire); the clear is recorded in the user's index and lookups for the topic skip
+    entries written before it, so its statements are graded again.
+
     Returns:
         True if successfully cleared, False otherwise
     """
     if not FIREBASE_AVAILABLE:
         return False
-    
+
     try:
-        cache_ref = db.collection("users").document(user_id).collection("assessment_cache")
-        query = cache_ref.where("topic", "==", topic).where("model_id", "==", model_id)
-        
-        docs = query.stream()
-        for doc in docs:
-            doc.reference.delete()
-        
+        now = datetime.utcnow()
+        _topic_index_ref(user_id, model_id).set({
+            "topic_ids": firestore.ArrayRemove([topic_id]),
+            "cleared_at": {topic_id: now},
+            "updated_at": now
+        }, merge=True)
         return True
     except Exception as e:
         print(f"Error clearing cached assessments: {e}")
         return False
 
-def get_cached_topics_for_model(user_id: str, model_id: str) -> List[str]:
+
+# ----------- Legacy per-user cache -----------
+
+def drop_legacy_cache(user_id: str) -> int:
     """
-    Get list of topics that have cached assessments for a specific model
-    
+    Delete a user's users/{uid}/assessment_cache documents
+
+    They are not migrated: they were all stored under the default model id whichever
+    model graded them, and graded against the topic name rather than its prompt.
+
     Returns:
-        List of topic names
+        Number of deleted documents
     """
-    if not FIREBASE_AVAILABLE:
-        return []
-    
-    try:
-        cache_ref = db.collection("users").document(user_id).collection("assessment_cache")
-        query = cache_ref.where("model_id", "==", model_id)
-        
-        topics = set()
-        docs = query.stream()
-        for doc in docs:
-            data = doc.to_dict()
-            topic = data.get("topic")
-            if topic:
-                topics.add(topic)
-        
-        return list(topics)
-    except Exception as e:
-        print(f"Error getting cached topics for model: {e}")
-        return []
\ No newline at end of file
+    result = bulk_delete_query(db.collection("users").document(user_id).collection(LEGACY_CACHE_COLLECTION))
+    if result.failed:
+        print(f"Legacy assessment cache cleanup for user {user_id} incomplete: {len(result.failed)} documents failed")
+    elif result.written:
+        print(f"Deleted {result.written} legacy cached assessments for user {user_id}")
+    return result.written
+
+
+if __name__ == "__main__":
+    # One-off cleanup of every user's legacy cache: python -m app.services.assessment_cache_service
+    for user_ref in db.collection("users").list_documents():
+        drop_legacy_cache(user_ref.id)
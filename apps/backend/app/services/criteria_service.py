@@ -1,9 +1,11 @@
 # app/services/criteria_service.py
 
 from typing import List, Dict, Any
-from app.core.firebase_client import db as _db
 from datetime import datetime
 from app.core.criteria_config import DEFAULT_CRITERIA_CONFIGS, PERTURBATION_PROMPTS
+from app.services.topic_ids import aresolve_topic, async_topics_ref, require_topic, topics_ref
+from app.utils.request_loader import forget
+from app.utils.async_firestore import get_document
 
 def get_all_default_criteria_configs() -> List[Dict[str, Any]]:
     """Returns all default config names (e.g., AIBAT, Mini-AIBAT) and their criteria with prompts"""
@@ -21,10 +23,21 @@ def get_all_default_criteria_configs() -> List[Dict[str, Any]]:
         })
     return results
 
+def criteria_ref(uid: str, topic_id: str):
+    return topics_ref(uid).document(topic_id).collection("config").document("criteria")
+
+
 def save_user_criteria(uid: str, topic: str, types: List[dict]):
     """
     Save user's selected criteria types for a topic in Firestore.
     """
+    return save_topic_criteria(uid, require_topic(uid, topic)["id"], types)
+
+
+def save_topic_criteria(uid: str, topic_id: str, types: List[dict]):
+    """
+    Save criteria types for the topic with id `topic_id`.
+    """
     # Convert each Pydantic model to dict if it's not already a plain dict
     cleaned_types = [
         t.dict() if hasattr(t, "dict") else t
@@ -36,23 +49,26 @@ def save_user_criteria(uid: str, topic: str, types: List[dict]):
         "updated_at": datetime.utcnow()
     }
 
-    _db.collection("users").document(uid).collection("topics").document(topic).collection("config").document("criteria").set(criteria_data)
+    criteria_ref(uid, topic_id).set(criteria_data)
+    forget([criteria_ref(uid, topic_id)])
     return {"message": "Criteria saved successfully."}
 
 
 
-def get_user_criteria(uid: str, topic: str):
+async def aget_user_criteria(uid: str, topic: str):
     """
     Fetch user's criteria config for a topic.
     """
-    doc_ref = _db.collection("users").document(uid).collection("topics").document(topic).collection("config").document("criteria")
-    doc = doc_ref.get()
+    topic_data = await aresolve_topic(uid, topic)
+    if topic_data is None:
+        return {"types": []}
+
+    doc = await get_document(async_topics_ref(uid).document(topic_data["id"]).collection("config").document("criteria"))
 
     if not doc.exists:
         return {"types": []}
 
-    data = doc.to_dict()
     return {
-        "types": data.get("types", [])
+        "types": doc.to_dict().get("types", [])
     }
 
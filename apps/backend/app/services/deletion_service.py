@@ -0,0 +1,201 @@
+# app/services/deletion_service.py
+
+"""
+Cascading deletes for topics and tests.
+
+Deleting a topic removes its tests, perturbations and config; deleting tests removes
+their perturbations. Cached assessments are shared across users and keyed by content,
+not owned by a topic or test, so they are left in place. Each collection is
+cleared with paginated batched deletes and the collections are cleared concurrently.
+Small deletes finish inline; larger ones run as a background job and return its handle.
+Every step only deletes what is still there, so a repeated or resumed call is safe.
+Deleted tests and perturbations leave tombstones for delta sync (see sync_service);
+a topic's own documents do not, since syncing clients drop the whole topic.
+"""
+
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+from app.core.firebase_client import db
+from app.utils.bulk_write import BulkWriteResult, bulk_delete_query, bulk_write, delete_op
+from app.services.jobs_service import ACTIVE_STATUSES, create_job, get_job, register_runner
+from app.services.topic_ids import resolve_topic, topics_ref
+from app.services.assessment_cache_service import remove_topic_from_indexes
+from app.services.sync_service import record_deletions
+
+DELETE_TOPIC_JOB = "delete_topic"
+DELETE_TESTS_JOB = "delete_tests"
+
+# Topics with more tests and perturbations than this are deleted in the background
+INLINE_TOPIC_DELETE_LIMIT = int(os.getenv("INLINE_TOPIC_DELETE_LIMIT", "1000"))
+
+# Test deletes above this size clean up perturbations in the background
+# (each test can have one perturbation per criteria type)
+INLINE_TEST_DELETE_LIMIT = int(os.getenv("INLINE_TEST_DELETE_LIMIT", "100"))
+
+# Firestore "in" filters accept at most 30 values
+IN_FILTER_LIMIT = 30
+
+
+def _user_ref(uid: str):
+    return db.collection("users").document(uid)
+
+
+def _run_steps(steps: Dict[str, Callable[[], BulkWriteResult]], progress=None) -> Dict[str, BulkWriteResult]:
+    """
+    Run delete steps concurrently; with a job's progress, steps finished by an earlier run
+    are skipped and each fully successful step is checkpointed
+    """
+    pending = {name: step for name, step in steps.items() if progress is None or not progress.is_done(name)}
+    results = {}
+    if not pending:
+        return results
+
+    with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="cascade-delete") as executor:
+        futures = {name: executor.submit(step) for name, step in pending.items()}
+        for name, future in futures.items():
+            results[name] = future.result()
+            # Steps with failures stay pending so a re-run retries them
+            if progress is not None and not results[name].failed:
+                progress.checkpoint([name])
+    return results
+
+
+def _merge(results: Dict[str, BulkWriteResult]) -> BulkWriteResult:
+    merged = BulkWriteResult()
+    for result in results.values():
+        merged.merge(result)
+    return merged
+
+
+def _count(query) -> int:
+    return query.count().get()[0][0].value
+
+
+# ----------- Topics -----------
+
+def _topic_steps(uid: str, topic_id: str) -> Dict[str, Callable[[], BulkWriteResult]]:
+    user_ref = _user_ref(uid)
+    return {
+        "tests": lambda: bulk_delete_query(user_ref.collection("tests").where("topic_id", "==", topic_id)),
+        "perturbations": lambda: bulk_delete_query(user_ref.collection("perturbations").where("topic_id", "==", topic_id)),
+        "config": lambda: bulk_delete_query(topics_ref(uid).document(topic_id).collection("config")),
+        "assessment_cache_index": lambda: remove_topic_from_indexes(uid, topic_id),
+    }
+
+
+def _delete_topic_data(uid: str, topic_id: str, progress=None) -> BulkWriteResult:
+    """Delete a topic's documents, then the topic itself once nothing failed"""
+    result = _merge(_run_steps(_topic_steps(uid, topic_id), progress))
+    if not result.failed:
+        topics_ref(uid).document(topic_id).delete()
+    return result
+
+
+def _run_delete_topic_job(uid: str, params: dict, progress):
+    steps = _topic_steps(uid, params["topic_id"])
+    progress.set_total(len(steps))
+    result = _delete_topic_data(uid, params["topic_id"], progress)
+    if result.failed:
+        raise Exception(f"{len(result.failed)} documents could not be deleted")
+
+
+register_runner(DELETE_TOPIC_JOB, _run_delete_topic_job)
+
+
+def delete_topic(uid: str, topic: str) -> dict:
+    """
+    Delete a topic with its tests, perturbations and config
+
+    The topic is hidden from listings right away. Large topics are deleted by a background
+    job whose id is returned; calling again while it runs returns the same job.
+    """
+    topic_data = resolve_topic(uid, topic, include_deleting=True)
+    if topic_data is None:
+        return {"message": f"Topic '{topic}' not found"}
+
+    topic_id = topic_data["id"]
+    topic_ref = topics_ref(uid).document(topic_id)
+
+    if topic_data.get("delete_job_id"):
+        job = get_job(uid, topic_data["delete_job_id"], DELETE_TOPIC_JOB)
+        if job and job["status"] in ACTIVE_STATUSES:
+            return {"message": f"Topic '{topic}' is already being deleted", "job_id": job["job_id"], "status": job["status"]}
+
+    topic_ref.update({"deleting": True, "updated_at": datetime.utcnow()})
+
+    user_ref = _user_ref(uid)
+    size = _count(user_ref.collection("tests").where("topic_id", "==", topic_id)) + \
+        _count(user_ref.collection("perturbations").where("topic_id", "==", topic_id))
+
+    if size > INLINE_TOPIC_DELETE_LIMIT:
+        job = create_job(uid, DELETE_TOPIC_JOB, {"topic": topic, "topic_id": topic_id})
+        try:
+            topic_ref.update({"delete_job_id": job["job_id"]})
+        except Exception:
+            # The job already finished and removed the topic
+            pass
+        return {"message": f"Deleting topic '{topic}' and {size} documents in the background", **job}
+
+    result = _delete_topic_data(uid, topic_id)
+    if result.failed:
+        return {"message": f"Topic not deleted: {len(result.failed)} associated documents could not be deleted, please retry", "failed_ids": result.failed_ids}
+    return {"message": "Topic and associated data deleted successfully!"}
+
+
+# ----------- Tests -----------
+
+def _test_related_steps(uid: str, test_ids: List[str]) -> Dict[str, Callable[[], BulkWriteResult]]:
+    user_ref = _user_ref(uid)
+    chunks = [test_ids[i:i + IN_FILTER_LIMIT] for i in range(0, len(test_ids), IN_FILTER_LIMIT)]
+
+    def delete_referencing(collection: str, field: str) -> BulkWriteResult:
+        result = BulkWriteResult()
+        for chunk in chunks:
+            result.merge(bulk_delete_query(
+                user_ref.collection(collection).where(field, "in", chunk),
+                on_deleted=lambda doc_ids: record_deletions(uid, collection, doc_ids)
+            ))
+        return result
+
+    return {
+        "perturbations": lambda: delete_referencing("perturbations", "original_id"),
+    }
+
+
+def _run_delete_tests_job(uid: str, params: dict, progress):
+    steps = _test_related_steps(uid, params["test_ids"])
+    progress.set_total(len(steps))
+    result = _merge(_run_steps(steps, progress))
+    if result.failed:
+        raise Exception(f"{len(result.failed)} documents could not be deleted")
+
+
+register_runner(DELETE_TESTS_JOB, _run_delete_tests_job)
+
+
+def delete_tests(uid: str, test_ids: List[str]) -> dict:
+    """
+    Delete tests with their perturbations
+
+    The tests themselves are deleted right away; for large requests their perturbations
+    are cleaned up by a background job whose id is returned.
+    """
+    test_ids = list(dict.fromkeys(test_ids))
+    tests_ref = _user_ref(uid).collection("tests")
+    result = bulk_write(delete_op(tests_ref.document(test_id)) for test_id in test_ids)
+    failed_ids = set(result.failed_ids)
+    record_deletions(uid, "tests", (test_id for test_id in test_ids if test_id not in failed_ids))
+    response = {"deleted_count": result.written, "failed_ids": result.failed_ids}
+
+    if len(test_ids) > INLINE_TEST_DELETE_LIMIT:
+        job = create_job(uid, DELETE_TESTS_JOB, {"test_ids": test_ids})
+        return {**response, **job}
+
+    related = _merge(_run_steps(_test_related_steps(uid, test_ids)))
+    response["related_deleted_count"] = related.written
+    if related.failed:
+        response["failed_ids"] = response["failed_ids"] + related.failed_ids
+    return response
+
@@ -0,0 +1,170 @@
+# app/services/grading_service.py
+
+from datetime import datetime
+from typing import Dict, Iterator, List
+from app.core.firebase_client import db
+from app.utils.model_selector import get_model_selection
+from app.services.assessment_cache_service import (
+    cache_statement_assessments, get_cached_assessments_for_statements, get_cleared_topics, update_topic_index
+)
+from app.utils.bulk_write import bulk_write, update_op
+from app.utils.request_loader import load_documents
+from app.services.topic_ids import ensure_topic_ids, get_topics_by_id, topic_id_of, topic_prompt
+
+
+def _get_topic_prompts(user_id: str, topic_ids: List[str]) -> Dict[str, str]:
+    """Grading prompt per topic id"""
+    topics = get_topics_by_id(user_id, topic_ids)
+    return {topic_id: topic_prompt(topics.get(topic_id, {}), topic_id) for topic_id in topic_ids}
+
+
+def _grade_topic(pipeline, statements: List[str], topic_prompt: str) -> List[str]:
+    """Grade a topic's statements with batch_grade, falling back per item for gaps"""
+    try:
+        # The pipeline packs statements into requests sized for the model's token budget
+        labels = list(pipeline.batch_grade(statements, topic_prompt))
+    except Exception as e:
+        print(f"Batch grading failed: {e}, falling back to individual calls")
+        labels = ["unknown"] * len(statements)
+
+    # Only statements the batch responses failed to return are graded one by one
+    for i, label in enumerate(labels):
+        if label not in ["acceptable", "unacceptable"]:
+            try:
+                labels[i] = pipeline.grade(statements[i], topic_prompt)
+            except Exception as e:
+                print(f"Error grading statement {i + 1}: {e}")
+
+    return labels
+
+
+def iter_grade_tests(user_id: str, test_ids: List[str]) -> Iterator[dict]:
+    """
+    Grade tests with the user's model, yielding results as each batch is stored
+
+    Tests are fetched in one round-trip and grouped by topic. Cached verdicts for the
+    same statement, prompt and model are stored and yielded first; the rest are graded
+    with the topic's prompt through batch_grade, one planned batch at a time.
+
+    Yields:
+        {"type": "results", "cached": bool, "results": [...]} per stored batch, then
+        {"type": "summary", "graded_count", "cache_hits", "cache_misses"}
+    """
+    test_ids = list(dict.fromkeys(test_ids))
+    if not test_ids:
+        yield {"type": "summary", "graded_count": 0, "cache_hits": 0, "cache_misses": 0}
+        return
+
+    ensure_topic_ids(user_id)
+    model_id, pipeline = get_model_selection(user_id)
+    ref = db.collection("users").document(user_id).collection("tests")
+
+    tests = {}
+    for doc in load_documents(ref.document(tid) for tid in test_ids):
+        if doc.exists:
+            tests[doc.id] = doc.to_dict()
+
+    by_topic = {}
+    for tid in test_ids:
+        if tid in tests:
+            by_topic.setdefault(topic_id_of(tests[tid]), []).append(tid)
+
+    topic_prompts = _get_topic_prompts(user_id, list(by_topic))
+    graded_at = datetime.utcnow()
+    counts = {"graded_count": 0, "cache_hits": 0}
+
+    def store(labels: Dict[str, str]) -> List[dict]:
+        """Commit labels for a set of tests and return the assessments that were stored"""
+        result = bulk_write(
+            update_op(ref.document(tid), {
+                "label": label,
+                "validity": "approved" if label == tests[tid].get("ground_truth") else "denied",
+                "graded_at": graded_at,
+                "updated_at": graded_at
+            })
+            for tid, label in labels.items()
+        )
+        failed_ids = set(result.failed_ids)
+        assessments = [
+            {"test_id": tid, "statement": tests[tid].get("title"), "ai_assessment": label}
+            for tid, label in labels.items()
+            if tid not in failed_ids
+        ]
+        counts["graded_count"] += len(assessments)
+        return assessments
+
+    cleared = get_cleared_topics(user_id, model_id)
+    pending = []
+    for topic, topic_test_ids in by_topic.items():
+        cached = get_cached_assessments_for_statements(
+            model_id, topic_prompts[topic], (tests[tid].get("title") for tid in topic_test_ids), cleared.get(topic)
+        )
+
+        hits = {}
+        misses = []
+        for tid in topic_test_ids:
+            if cached.get(tests[tid].get("title")) in ["acceptable", "unacceptable"]:
+                hits[tid] = cached[tests[tid].get("title")]
+            else:
+                misses.append(tid)
+
+        if hits:
+            counts["cache_hits"] += len(hits)
+            # Entries may have been cached by another user, so the topic may be new to this user's index
+            update_topic_index(user_id, model_id, topic, cached=True)
+            yield {"type": "results", "cached": True, "results": store(hits)}
+        if misses:
+            pending.append((topic, misses))
+
+    for topic, misses in pending:
+        print(f"Grading {len(misses)} tests for topic '{topic}'")
+        statements = [tests[tid].get("title") for tid in misses]
+        prompt = topic_prompts[topic]
+
+        if hasattr(pipeline, "plan_batches"):
+            batches = pipeline.plan_batches("batch_grade", statements)
+        else:
+            batches = [list(range(len(statements)))]
+
+        for batch in batches:
+            batch_ids = [misses[i] for i in batch]
+            labels = dict(zip(batch_ids, _grade_topic(pipeline, [statements[i] for i in batch], prompt)))
+
+            cache_statement_assessments(
+                model_id, prompt, {tests[tid].get("title"): label for tid, label in labels.items()},
+                user_id=user_id, topic_id=topic
+            )
+            yield {"type": "results", "cached": False, "results": store(labels)}
+
+    yield {
+        "type": "summary",
+        "graded_count": counts["graded_count"],
+        "cache_hits": counts["cache_hits"],
+        "cache_misses": counts["graded_count"] - counts["cache_hits"]
+    }
+
+
+def grade_tests(user_id: str, test_ids: List[str]) -> dict:
+    """
+    Grade tests with the user's model
+
+    Collects the batches of iter_grade_tests into one response, with results in the
+    order of `test_ids`.
+    """
+    results = []
+    summary = {}
+    for event in iter_grade_tests(user_id, test_ids):
+        if event["type"] == "results":
+            results.extend(event["results"])
+        else:
+            summary = event
+
+    order = {tid: i for i, tid in enumerate(dict.fromkeys(test_ids))}
+    results.sort(key=lambda assessment: order[assessment["test_id"]])
+
+    return {
+        "graded_count": summary.get("graded_count", 0),
+        "cache_hits": summary.get("cache_hits", 0),
+        "cache_misses": summary.get("cache_misses", 0),
+        "results": results
+    }
@@ -0,0 +1,286 @@
+# app/services/jobs_service.py
+
+"""
+Background jobs stored under users/{uid}/jobs/{job_id}.
+
+A job is created with status "queued" and runs on this instance's worker pool. Runners
+checkpoint completed and failed task ids after every batch, and a heartbeat marks the
+job as alive. A job whose heartbeat stops (crashed or redeployed instance) is claimed by
+the next instance that starts up or that is asked for its status, and its runner skips
+the tasks already completed. Failed tasks are retried, in the same run or a resumed one,
+until they have failed JOB_TASK_MAX_ATTEMPTS times.
+"""
+
+import os
+import time
+import threading
+from uuid import uuid4
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from firebase_admin import firestore
+
+try:
+    from app.core.firebase_client import db
+except (ImportError, KeyError, Exception):
+    # Firebase credentials not configured (e.g. unit tests)
+    db = None
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+# A job's owner refreshes its heartbeat this often; jobs silent for JOB_STALE_SECONDS are resumed elsewhere
+JOB_HEARTBEAT_SECONDS = 30
+JOB_STALE_SECONDS = 120
+
+# Attempts a failing task gets across all runs of its job
+JOB_TASK_MAX_ATTEMPTS = int(os.getenv("JOB_TASK_MAX_ATTEMPTS", "3"))
+
+INSTANCE_ID = uuid4().hex
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("JOB_WORKERS", "2")), thread_name_prefix="job")
+
+# job type -> runner(uid, params, progress)
+_runners: Dict[str, Callable] = {}
+
+
+class JobProgress:
+    """Checkpoint handle passed to job runners"""
+
+    def __init__(self, ref, job: dict):
+        self.ref = ref
+        self.completed = set(job.get("completed_task_ids", []))
+        self.failed = set(job.get("failed_task_ids", []))
+        self.attempts = dict(job.get("failed_attempts", {}))  # task id -> failed attempts so far
+
+    def is_done(self, task_id: str) -> bool:
+        """True if the task was completed in an earlier batch or run"""
+        return task_id in self.completed
+
+    def can_retry(self, task_id: str) -> bool:
+        """True if the task is not completed and has attempts left"""
+        return not self.is_done(task_id) and self.attempts.get(task_id, 0) < JOB_TASK_MAX_ATTEMPTS
+
+    def set_total(self, total_tasks: int):
+        self.ref.update({"total_tasks": total_tasks, "updated_at": datetime.utcnow()})
+
+    def checkpoint(self, completed_ids: Iterable[str], failed_ids: Iterable[str] = ()):
+        """Record one finished batch so a resumed run does not repeat it"""
+        completed_ids, failed_ids = list(completed_ids), list(failed_ids)
+        retried_ids = [task_id for task_id in completed_ids if task_id in self.failed]
+        self.completed.update(completed_ids)
+        self.failed.difference_update(retried_ids)
+        self.failed.update(failed_ids)
+        for task_id in failed_ids:
+            self.attempts[task_id] = self.attempts.get(task_id, 0) + 1
+
+        update = {"updated_at": datetime.utcnow(), "heartbeat_at": time.time()}
+        if completed_ids:
+            update["completed_task_ids"] = firestore.ArrayUnion(completed_ids)
+        if failed_ids:
+            update["failed_task_ids"] = firestore.ArrayUnion(failed_ids)
+            # Only the owning runner writes the job, so the whole map can be replaced
+            update["failed_attempts"] = self.attempts
+        self.ref.update(update)
+        if retried_ids:
+            # A separate write: one update cannot both add to and remove from the array
+            self.ref.update({"failed_task_ids": firestore.ArrayRemove(retried_ids)})
+
+
+def run_tasks(progress: JobProgress, tasks: list, task_id: Callable[[object], str],
+              process: Callable[[list], Iterator[Tuple[List[str], List[str]]]]):
+    """
+    Run a job's tasks until each one is completed or out of attempts
+
+    `process(tasks)` yields (completed_ids, failed_ids) for every finished batch. Each batch
+    is checkpointed, and failed tasks are processed again while they have attempts left.
+    """
+    while True:
+        remaining = [task for task in tasks if progress.can_retry(task_id(task))]
+        if not remaining:
+            return
+        failed_count = 0
+        for completed_ids, failed_ids in process(remaining):
+            progress.checkpoint(completed_ids, failed_ids)
+            failed_count += len(failed_ids)
+        if not failed_count:
+            return
+        print(f"{failed_count} job tasks failed, retrying those with attempts left")
+
+
+def register_runner(job_type: str, runner: Callable):
+    _runners[job_type] = runner
+
+
+def _jobs_ref(uid: str):
+    return db.collection("users").document(uid).collection("jobs")
+
+
+def _is_stale(job: dict, now: float) -> bool:
+    return now - job.get("heartbeat_at", 0) > JOB_STALE_SECONDS
+
+
+def _claim(ref) -> Optional[dict]:
+    """Take ownership of a job if it is queued for this instance or abandoned by another"""
+
+    @firestore.transactional
+    def claim_in_transaction(transaction):
+        snapshot = ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None
+        job = snapshot.to_dict()
+        now = time.time()
+        if job.get("status") not in ACTIVE_STATUSES:
+            return None
+        owned = job.get("owner") == INSTANCE_ID and job.get("status") == "queued"
+        if not owned and not _is_stale(job, now):
+            return None
+
+        resumed = job.get("status") == "running" or job.get("owner") != INSTANCE_ID
+        update = {
+            "status": "running",
+            "owner": INSTANCE_ID,
+            "heartbeat_at": now,
+            "run_started_at": now,
+            "run_start_count": len(job.get("completed_task_ids", [])) + len(job.get("failed_task_ids", [])),
+            "updated_at": datetime.utcnow(),
+        }
+        if resumed:
+            update["resume_count"] = job.get("resume_count", 0) + 1
+        transaction.update(ref, update)
+        job.update(update)
+        return job
+
+    return claim_in_transaction(db.transaction())
+
+
+def _heartbeat(ref, stop: threading.Event):
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            ref.update({"heartbeat_at": time.time()})
+        except Exception as e:
+            print(f"Error updating job heartbeat: {e}")
+
+
+def _run(uid: str, job_id: str):
+    ref = _jobs_ref(uid).document(job_id)
+    try:
+        job = _claim(ref)
+    except Exception as e:
+        print(f"Error claiming job {job_id}: {e}")
+        return
+    if job is None:
+        return
+
+    runner = _runners.get(job["type"])
+    if runner is None:
+        ref.update({"status": "failed", "error": f"Unknown job type: {job['type']}", "finished_at": datetime.utcnow()})
+        return
+
+    print(f"Running {job['type']} job {job_id} for user {uid}")
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(ref, stop), daemon=True).start()
+    try:
+        runner(uid, job.get("params", {}), JobProgress(ref, job))
+        ref.update({"status": "completed", "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()})
+        print(f"Job {job_id} completed")
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        ref.update({"status": "failed", "error": str(e), "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()})
+    finally:
+        stop.set()
+
+
+def create_job(uid: str, job_type: str, params: dict) -> dict:
+    """Store a queued job and start it on this instance's worker pool"""
+    ref = _jobs_ref(uid).document()
+    job = {
+        "type": job_type,
+        "status": "queued",
+        "params": params,
+        "owner": INSTANCE_ID,
+        "total_tasks": None,
+        "completed_task_ids": [],
+        "failed_task_ids": [],
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+        "heartbeat_at": time.time(),
+    }
+    ref.set(job)
+    _executor.submit(_run, uid, ref.id)
+    return {"job_id": ref.id, "status": "queued"}
+
+
+def _job_status(job_id: str, job: dict) -> dict:
+    completed = len(job.get("completed_task_ids", []))
+    failed = len(job.get("failed_task_ids", []))
+    total = job.get("total_tasks")
+    remaining = max(0, total - completed - failed) if total is not None else None
+
+    eta_seconds = None
+    if job.get("status") == "running" and remaining is not None and job.get("run_started_at"):
+        processed = completed + failed - job.get("run_start_count", 0)
+        elapsed = time.time() - job["run_started_at"]
+        if processed > 0:
+            eta_seconds = round(remaining * elapsed / processed, 1)
+    elif job.get("status") == "completed":
+        eta_seconds = 0.0
+
+    return {
+        "job_id": job_id,
+        "type": job.get("type"),
+        "status": job.get("status"),
+        "params": job.get("params", {}),
+        "total_tasks": total,
+        "completed_tasks": completed,
+        "failed_tasks": failed,
+        "remaining_tasks": remaining,
+        "eta_seconds": eta_seconds,
+        "resume_count": job.get("resume_count", 0),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+
+def get_job(uid: str, job_id: str, job_type: Optional[str] = None) -> Optional[dict]:
+    """Report job progress; an abandoned job is resumed on this instance"""
+    snapshot = _jobs_ref(uid).document(job_id).get()
+    if not snapshot.exists:
+        return None
+    job = snapshot.to_dict()
+    if job_type and job.get("type") != job_type:
+        return None
+
+    if job.get("status") in ACTIVE_STATUSES and _is_stale(job, time.time()):
+        print(f"Job {job_id} has no live owner, resuming it here")
+        _executor.submit(_run, uid, job_id)
+
+    return _job_status(job_id, job)
+
+
+def get_job_task_ids(uid: str, job_id: str) -> Optional[list]:
+    """Ids of the tasks a job completed so far"""
+    snapshot = _jobs_ref(uid).document(job_id).get()
+    if not snapshot.exists:
+        return None
+    return snapshot.to_dict().get("completed_task_ids", [])
+
+
+def resume_stale_jobs() -> int:
+    """Submit every unfinished job whose owner stopped sending heartbeats; returns how many"""
+    now = time.time()
+    resumed = 0
+    try:
+        for doc in db.collection_group("jobs").where("status", "in", ACTIVE_STATUSES).stream():
+            job = doc.to_dict()
+            if not _is_stale(job, now):
+                continue
+            uid = doc.reference.parent.parent.id
+            _executor.submit(_run, uid, doc.id)
+            resumed += 1
+    except Exception as e:
+        print(f"Error scanning for unfinished jobs: {e}")
+    if resumed:
+        print(f"Resuming {resumed} unfinished jobs")
+    return resumed
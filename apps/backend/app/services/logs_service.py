@@ -5,6 +5,7 @@ import csv
 from datetime import datetime
 from uuid import uuid4
 from app.core.firebase_client import db as _db
+from app.utils.bulk_write import bulk_delete_query
 
 
 def log_action(uid: str, body):
@@ -48,14 +49,12 @@ def save_log(uid: str, name: str):
         writer.writerows(perts)
 
     # Clear logs after export
-    for doc in logs_ref.stream():
-        doc.reference.delete()
+    bulk_delete_query(logs_ref)
 
     return {"message": "Data saved to CSV successfully!"}
 
 
 def clear_logs(uid: str):
     logs_ref = _db.collection("users").document(uid).collection("logs")
-    for doc in logs_ref.stream():
-        doc.reference.delete()
+    bulk_delete_query(logs_ref)
     return {"message": "All logs cleared!"}
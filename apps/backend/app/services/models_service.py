@@ -1,35 +1,52 @@
 # app/services/models_service.py
 
 from fastapi import HTTPException
-from app.core.firebase_client import db
 from app.core.model_registry import (
     MODEL_METADATA,
     MODEL_REGISTRY,
     get_model_metadata_by_id,
     get_default_model_metadata
 )
-from app.core.model_config import DEFAULT_MODEL_ID
+from app.utils.model_selector import aget_selected_model_id, get_model_pipeline, set_selected_model_id
+from app.pipelines.response_cache import response_cache
+from app.services import assessment_cache_service
+from app.core.firebase_auth import get_token_cache_stats
 
 def get_available_models():
     return MODEL_METADATA
 
-def get_current_model(uid: str):
-    user_config_ref = db.collection("users").document(uid).collection("config").document("model")
-    doc = user_config_ref.get()
-
-    if doc.exists:
-        model_id = doc.to_dict().get("id", DEFAULT_MODEL_ID)
-    else:
-        model_id = DEFAULT_MODEL_ID
-
+async def aget_current_model(uid: str):
+    # Shares the cached selection the pipelines resolve from
+    model_id = await aget_selected_model_id(uid)
     return get_model_metadata_by_id(model_id) or get_default_model_metadata()
 
 def select_model(uid: str, model_id: str):
     if model_id not in MODEL_REGISTRY:
         raise HTTPException(status_code=400, detail="Invalid model ID")
 
-    db.collection("users").document(uid).collection("config").document("model").set({
-        "id": model_id
-    })
+    set_selected_model_id(uid, model_id)
 
     return {"message": f"Model '{model_id}' selected."}
+
+def get_rate_limit_status(uid: str, include_shared: bool = False):
+    """
+    Report the wait estimate for the user's model
+
+    The budget is shared by every user of the model, so the remaining requests/tokens and
+    batch sizing are only included with `include_shared` (admins).
+    """
+    pipeline = get_model_pipeline(uid)
+    if not hasattr(pipeline, "rate_limit_status"):
+        return {"wait_estimate_seconds": 0.0}
+    status = pipeline.rate_limit_status()
+    if include_shared:
+        return status
+    return {"model": status["model"], "wait_estimate_seconds": status["wait_estimate_seconds"]}
+
+def get_cache_stats():
+    """Hit/miss counters and size of the shared LLM response cache, the assessment cache tiers and the token cache"""
+    return {
+        **response_cache.stats(),
+        "assessment_cache": assessment_cache_service.get_cache_stats(),
+        "token_cache": get_token_cache_stats(),
+    }
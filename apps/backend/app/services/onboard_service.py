@@ -6,12 +6,13 @@ from datetime import datetime
 from app.utils.model_selector import get_model_pipeline
 from app.core.topic_config import DEFAULT_TOPICS
 from app.core.firebase_client import db as _db
+from app.utils.request_loader import forget, load_document
 from app.services.topics_service import add_topic
 from app.models.schemas import AddTopicInput, TopicTestInput
 from uuid import uuid4
 
 def ensure_user_onboarded(uid: str):
-    user_doc = _db.collection("users").document(uid).get()
+    user_doc = load_document(_db.collection("users").document(uid))
     user_data = user_doc.to_dict() if user_doc.exists else {}
 
     if user_data.get("onboardingComplete"):
@@ -25,6 +26,7 @@ def ensure_user_onboarded(uid: str):
         "onboardingComplete": True,
         "onboarded_at": datetime.utcnow()
     }, merge=True)
+    forget([_db.collection("users").document(uid)])
 
     return {"message": "User onboarded"}
 
@@ -1,12 +1,20 @@
 # apps/backend/app/services/perturbations_service.py
 import time
+import asyncio
+from typing import List, Optional
 from uuid import uuid4
 from datetime import datetime
 from app.utils.logs import log_test
 from app.core.firebase_client import db
 from app.utils.model_selector import get_model_pipeline
-from app.services.tests_service import get_tests_by_topic
-from app.services.criteria_service import save_user_criteria
+from app.services.criteria_service import criteria_ref, save_topic_criteria
+from app.services.topic_ids import aresolve_topic, get_topics_by_id, require_topic, topic_id_of
+from app.utils.staged_pipeline import run_staged
+from app.utils.bulk_write import bulk_write, set_op
+from app.utils.request_loader import load_document, load_documents
+from app.utils.pagination import acount_query, afetch_page, aiter_query
+from app.utils import async_firestore
+from app.services.jobs_service import register_runner, create_job, get_job, get_job_task_ids, run_tasks
 from app.core.criteria_config import (
     DEFAULT_CRITERIA_CONFIGS,
     get_criteria_prompt,
@@ -20,226 +28,426 @@ def log_action(user_id: str, action: str, data: dict):
     }
     log_test(user_id, log_entry)
 
-def generate_perturbations(uid: str, topic: str, test_ids: list, batch_size: int = 10):
-    try:
-        topic_data = get_tests_by_topic(uid, topic)
-        test_lookup = {test["id"]: test for test in topic_data["tests"]}
-
-        user_criteria_doc = (
-            db.collection("users")
-            .document(uid)
-            .collection("topics")
-            .document(topic)
-            .collection("config")
-            .document("criteria")
-            .get()
-        )
+PERTURBATION_JOB = "generate_perturbations"
 
-        if user_criteria_doc.exists:
-            criteria_data = user_criteria_doc.to_dict()
-            criteria_types = criteria_data.get("types", [])
-        else:
-            print(f"No user criteria found for topic '{topic}', using AIBAT fallback")
-
-            # Build default AIBAT criteria config
-            criteria_types = [
-                {
-                    "name": name,
-                    "prompt": get_criteria_prompt(name, for_generation=False),
-                    "isDefault": True
-                }
-                for name in DEFAULT_CRITERIA_CONFIGS.get("AIBAT", [])
-            ]
-
-            # Save it to Firestore so it's stored for future use
-            save_user_criteria(uid, topic, criteria_types)
-
-        pipeline = get_model_pipeline(uid)
-        results = []
-
-        # Filter tests to only include those where AI and user assessments match
-        matching_tests = []
-        for test_id in test_ids:
-            if test_id not in test_lookup:
-                print(f"Test ID {test_id} not found, skipping")
-                continue
-                
-            test = test_lookup[test_id]
-            ai_assessment = test.get("label", "ungraded")  # AI assessment
-            user_assessment = test.get("ground_truth", "ungraded")  # User assessment
+# Test fields read when preparing perturbation tasks ("topic" for unmigrated tests)
+PERTURBATION_TEST_FIELDS = ["title", "label", "ground_truth", "topic_id", "topic"]
+
+def _perturb_batch(pipeline, pert_prompts: list) -> list:
+    """Perturbation stage: perturbed texts for one batch of prompts (None for failures)"""
+    # Use batch processing for perturbations if available
+    if hasattr(pipeline, 'batch_perturb'):
+        print(f"Using batch perturbation for {len(pert_prompts)} items")
+        try:
+            perturbed_texts = pipeline.batch_perturb(pert_prompts)
+            print(f"Batch perturbation completed, got {len(perturbed_texts)} results ({len(getattr(perturbed_texts, 'retried', []))} re-requested)")
+            # Items still missing after the follow-up batches get one individual attempt instead of being dropped
+            for j, perturbed_text in enumerate(perturbed_texts):
+                if perturbed_text is None:
+                    try:
+                        perturbed_texts[j] = pipeline.custom_perturb(pert_prompts[j])
+                    except Exception as e:
+                        print(f"Error in perturbation {j+1}: {e}")
+        except Exception as e:
+            print(f"Batch perturbation failed: {e}, falling back to individual calls")
+            # Fallback to individual calls
+            perturbed_texts = []
+            for j, prompt in enumerate(pert_prompts):
+                try:
+                    perturbed_text = pipeline.custom_perturb(prompt)
+                    perturbed_texts.append(perturbed_text)
+                except Exception as e:
+                    print(f"Error in perturbation {j+1}: {e}")
+                    perturbed_texts.append(None)
+    else:
+        # Fallback for pipelines without batch support
+        print("Pipeline doesn't support batch perturbation, using individual calls")
+        perturbed_texts = []
+        for j, prompt in enumerate(pert_prompts):
+            try:
+                perturbed_text = pipeline.custom_perturb(prompt)
+                perturbed_texts.append(perturbed_text)
+            except Exception as e:
+                print(f"Error in perturbation {j+1}: {e}")
+                perturbed_texts.append(None)
+
+    return perturbed_texts
+
+
+def _grade_batch(pipeline, perturbed_texts: list, topic: str) -> list:
+    """Grading stage: labels for one batch of perturbed texts ("unknown" for failures)"""
+    # Filter out None values for grading
+    valid_texts = [text for text in perturbed_texts if text is not None]
+    
+    # Use batch processing for grading if available
+    if valid_texts and hasattr(pipeline, 'batch_grade'):
+        print(f"Using batch grading for {len(valid_texts)} valid perturbations")
+        try:
+            batch_grades = pipeline.batch_grade(valid_texts, topic)
+            print(f"Batch grading completed, got {len(batch_grades)} results")
             
-            # Convert AI assessment format (acceptable/unacceptable) to match user format if needed
-            # Both should be in acceptable/unacceptable format
-            if ai_assessment in ["acceptable", "unacceptable"] and user_assessment in ["acceptable", "unacceptable"]:
-                if ai_assessment == user_assessment:
-                    matching_tests.append(test)
-                    print(f"Including test '{test['title'][:50]}...' - AI: {ai_assessment}, User: {user_assessment}")
+            # Map batch grades back to the full list (including None values)
+            graded_labels = []
+            valid_index = 0
+            for perturbed_text in perturbed_texts:
+                if perturbed_text is None:
+                    graded_labels.append("unknown")
+                else:
+                    if valid_index < len(batch_grades):
+                        graded_labels.append(batch_grades[valid_index])
+                    else:
+                        graded_labels.append("unknown")
+                    valid_index += 1
+                    
+        except Exception as e:
+            print(f"Batch grading failed: {e}, falling back to individual calls")
+            # Fallback to individual grading
+            graded_labels = []
+            for j, perturbed_text in enumerate(perturbed_texts):
+                if perturbed_text is None:
+                    graded_labels.append("unknown")
                 else:
-                    print(f"Skipping test '{test['title'][:50]}...' - AI: {ai_assessment}, User: {user_assessment} (mismatch)")
+                    try:
+                        label_result = pipeline.grade(perturbed_text, topic)
+                        graded_labels.append(label_result)
+                    except Exception as e:
+                        print(f"Error in grading {j+1}: {e}")
+                        graded_labels.append("unknown")
+    else:
+        # Fallback for pipelines without batch support or no valid texts
+        print("Using individual grading calls")
+        graded_labels = []
+        for j, perturbed_text in enumerate(perturbed_texts):
+            if perturbed_text is None:
+                graded_labels.append("unknown")
             else:
-                print(f"Skipping test '{test['title'][:50]}...' - AI: {ai_assessment}, User: {user_assessment} (ungraded)")
+                try:
+                    label_result = pipeline.grade(perturbed_text, topic)
+                    graded_labels.append(label_result)
+                except Exception as e:
+                    print(f"Error in grading {j+1}: {e}")
+                    graded_labels.append("unknown")
 
-        print(f"Filtered {len(matching_tests)} matching tests out of {len(test_ids)} requested tests")
+    return graded_labels
 
-        # Create task list only for matching tests
-        task_list = [
-            (test, criteria)
-            for test in matching_tests
-            for criteria in criteria_types
-        ]
 
-        if not task_list:
-            print("No matching tests found for perturbation generation")
-            return {"message": "No perturbations generated - no tests with matching AI and user assessments", "perturbations": []}
+def _build_perturbation(test: dict, criteria: dict, perturbed_text: str, label_result: str, topic_id: str) -> dict:
+    name = criteria["name"]
+    ai_assessment = "pass" if label_result == "acceptable" else "fail"
 
-        print(f"Processing {len(task_list)} perturbation tasks across {len(matching_tests)} tests and {len(criteria_types)} criteria types")
+    user_assessment = test.get("ground_truth", "ungraded")
+    expected_gt = user_assessment
 
-        for i in range(0, len(task_list), batch_size):
-            batch = task_list[i:i + batch_size]
-            print(f"Processing batch {i//batch_size + 1}/{(len(task_list) + batch_size - 1)//batch_size} with {len(batch)} items")
+    if expected_gt != "ungraded" and should_flip_label(name):
+        expected_gt = "unacceptable" if expected_gt == "acceptable" else "acceptable"
 
-            pert_prompts = [f"{criteria['prompt']}: {test['title']}" for test, criteria in batch]
-            print(f"Generated {len(pert_prompts)} perturbation prompts")
-            
-            # Use batch processing for perturbations if available
-            if hasattr(pipeline, 'batch_perturb'):
-                print(f"Using batch perturbation for {len(pert_prompts)} items")
-                try:
-                    perturbed_texts = pipeline.batch_perturb(pert_prompts)
-                    print(f"Batch perturbation completed, got {len(perturbed_texts)} results")
-                except Exception as e:
-                    print(f"Batch perturbation failed: {e}, falling back to individual calls")
-                    # Fallback to individual calls
-                    perturbed_texts = []
-                    for j, prompt in enumerate(pert_prompts):
-                        try:
-                            perturbed_text = pipeline.custom_perturb(prompt)
-                            perturbed_texts.append(perturbed_text)
-                        except Exception as e:
-                            print(f"Error in perturbation {j+1}: {e}")
-                            perturbed_texts.append(None)
-            else:
-                # Fallback for pipelines without batch support
-                print("Pipeline doesn't support batch perturbation, using individual calls")
-                perturbed_texts = []
-                for j, prompt in enumerate(pert_prompts):
-                    try:
-                        perturbed_text = pipeline.custom_perturb(prompt)
-                        perturbed_texts.append(perturbed_text)
-                    except Exception as e:
-                        print(f"Error in perturbation {j+1}: {e}")
-                        perturbed_texts.append(None)
-            
-            # Filter out None values for grading
-            valid_texts = [text for text in perturbed_texts if text is not None]
+    validity = "approved" if (
+        (ai_assessment == "pass" and expected_gt == "acceptable") or
+        (ai_assessment == "fail" and expected_gt == "unacceptable")
+    ) else "denied"
+
+    now = datetime.utcnow()
+    return {
+        "id": _perturbation_id(test, criteria),
+        "original_id": test["id"],
+        "title": perturbed_text,
+        "label": ai_assessment,
+        "type": name,
+        "topic_id": topic_id,
+        "ground_truth": expected_gt,
+        "validity": validity,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+def _write_perturbations(uid: str, perturbations: list) -> list:
+    """Write stage: store one batch of perturbations with batched commits; returns ids that failed to write"""
+    perturbations_ref = db.collection("users").document(uid).collection("perturbations")
+    result = bulk_write(set_op(perturbations_ref.document(p["id"]), p) for p in perturbations)
+    failed_ids = set(result.failed_ids)
+    for perturbation in perturbations:
+        if perturbation["id"] not in failed_ids:
+            log_action(uid, "generate_perturbation", perturbation)
+    return sorted(failed_ids)
+
+
+def _perturbation_id(test: dict, criteria: dict) -> str:
+    return f"{test['id']}_{criteria['name']}".replace(" ", "_").replace("-", "_").lower()
+
+
+def _prepare_tasks(uid: str, topic: dict, test_ids: list):
+    """
+    Resolve the user's criteria for a topic and build (test, criteria) tasks for the
+    requested tests whose AI and user assessments match
+
+    Args:
+        topic: Topic document with its "id" and "name"
+
+    Returns:
+        (pipeline, task_list)
+    """
+    tests_ref = db.collection("users").document(uid).collection("tests")
+    test_lookup = {}
+    # Only the requested tests, and only the fields perturbation needs, however large the topic
+    for doc in load_documents((tests_ref.document(test_id) for test_id in dict.fromkeys(test_ids)), field_paths=PERTURBATION_TEST_FIELDS):
+        if doc.exists and topic_id_of(doc.to_dict()) == topic["id"]:
+            test_lookup[doc.id] = {**doc.to_dict(), "id": doc.id}
+
+    user_criteria_doc = load_document(criteria_ref(uid, topic["id"]))
+
+    if user_criteria_doc.exists:
+        criteria_data = user_criteria_doc.to_dict()
+        criteria_types = criteria_data.get("types", [])
+    else:
+        print(f"No user criteria found for topic '{topic['name']}', using AIBAT fallback")
+
+        # Build default AIBAT criteria config
+        criteria_types = [
+            {
+                "name": name,
+                "prompt": get_criteria_prompt(name, for_generation=False),
+                "isDefault": True
+            }
+            for name in DEFAULT_CRITERIA_CONFIGS.get("AIBAT", [])
+        ]
+
+        # Save it to Firestore so it's stored for future use
+        save_topic_criteria(uid, topic["id"], criteria_types)
+
+    pipeline = get_model_pipeline(uid)
+
+    # Filter tests to only include those where AI and user assessments match
+    matching_tests = []
+    for test_id in dict.fromkeys(test_ids):
+        if test_id not in test_lookup:
+            print(f"Test ID {test_id} not found, skipping")
+            continue
             
-            # Use batch processing for grading if available
-            if valid_texts and hasattr(pipeline, 'batch_grade'):
-                print(f"Using batch grading for {len(valid_texts)} valid perturbations")
-                try:
-                    batch_grades = pipeline.batch_grade(valid_texts, topic)
-                    print(f"Batch grading completed, got {len(batch_grades)} results")
-                    
-                    # Map batch grades back to the full list (including None values)
-                    graded_labels = []
-                    valid_index = 0
-                    for perturbed_text in perturbed_texts:
-                        if perturbed_text is None:
-                            graded_labels.append("unknown")
-                        else:
-                            if valid_index < len(batch_grades):
-                                graded_labels.append(batch_grades[valid_index])
-                            else:
-                                graded_labels.append("unknown")
-                            valid_index += 1
-                            
-                except Exception as e:
-                    print(f"Batch grading failed: {e}, falling back to individual calls")
-                    # Fallback to individual grading
-                    graded_labels = []
-                    for j, perturbed_text in enumerate(perturbed_texts):
-                        if perturbed_text is None:
-                            graded_labels.append("unknown")
-                        else:
-                            try:
-                                label_result = pipeline.grade(perturbed_text, topic)
-                                graded_labels.append(label_result)
-                            except Exception as e:
-                                print(f"Error in grading {j+1}: {e}")
-                                graded_labels.append("unknown")
+        test = test_lookup[test_id]
+        ai_assessment = test.get("label", "ungraded")  # AI assessment
+        user_assessment = test.get("ground_truth", "ungraded")  # User assessment
+        
+        # Convert AI assessment format (acceptable/unacceptable) to match user format if needed
+        # Both should be in acceptable/unacceptable format
+        if ai_assessment in ["acceptable", "unacceptable"] and user_assessment in ["acceptable", "unacceptable"]:
+            if ai_assessment == user_assessment:
+                matching_tests.append(test)
+                print(f"Including test '{test['title'][:50]}...' - AI: {ai_assessment}, User: {user_assessment}")
             else:
-                # Fallback for pipelines without batch support or no valid texts
-                print("Using individual grading calls")
-                graded_labels = []
-                for j, perturbed_text in enumerate(perturbed_texts):
-                    if perturbed_text is None:
-                        graded_labels.append("unknown")
-                    else:
-                        try:
-                            label_result = pipeline.grade(perturbed_text, topic)
-                            graded_labels.append(label_result)
-                        except Exception as e:
-                            print(f"Error in grading {j+1}: {e}")
-                            graded_labels.append("unknown")
-
-            for (test, criteria), perturbed_text, label_result in zip(batch, perturbed_texts, graded_labels):
-                # Skip failed perturbations
-                if perturbed_text is None:
-                    print(f"Skipping failed perturbation for test {test['id']} with criteria {criteria['name']}")
-                    continue
-                    
-                name = criteria["name"]
-                ai_assessment = "pass" if label_result == "acceptable" else "fail"
+                print(f"Skipping test '{test['title'][:50]}...' - AI: {ai_assessment}, User: {user_assessment} (mismatch)")
+        else:
+            print(f"Skipping test '{test['title'][:50]}...' - AI: {ai_assessment}, User: {user_assessment} (ungraded)")
 
-                user_assessment = test.get("ground_truth", "ungraded")
-                expected_gt = user_assessment
+    print(f"Filtered {len(matching_tests)} matching tests out of {len(test_ids)} requested tests")
 
-                if expected_gt != "ungraded" and should_flip_label(name):
-                    expected_gt = "unacceptable" if expected_gt == "acceptable" else "acceptable"
+    # Create task list only for matching tests
+    task_list = [
+        (test, criteria)
+        for test in matching_tests
+        for criteria in criteria_types
+    ]
 
-                validity = "approved" if (
-                    (ai_assessment == "pass" and expected_gt == "acceptable") or
-                    (ai_assessment == "fail" and expected_gt == "unacceptable")
-                ) else "denied"
+    return pipeline, task_list
 
-                pert_id = f"{test['id']}_{name}".replace(" ", "_").replace("-", "_").lower()
 
-                perturbation = {
-                    "id": pert_id,
-                    "original_id": test["id"],
-                    "title": perturbed_text,
-                    "label": ai_assessment,
-                    "type": name,
-                    "topic": topic,
-                    "ground_truth": expected_gt,
-                    "validity": validity,
-                    "created_at": datetime.utcnow()
-                }
+def iter_perturbation_batches(uid: str, topic: dict, pipeline, task_list: list, batch_size: Optional[int] = None):
+    """
+    Generate, grade and store perturbations for `task_list`, batch by batch
 
-                db.collection("users").document(uid).collection("perturbations").document(pert_id).set(perturbation)
-                log_action(uid, "generate_perturbation", perturbation)
-                results.append(perturbation)
+    Yields:
+        (perturbations, failed_ids) for each batch once its perturbations are written;
+        failed_ids are the perturbation ids that could not be generated or stored
+    """
+    all_prompts = [f"{criteria['prompt']}: {test['title']}" for test, criteria in task_list]
+    if batch_size:
+        batches = [list(range(i, min(i + batch_size, len(task_list)))) for i in range(0, len(task_list), batch_size)]
+    elif hasattr(pipeline, 'plan_batches'):
+        # Pack batches from the model's context and token budget
+        batches = pipeline.plan_batches("batch_perturb", all_prompts)
+    else:
+        batches = [list(range(i, min(i + 10, len(task_list)))) for i in range(0, len(task_list), 10)]
 
-        return {"message": f"Generated {len(results)} perturbations", "perturbations": results}
+    def perturb_stage(batch_indices):
+        batch = [task_list[k] for k in batch_indices]
+        print(f"Perturbing {len(batch)} items")
+        pert_prompts = [all_prompts[k] for k in batch_indices]
+        return batch, _perturb_batch(pipeline, pert_prompts)
 
-    except Exception as e:
-        raise Exception(f"Error generating perturbations: {str(e)}")
+    def grade_stage(perturbed):
+        batch, perturbed_texts = perturbed
+        graded_labels = _grade_batch(pipeline, perturbed_texts, topic["name"])
+
+        perturbations, failed_ids = [], []
+        for (test, criteria), perturbed_text, label_result in zip(batch, perturbed_texts, graded_labels):
+            # Skip failed perturbations
+            if perturbed_text is None:
+                print(f"Skipping failed perturbation for test {test['id']} with criteria {criteria['name']}")
+                failed_ids.append(_perturbation_id(test, criteria))
+                continue
+            perturbations.append(_build_perturbation(test, criteria, perturbed_text, label_result, topic["id"]))
+        return perturbations, failed_ids
+
+    # Batch N+1 is perturbed while batch N is graded and batch N-1 is written;
+    # every stage draws on the same rate limiter budget
+    for batch_number, (perturbations, failed_ids) in enumerate(run_staged(batches, [perturb_stage, grade_stage]), 1):
+        print(f"Writing batch {batch_number}/{len(batches)} with {len(perturbations)} perturbations")
+        write_failed_ids = _write_perturbations(uid, perturbations)
+        if write_failed_ids:
+            perturbations = [p for p in perturbations if p["id"] not in write_failed_ids]
+            failed_ids = failed_ids + write_failed_ids
+        # Stored perturbations reference the topic id; responses also carry its name
+        for perturbation in perturbations:
+            perturbation["topic"] = topic["name"]
+        yield perturbations, failed_ids
+
+
+def iter_generate_perturbations(uid: str, topic: str, test_ids: list, batch_size: Optional[int] = None):
+    """
+    Generate perturbations, yielding each batch once it is stored
+
+    Yields:
+        {"type": "results", "results": [...]} per batch, then
+        {"type": "summary", "message", "generated_count", "failed_count"}
+    """
+    topic_data = require_topic(uid, topic)
+    pipeline, task_list = _prepare_tasks(uid, topic_data, test_ids)
+
+    if not task_list:
+        print("No matching tests found for perturbation generation")
+        yield {"type": "summary", "message": "No perturbations generated - no tests with matching AI and user assessments", "generated_count": 0, "failed_count": 0}
+        return
+
+    print(f"Processing {len(task_list)} perturbation tasks")
+
+    generated_count, failed_count = 0, 0
+    for perturbations, failed_ids in iter_perturbation_batches(uid, topic_data, pipeline, task_list, batch_size):
+        generated_count += len(perturbations)
+        failed_count += len(failed_ids)
+        yield {"type": "results", "results": perturbations}
+
+    yield {"type": "summary", "message": f"Generated {generated_count} perturbations", "generated_count": generated_count, "failed_count": failed_count}
+
+
+def _run_perturbation_job(uid: str, params: dict, progress):
+    """Job runner: generate perturbations, checkpointing after each written batch"""
+    # The job keeps the topic id, so renaming the topic while it runs does not matter
+    topic = get_topics_by_id(uid, [params["topic_id"]]).get(params["topic_id"])
+    if topic is None:
+        raise ValueError(f"Topic '{params['topic']}' no longer exists")
+    topic["id"] = params["topic_id"]
+    pipeline, task_list = _prepare_tasks(uid, topic, params["test_ids"])
+    progress.set_total(len(task_list))
+
+    # Tasks completed by an earlier run of this job are not sent to the LLM again
+    done = sum(1 for test, criteria in task_list if progress.is_done(_perturbation_id(test, criteria)))
+    if done:
+        print(f"Resuming perturbation job: {done} of {len(task_list)} tasks already done")
+
+    def process(tasks):
+        for perturbations, failed_ids in iter_perturbation_batches(uid, topic, pipeline, tasks, params.get("batch_size")):
+            yield [perturbation["id"] for perturbation in perturbations], failed_ids
+
+    # Failed tasks are retried until they run out of attempts
+    run_tasks(progress, task_list, lambda task: _perturbation_id(*task), process)
+
+
+register_runner(PERTURBATION_JOB, _run_perturbation_job)
 
 
-def get_perturbations_by_topic(uid: str, topic: str):
+def start_perturbation_job(uid: str, topic: str, test_ids: list, batch_size: Optional[int] = None):
+    """Queue perturbation generation in the background and return its job id"""
     try:
-        perturbations_ref = db.collection("users").document(uid).collection("perturbations")
-        query = perturbations_ref.where("topic", "==", topic)
+        topic_data = require_topic(uid, topic)
+        return create_job(uid, PERTURBATION_JOB, {"topic": topic, "topic_id": topic_data["id"], "test_ids": list(test_ids), "batch_size": batch_size})
+    except Exception as e:
+        raise Exception(f"Error starting perturbation job: {str(e)}")
+
+
+def get_perturbation_job(uid: str, job_id: str):
+    """Progress of a perturbation job (completed/failed/remaining tasks and ETA), or None if unknown"""
+    return get_job(uid, job_id, PERTURBATION_JOB)
 
-        perturbations_docs = query.get()
 
+def get_perturbation_job_results(uid: str, job_id: str):
+    """Perturbations a job generated so far"""
+    try:
+        task_ids = get_job_task_ids(uid, job_id)
+        if task_ids is None:
+            return None
+
+        perturbations_ref = db.collection("users").document(uid).collection("perturbations")
         perturbations = []
-        for doc in perturbations_docs:
-            perturbation_data = doc.to_dict()
-            perturbation_data["id"] = doc.id
-            perturbations.append(perturbation_data)
+        for doc in db.get_all([perturbations_ref.document(task_id) for task_id in task_ids]):
+            if doc.exists:
+                perturbation_data = doc.to_dict()
+                perturbation_data["id"] = doc.id
+                perturbations.append(perturbation_data)
+
+        topics = get_topics_by_id(uid, [topic_id_of(p) for p in perturbations])
+        for perturbation in perturbations:
+            perturbation["topic"] = topics.get(topic_id_of(perturbation), {}).get("name")
 
         return {"perturbations": perturbations}
 
+    except Exception as e:
+        raise Exception(f"Error fetching job perturbations: {str(e)}")
+
+
+def _perturbation_result(doc, topic: str) -> dict:
+    return {**doc.to_dict(), "id": doc.id, "topic": topic}
+
+
+async def aget_perturbations_by_topic(uid: str, topic: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                                      fields: Optional[List[str]] = None):
+    """
+    Perturbations of a topic, all of them or one page of `limit` after `cursor`
+
+    Pages also carry "perturbation_count" (from an aggregation query, read concurrently
+    with the page) and "next_cursor".
+    """
+    try:
+        topic_data = await aresolve_topic(uid, topic)
+        if topic_data is None:
+            return {"perturbations": [], "perturbation_count": 0, "next_cursor": None} if limit is not None else {"perturbations": []}
+
+        perturbations_ref = async_firestore.user_ref(uid).collection("perturbations")
+        query = perturbations_ref.where("topic_id", "==", topic_data["id"])
+
+        if limit is None:
+            return {
+                "topic_id": topic_data["id"],
+                "perturbations": [_perturbation_result(doc, topic) async for doc in aiter_query(perturbations_ref, query, fields)]
+            }
+
+        (docs, next_cursor), perturbation_count = await asyncio.gather(
+            afetch_page(perturbations_ref, query, limit, cursor, fields), acount_query(query)
+        )
+        return {
+            "topic_id": topic_data["id"],
+            "perturbations": [_perturbation_result(doc, topic) for doc in docs],
+            "perturbation_count": perturbation_count,
+            "next_cursor": next_cursor
+        }
+
     except Exception as e:
         raise Exception(f"Error fetching perturbations: {str(e)}")
+
+
+async def astream_perturbations_by_topic(uid: str, topic: str, fields: Optional[List[str]] = None):
+    """
+    Listing header (topic_id, perturbation_count) and an async iterator that reads the topic's
+    perturbations page by page, for streaming responses
+    """
+    topic_data = await aresolve_topic(uid, topic)
+    if topic_data is None:
+        return {"perturbation_count": 0}, iter(())
+
+    perturbations_ref = async_firestore.user_ref(uid).collection("perturbations")
+    query = perturbations_ref.where("topic_id", "==", topic_data["id"])
+
+    async def perturbations():
+        async for doc in aiter_query(perturbations_ref, query, fields):
+            yield _perturbation_result(doc, topic)
+
+    return {"topic_id": topic_data["id"], "perturbation_count": await acount_query(query)}, perturbations()
@@ -3,10 +3,13 @@
 from uuid import uuid4
 from datetime import datetime
 from app.core.firebase_client import db
+from app.utils.bulk_write import bulk_write, set_op
 
-def add_tests(user_id: str, topic: str, tests):
+def add_tests(user_id: str, topic_id: str, tests):
+    """Add test statements to the topic with id `topic_id`"""
     ref = db.collection("users").document(user_id).collection("tests")
     added_ids = []
+    writes = []
 
     for test in tests:
         # Handle both Pydantic objects (with .title attribute) and dictionaries (with ["title"] key)
@@ -23,15 +26,21 @@ def add_tests(user_id: str, topic: str, tests):
             continue
             
         doc_id = uuid4().hex
-        ref.document(doc_id).set({
+        now = datetime.utcnow()
+        writes.append(set_op(ref.document(doc_id), {
             "id": doc_id,
-            "topic": topic,
+            "topic_id": topic_id,
             "title": title,
             "ground_truth": ground_truth,
             "label": "ungraded",
             "validity": "ungraded",
-            "created_at": datetime.utcnow()
-        })
+            "created_at": now,
+            "updated_at": now
+        }))
         added_ids.append(doc_id)
 
-    return {"added_count": len(added_ids), "test_ids": added_ids}
+    result = bulk_write(writes)
+    failed_ids = set(result.failed_ids)
+    added_ids = [doc_id for doc_id in added_ids if doc_id not in failed_ids]
+
+    return {"added_count": len(added_ids), "test_ids": added_ids, "failed_ids": sorted(failed_ids)}
@@ -0,0 +1,103 @@
+# app/services/sync_service.py
+
+"""
+Delta sync for topic listings.
+
+Every write to a test or perturbation stamps "updated_at", and deleting tests or
+perturbations leaves a tombstone at users/{uid}/tombstones/{collection}/deleted/{id}.
+A client that holds a topic's listing asks for what changed since the "server_time" of
+its previous sync and gets the changed documents plus the ids deleted since then.
+
+Tombstones are kept for TOMBSTONE_RETENTION_DAYS ("expire_at" can drive a Firestore
+TTL policy); a client whose cursor is older than that is told to reload the listing.
+Documents of a deleted topic get no tombstones: the response reports the topic as gone.
+Responses carry the topic's "topic_id"; a client that passes the id it synced against
+is told to reload when the name now belongs to another topic (deleted and recreated).
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+from app.core.firebase_client import db
+from app.utils.bulk_write import bulk_write, set_op
+from app.utils import async_firestore
+from app.services.topic_ids import aresolve_topic
+
+SYNCED_COLLECTIONS = ["tests", "perturbations"]
+
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+
+
+def tombstones_ref(uid: str, collection: str, client=None):
+    return (client or db).collection("users").document(uid).collection("tombstones").document(collection).collection("deleted")
+
+
+def record_deletions(uid: str, collection: str, doc_ids: Iterable[str]):
+    """Leave tombstones for deleted documents so syncing clients drop them"""
+    now = datetime.utcnow()
+    expire_at = now + timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    ref = tombstones_ref(uid, collection)
+    result = bulk_write(
+        set_op(ref.document(doc_id), {"deleted_at": now, "expire_at": expire_at})
+        for doc_id in dict.fromkeys(doc_ids)
+    )
+    if result.failed:
+        print(f"Could not record {len(result.failed)} {collection} tombstones for user {uid}")
+    return result
+
+
+def _as_utc(moment: datetime) -> datetime:
+    # Stored timestamps are naive UTC
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _empty_changes(collection: str, topic: str, since: datetime):
+    if collection not in SYNCED_COLLECTIONS:
+        raise ValueError(f"Cannot sync '{collection}'")
+
+    # Taken before reading, so writes that race with this call show up again next time
+    server_time = datetime.utcnow()
+    since = _as_utc(since)
+    response = {"topic": topic, "topic_id": None, "server_time": server_time, "changed": [], "deleted": [],
+                "topic_exists": True, "reset": False}
+    if since < server_time - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        response["reset"] = True
+    return response, since
+
+
+async def aget_changes(uid: str, collection: str, topic: str, since: datetime, topic_id: Optional[str] = None) -> dict:
+    """
+    Documents of a topic changed after `since`, and ids deleted after it, read concurrently
+
+    Args:
+        topic_id: Id of the topic the client's listing belongs to, if known
+
+    Returns:
+        {"topic", "topic_id", "server_time", "changed": [...], "deleted": [...], "topic_exists", "reset"};
+        pass server_time as the next `since`. With "reset" the listing must be reloaded.
+    """
+    response, since = _empty_changes(collection, topic, since)
+    if response["reset"]:
+        return response
+
+    topic_data = await aresolve_topic(uid, topic)
+    if topic_data is None:
+        response["topic_exists"] = False
+        return response
+
+    response["topic_id"] = topic_data["id"]
+    if topic_id is not None and topic_id != topic_data["id"]:
+        response["reset"] = True
+        return response
+
+    query = async_firestore.user_ref(uid).collection(collection) \
+        .where("topic_id", "==", topic_data["id"]).where("updated_at", ">", since)
+    deleted = tombstones_ref(uid, collection, async_firestore.async_db).where("deleted_at", ">", since).select([])
+    changed_docs, deleted_docs = await asyncio.gather(async_firestore.stream(query), async_firestore.stream(deleted))
+
+    response["changed"] = [{**doc.to_dict(), "id": doc.id, "topic": topic} for doc in changed_docs]
+    response["deleted"] = [doc.id for doc in deleted_docs]
+    return response
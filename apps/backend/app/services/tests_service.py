@@ -1,73 +1,108 @@
 from app.core.firebase_client import db
-from app.utils.model_selector import get_model_pipeline
-from app.services.assessment_cache_service import cache_multiple_assessments
-from app.services.topics_service import get_topics
-from app.services.models_service import get_current_model
+from app.utils.model_selector import aget_model_pipeline, get_model_selection
+from app.services.assessment_cache_service import cache_statement_assessments
+from app.services.grading_service import grade_tests, iter_grade_tests
+from app.services.topic_ids import aresolve_topic, get_topics_by_id, require_topic, topic_id_of, topic_prompt
+import asyncio
 from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
 from uuid import uuid4
 
-from app.core.model_config import DEFAULT_MODEL_ID
-from app.services.shared_test_utils import add_tests
+from app.services.shared_test_utils import add_tests as add_tests_by_topic_id
+from app.utils.bulk_write import bulk_write, update_op
+from app.utils.request_loader import load_documents
+from app.utils.pagination import acount_query, afetch_page, aiter_query
+from app.utils import async_firestore
+from app.services import deletion_service
 
-def get_tests_by_topic(user_id: str, topic: str):
-    ref = db.collection("users").document(user_id).collection("tests").where("topic", "==", topic)
-    docs = ref.stream()
+def _test_result(doc, topic: str) -> dict:
+    return {**doc.to_dict(), "id": doc.id, "topic": topic}
 
-    tests = []
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        tests.append(data)
-    return {"topic": topic, "test_count": len(tests), "tests": tests}
 
+async def aget_tests_by_topic(user_id: str, topic: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                              fields: Optional[List[str]] = None):
+    """
+    Tests of a topic, all of them or one page of `limit` after `cursor`
 
-# Delete multiple tests by ID
-def delete_tests(user_id: str, test_ids: list[str]):
-    ref = db.collection("users").document(user_id).collection("tests")
-    for tid in test_ids:
-        ref.document(tid).delete()
-    return {"deleted_count": len(test_ids)}
+    Pages carry "next_cursor" (None on the last page) and take test_count from an
+    aggregation query, read concurrently with the page. `fields` limits the fields read
+    per test.
+    """
+    topic_data = await aresolve_topic(user_id, topic)
+    if topic_data is None:
+        empty = {"topic": topic, "test_count": 0, "tests": []}
+        return {**empty, "next_cursor": None} if limit is not None else empty
 
+    ref = async_firestore.user_ref(user_id).collection("tests")
+    query = ref.where("topic_id", "==", topic_data["id"])
 
-# Grade multiple test statements by ID
-def auto_grade_tests(user_id: str, test_ids: list[str]):
-    pipeline = get_model_pipeline(user_id)
-    ref = db.collection("users").document(user_id).collection("tests")
-    assessments = []
+    if limit is None:
+        tests = [_test_result(doc, topic) async for doc in aiter_query(ref, query, fields)]
+        return {"topic": topic, "topic_id": topic_data["id"], "test_count": len(tests), "tests": tests}
 
-    for tid in test_ids:
-        doc = ref.document(tid).get()
-        if not doc.exists:
-            continue
-        data = doc.to_dict()
-        title = data.get("title")
-        topic = data.get("topic")
-        ground_truth = data.get("ground_truth")
+    (docs, next_cursor), test_count = await asyncio.gather(afetch_page(ref, query, limit, cursor, fields), acount_query(query))
+    return {
+        "topic": topic,
+        "topic_id": topic_data["id"],
+        "test_count": test_count,
+        "tests": [_test_result(doc, topic) for doc in docs],
+        "next_cursor": next_cursor
+    }
 
-        label = pipeline.grade(title, topic)
-        validity = "approved" if label == ground_truth else "denied"
 
-        ref.document(tid).update({
-            "label": label,
-            "validity": validity,
-            "graded_at": datetime.utcnow()
-        })
+async def astream_tests_by_topic(user_id: str, topic: str, fields: Optional[List[str]] = None) -> Tuple[dict, AsyncIterator[dict]]:
+    """
+    Listing header (topic, topic_id, test_count) and an async iterator that reads the
+    topic's tests page by page, for streaming responses
+    """
+    topic_data = await aresolve_topic(user_id, topic)
+    if topic_data is None:
+        return {"topic": topic, "test_count": 0}, iter(())
+
+    ref = async_firestore.user_ref(user_id).collection("tests")
+    query = ref.where("topic_id", "==", topic_data["id"])
+
+    async def tests():
+        async for doc in aiter_query(ref, query, fields):
+            yield _test_result(doc, topic)
 
-        assessments.append({
-            "test_id": tid,
-            "statement": title,
-            "ai_assessment": label
-        })
+    head = {"topic": topic, "topic_id": topic_data["id"], "test_count": await acount_query(query)}
+    return head, tests()
 
-    cache_multiple_assessments(user_id, topic, DEFAULT_MODEL_ID, assessments)  # or get user's current model
-    return {"graded_count": len(assessments), "results": assessments}
+
+# Add test statements to a topic by name
+def add_tests(user_id: str, topic: str, tests):
+    topic_data = require_topic(user_id, topic)
+    return add_tests_by_topic_id(user_id, topic_data["id"], tests)
+
+
+# Delete multiple tests by ID, with their perturbations and cached assessments
+def delete_tests(user_id: str, test_ids: list[str]):
+    return deletion_service.delete_tests(user_id, test_ids)
+
+
+# Grade multiple test statements by ID
+def auto_grade_tests(user_id: str, test_ids: list[str]):
+    return grade_tests(user_id, test_ids)
+
+def iter_auto_grade_tests(user_id: str, test_ids: list[str]):
+    return iter_grade_tests(user_id, test_ids)
 
 
 # Edit multiple tests (title, ground_truth)
 def edit_tests(user_id: str, test_updates: list):
     ref = db.collection("users").document(user_id).collection("tests")
-    updated = 0
-    pipeline = None
+    writes = []
+    model_id, pipeline = None, None
+
+    # Tests whose title changes are re-graded; fetch them and their topics up front
+    retitled = {
+        doc.id: doc.to_dict()
+        for doc in load_documents(ref.document(update.id) for update in test_updates if update.title is not None)
+        if doc.exists
+    }
+    topics = get_topics_by_id(user_id, (topic_id_of(test_data) for test_data in retitled.values()))
+    new_assessments = {}  # topic_id -> {statement: label}
     
     for update in test_updates:
         test_id = update.id
@@ -86,31 +121,30 @@ def edit_tests(user_id: str, test_updates: list):
             # If title changed, reset AI assessment and re-grade
             if title_changed:
                 if pipeline is None:
-                    pipeline = get_model_pipeline(user_id)
+                    model_id, pipeline = get_model_selection(user_id)
                 
-                # Get the test document to get the topic
-                test_doc = ref.document(test_id).get()
-                if test_doc.exists:
-                    test_data = test_doc.to_dict()
-                    topic = test_data.get("topic")
+                test_data = retitled.get(test_id)
+                if test_data is not None:
+                    topic_id = topic_id_of(test_data)
+                    prompt = topic_prompt(topics.get(topic_id, {}), topic_id)
                     
-                    # Re-grade the updated statement
-                    new_label = pipeline.grade(update.title, topic)
+                    # Re-grade the updated statement with the same prompt batch grading uses
+                    new_label = pipeline.grade(update.title, prompt)
                     new_data["label"] = new_label
                     new_data["validity"] = "approved" if new_label == new_data.get("ground_truth", test_data.get("ground_truth")) else "denied"
                     
-                    # Cache the new assessment
-                    assessments = [{
-                        "test_id": test_id,
-                        "statement": update.title,
-                        "ai_assessment": new_label
-                    }]
-                    cache_multiple_assessments(user_id, topic, DEFAULT_MODEL_ID, assessments)
+                    new_assessments.setdefault(topic_id, {})[update.title] = new_label
             
-            ref.document(test_id).update(new_data)
-            updated += 1
-            
-    return {"updated_count": updated}
+            writes.append(update_op(ref.document(test_id), new_data))
+
+    result = bulk_write(writes)
+
+    # Cache the new assessments, one write per topic
+    for topic_id, assessments in new_assessments.items():
+        prompt = topic_prompt(topics.get(topic_id, {}), topic_id)
+        cache_statement_assessments(model_id, prompt, assessments, user_id=user_id, topic_id=topic_id)
+
+    return {"updated_count": result.written}
 
 
 # Add a user assessment for a test (also calculates agreement)
@@ -143,7 +177,7 @@ def get_logs(user_id: str):
     return log_test(user_id, get_only=True)
 
 
-def generate_statements(user_id: str, generation_data: dict) -> dict:
+async def agenerate_statements(user_id: str, generation_data: dict) -> dict:
     """
     Generate new statements for an existing topic using AI and add them to Firestore
     """
@@ -152,13 +186,8 @@ def generate_statements(user_id: str, generation_data: dict) -> dict:
     criteria = generation_data.get("criteria", "base")
     num_statements = generation_data.get("num_statements", 5)
     
-    # Get topic data including prompt from topics API
-    topics = get_topics(user_id)
-    topic_data = None
-    for topic in topics:
-        if topic["name"] == topic_name:
-            topic_data = topic
-            break
+    # Get topic data including prompt
+    topic_data = await aresolve_topic(user_id, topic_name)
     
     if not topic_data:
         raise Exception(f"Topic '{topic_name}' does not exist")
@@ -168,12 +197,11 @@ def generate_statements(user_id: str, generation_data: dict) -> dict:
         raise Exception(f"No prompt found for topic '{topic_name}'")
     
     # Get existing statements for context from Firestore
-    tests_ref = db.collection("users").document(user_id).collection("tests").where("topic", "==", topic_name)
-    test_docs = tests_ref.stream()
+    tests_ref = async_firestore.user_ref(user_id).collection("tests")
+    query = tests_ref.where("topic_id", "==", topic_data["id"])
     existing_statements = []
-    for doc in test_docs:
-        data = doc.to_dict()
-        statement = data.get('title', '').strip()
+    async for doc in aiter_query(tests_ref, query, ["title"]):
+        statement = doc.to_dict().get('title', '').strip()
         if statement:
             existing_statements.append(statement)
     
@@ -182,13 +210,13 @@ def generate_statements(user_id: str, generation_data: dict) -> dict:
     
     # Get the model pipeline for generation
     try:
-        model_pipeline = get_model_pipeline(user_id)
+        model_pipeline = await aget_model_pipeline(user_id)
     except Exception as e:
         print(f"Error getting model pipeline: {e}")
         raise Exception("Model pipeline not available for generation")
     
-    # Generate new statements using the pipeline
-    generated_statements = model_pipeline.generate(
+    # Generate new statements without holding a threadpool worker during the model call
+    generated_statements = await model_pipeline.agenerate(
         existing_statements=existing_statements,
         topic_prompt=topic_prompt,
         criteria=criteria,
@@ -198,30 +226,9 @@ def generate_statements(user_id: str, generation_data: dict) -> dict:
     if not generated_statements:
         raise Exception("Failed to generate statements")
     
-    # Get current model for caching
-    try:
-        current_model = get_current_model(user_id)
-        current_model_id = current_model.get("id", DEFAULT_MODEL_ID)
-    except Exception as e:
-        print(f"Error getting current model: {e}")
-        current_model_id = DEFAULT_MODEL_ID
-    
     # Prepare test data for add_tests function
     test_payload = [{"title": statement, "ground_truth": "ungraded"} for statement in generated_statements]
     
     # Use add_tests to add the generated statements
-    result = add_tests(user_id, topic_name, test_payload)
-    
-    # Cache the generated assessments
-    assessments = []
-    for i, statement in enumerate(generated_statements):
-        assessments.append({
-            "test_id": result["test_ids"][i] if i < len(result["test_ids"]) else f"generated_{i}",
-            "statement": statement,
-            "ai_assessment": "ungraded"
-        })
-    
-    cache_multiple_assessments(user_id, topic_name, current_model_id, assessments)
-    
-    return result
+    return await asyncio.to_thread(add_tests_by_topic_id, user_id, topic_data["id"], test_payload)
 
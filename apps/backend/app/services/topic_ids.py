@@ -0,0 +1,152 @@
+# app/services/topic_ids.py
+
+"""
+Stable topic ids.
+
+A topic is stored at users/{uid}/topics/{topic_id} with its display name in the "name"
+field. Tests and perturbations reference the topic by "topic_id" only, so renaming a
+topic is a single update of its "name".
+
+Topics created before ids existed keep their old document id (the name they had at the
+time) as their id; migrate_topic_ids moves their documents from the "topic" name field
+to "topic_id". It runs lazily the first time a process touches a user's topics, or for all
+users at once with `python -m app.services.topic_ids`.
+"""
+
+import asyncio
+import threading
+from typing import Dict, Iterable, Optional
+from firebase_admin import firestore
+from app.core.firebase_client import async_db, db
+from app.utils.bulk_write import bulk_write, update_op
+from app.utils.request_loader import forget, load_document, load_documents
+
+# Bumped when topic references need another migration; stored on the user document
+TOPIC_SCHEMA_VERSION = 1
+
+# Collections whose documents reference a topic
+TOPIC_REFERENCING_COLLECTIONS = ["tests", "perturbations"]
+
+# Users known to be migrated by this process
+_migrated_users = set()
+_migrated_lock = threading.Lock()
+
+
+def topics_ref(uid: str):
+    return db.collection("users").document(uid).collection("topics")
+
+
+def migrate_topic_ids(uid: str) -> Dict[str, int]:
+    """
+    Point every document that references a topic by name at the topic's id instead
+
+    Idempotent; the user document records the schema version once every write succeeded.
+
+    Returns:
+        Number of migrated documents per collection
+    """
+    user_ref = db.collection("users").document(uid)
+    writes = []
+    counts = {collection: 0 for collection in ["topics"] + TOPIC_REFERENCING_COLLECTIONS}
+
+    for topic_doc in topics_ref(uid).stream():
+        topic_data = topic_doc.to_dict()
+        name = topic_data.get("name") or topic_doc.id
+        if "name" not in topic_data:
+            writes.append(update_op(topic_doc.reference, {"name": name}))
+            counts["topics"] += 1
+
+        for collection in TOPIC_REFERENCING_COLLECTIONS:
+            for doc in user_ref.collection(collection).where("topic", "==", name).select([]).stream():
+                writes.append(update_op(doc.reference, {"topic_id": topic_doc.id, "topic": firestore.DELETE_FIELD}))
+                counts[collection] += 1
+
+    result = bulk_write(writes)
+    if result.failed:
+        print(f"Topic id migration for user {uid} incomplete: {len(result.failed)} documents failed")
+    else:
+        user_ref.set({"topic_schema": TOPIC_SCHEMA_VERSION}, merge=True)
+        forget([user_ref])
+        if writes:
+            print(f"Migrated topic references for user {uid}: {counts}")
+    return counts
+
+
+def ensure_topic_ids(uid: str):
+    """Run the topic id migration for a user unless it already ran"""
+    if uid in _migrated_users:
+        return
+    user_doc = load_document(db.collection("users").document(uid))
+    user_data = user_doc.to_dict() if user_doc.exists else {}
+    if user_data.get("topic_schema", 0) < TOPIC_SCHEMA_VERSION:
+        migrate_topic_ids(uid)
+    with _migrated_lock:
+        _migrated_users.add(uid)
+
+
+def resolve_topic(uid: str, name: str, include_deleting: bool = False) -> Optional[dict]:
+    """
+    Topic with the given display name as {"id": ..., **data}, or None
+
+    Topics being deleted are skipped unless `include_deleting`, so the name can be reused
+    while their data is still being removed.
+    """
+    ensure_topic_ids(uid)
+    for doc in topics_ref(uid).where("name", "==", name).stream():
+        data = doc.to_dict()
+        if include_deleting or not data.get("deleting"):
+            return {"id": doc.id, **data}
+    return None
+
+
+async def aensure_topic_ids(uid: str):
+    """Async variant of ensure_topic_ids; the rare migration itself runs in a worker thread"""
+    if uid not in _migrated_users:
+        await asyncio.to_thread(ensure_topic_ids, uid)
+
+
+def async_topics_ref(uid: str):
+    return async_db.collection("users").document(uid).collection("topics")
+
+
+async def aresolve_topic(uid: str, name: str, include_deleting: bool = False) -> Optional[dict]:
+    """Async variant of resolve_topic"""
+    await aensure_topic_ids(uid)
+    async for doc in async_topics_ref(uid).where("name", "==", name).stream():
+        data = doc.to_dict()
+        if include_deleting or not data.get("deleting"):
+            return {"id": doc.id, **data}
+    return None
+
+
+def require_topic(uid: str, name: str) -> dict:
+    """Like resolve_topic, but raises ValueError for an unknown topic"""
+    topic = resolve_topic(uid, name)
+    if topic is None:
+        raise ValueError(f"Topic '{name}' not found")
+    return topic
+
+
+def get_topics_by_id(uid: str, topic_ids: Iterable[str]) -> Dict[str, dict]:
+    """Topic documents by id, fetched in one round-trip (and once per request)"""
+    topic_ids = [topic_id for topic_id in dict.fromkeys(topic_ids) if topic_id]
+    if not topic_ids:
+        return {}
+    ref = topics_ref(uid)
+    return {doc.id: doc.to_dict() for doc in load_documents(ref.document(topic_id) for topic_id in topic_ids) if doc.exists}
+
+
+def topic_prompt(topic_data: dict, topic_id: str) -> str:
+    """Prompt a topic's statements are graded against: its prompt, else its name, else its id"""
+    return topic_data.get("prompt") or topic_data.get("name") or topic_id
+
+
+def topic_id_of(doc_data: dict) -> Optional[str]:
+    """Topic id a test or perturbation references (for unmigrated documents, the topic name)"""
+    return doc_data.get("topic_id") or doc_data.get("topic")
+
+
+if __name__ == "__main__":
+    # One-off backfill for every user: python -m app.services.topic_ids
+    for user_ref in db.collection("users").list_documents():
+        migrate_topic_ids(user_ref.id)
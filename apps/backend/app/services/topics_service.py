@@ -2,10 +2,12 @@
 
 from typing import List
 from datetime import datetime
-from app.core.firebase_client import db as _db
 from uuid import uuid4
-from app.utils.model_selector import get_model_pipeline
+from app.utils.model_selector import aget_model_pipeline
 from app.services.shared_test_utils import add_tests
+from app.services import deletion_service
+from app.services.topic_ids import aensure_topic_ids, async_topics_ref, resolve_topic, topics_ref
+from app.utils.async_firestore import stream
 
 
 def add_topic(uid: str, body):
@@ -14,8 +16,12 @@ def add_topic(uid: str, body):
     tests = body.tests
     is_default = body.default
 
+    # Adding a topic that already exists replaces its metadata but keeps its id
+    existing = resolve_topic(uid, topic)
+    topic_id = existing["id"] if existing else uuid4().hex
+
     # Save topic metadata in Firestore
-    _db.collection("users").document(uid).collection("topics").document(topic).set({
+    topics_ref(uid).document(topic_id).set({
         "name": topic,
         "prompt": prompt,
         "default": is_default,
@@ -24,83 +30,53 @@ def add_topic(uid: str, body):
 
     # Use shared logic to add test statements
     test_payload = [{"title": t.test, "ground_truth": t.ground_truth} for t in tests]
-    add_tests(uid, topic, test_payload)
+    add_tests(uid, topic_id, test_payload)
 
 
-    return {"message": "Topic and tests added successfully!"}
+    return {"message": "Topic and tests added successfully!", "topic_id": topic_id}
 
 def delete_topic(uid: str, topic: str):
-    # Delete the topic
-    _db.collection("users").document(uid).collection("topics").document(topic).delete()
-
-    # Delete related tests
-    tests = _db.collection("users").document(uid).collection("tests").where("topic", "==", topic).stream()
-    for doc in tests:
-        doc.reference.delete()
+    # Tests, perturbations, cached assessments and config go with the topic
+    return deletion_service.delete_topic(uid, topic)
 
-    # Delete related perturbations
-    perturbations = _db.collection("users").document(uid).collection("perturbations").where("topic", "==", topic).stream()
-    for doc in perturbations:
-        doc.reference.delete()
 
-    return {"message": "Topic and associated data deleted successfully!"}
+def _topic_result(doc) -> dict:
+    return {
+        "id": doc.id,
+        "name": doc.id,
+        **doc.to_dict()
+    }
 
 
-def get_topics(uid: str):
-    docs = _db.collection("users").document(uid).collection("topics").stream()
-    return [
-        {
-            "name": doc.id,
-            **doc.to_dict()
-        }
-        for doc in docs
-    ]
+async def aget_topics(uid: str):
+    await aensure_topic_ids(uid)
+    return [_topic_result(doc) for doc in await stream(async_topics_ref(uid)) if not doc.to_dict().get("deleting")]
 
 def edit_topic(uid: str, old_topic: str, new_topic: str, new_prompt: str):
-    user_ref = _db.collection("users").document(uid)
-
-    old_topic_ref = user_ref.collection("topics").document(old_topic)
-    old_doc = old_topic_ref.get()
+    topic_data = resolve_topic(uid, old_topic)
 
-    if not old_doc.exists:
+    if topic_data is None:
         raise Exception(f"Topic '{old_topic}' not found")
 
-    data = old_doc.to_dict()
-    data["prompt"] = new_prompt
-    data["updated_at"] = datetime.utcnow()
-    data["name"] = new_topic
+    update = {"prompt": new_prompt, "updated_at": datetime.utcnow()}
 
     # If name hasn't changed, just update the prompt
     if old_topic == new_topic:
-        old_topic_ref.update({"prompt": new_prompt, "updated_at": datetime.utcnow()})
+        topics_ref(uid).document(topic_data["id"]).update(update)
         return {"message": f"Updated prompt for topic '{old_topic}'"}
 
-    # Rename logic: create new doc, move references, delete old
-    new_topic_ref = user_ref.collection("topics").document(new_topic)
-    new_topic_ref.set(data)
-
-    # Copy tests
-    tests = user_ref.collection("tests").where("topic", "==", old_topic).stream()
-    for doc in tests:
-        test_data = doc.to_dict()
-        test_data["topic"] = new_topic
-        user_ref.collection("tests").document(doc.id).set(test_data)
-
-    # Copy perturbations
-    perturbations = user_ref.collection("perturbations").where("topic", "==", old_topic).stream()
-    for doc in perturbations:
-        pert_data = doc.to_dict()
-        pert_data["topic"] = new_topic
-        user_ref.collection("perturbations").document(doc.id).set(pert_data)
+    if resolve_topic(uid, new_topic) is not None:
+        raise Exception(f"Topic '{new_topic}' already exists")
 
-    # Delete old topic
-    old_topic_ref.delete()
+    # Tests, perturbations and cached assessments reference the topic id, so a rename only touches the topic
+    update["name"] = new_topic
+    topics_ref(uid).document(topic_data["id"]).update(update)
 
     return {"message": f"Renamed topic from '{old_topic}' to '{new_topic}' and updated prompt."}
 
 
-def test_prompt(uid: str, prompt: str, test: str):
-    pipeline = get_model_pipeline(uid)
-    return pipeline.grade_with_prompt(prompt, test)
+async def atest_prompt(uid: str, prompt: str, test: str):
+    pipeline = await aget_model_pipeline(uid)
+    return await pipeline.agrade(test, prompt)
 
 
@@ -0,0 +1,44 @@
+# app/utils/async_firestore.py
+
+"""
+Async Firestore data access for `async def` endpoints.
+
+The helpers take references and queries built on the async client (async_db) and
+await them on the event loop instead of blocking a threadpool worker. Independent
+reads should be awaited together with asyncio.gather. Async reads do not go through
+the request loader.
+"""
+
+from typing import Iterable, List, Optional, Sequence
+
+try:
+    from app.core.firebase_client import async_db
+except (ImportError, KeyError, Exception):
+    # Firebase credentials not configured (e.g. unit tests)
+    async_db = None
+
+
+def user_ref(uid: str):
+    return async_db.collection("users").document(uid)
+
+
+async def get_document(ref):
+    return await ref.get()
+
+
+async def get_documents(refs: Iterable, field_paths: Optional[Sequence[str]] = None) -> List:
+    """Snapshots of `refs` in order, fetched with one get_all"""
+    refs = list(refs)
+    if not refs:
+        return []
+    if field_paths is not None:
+        snapshots = async_db.get_all(refs, field_paths=list(field_paths))
+    else:
+        snapshots = async_db.get_all(refs)
+    by_path = {snapshot.reference.path: snapshot async for snapshot in snapshots}
+    return [by_path[ref.path] for ref in refs if ref.path in by_path]
+
+
+async def stream(query) -> List:
+    """Every document a query matches"""
+    return [doc async for doc in query.stream()]
@@ -0,0 +1,173 @@
+# app/utils/bulk_write.py
+
+"""
+Bulk Firestore writes shared by the services.
+
+Writes are packed into batches of at most 500 operations and the batches are committed
+in parallel. A batch commits atomically, so when one is rejected its writes are retried
+one by one and only the writes that still fail are reported, rather than losing the
+whole chunk because of one bad document.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional
+from app.utils.request_loader import forget
+
+try:
+    from app.core.firebase_client import db
+except (ImportError, KeyError, Exception):
+    # Firebase credentials not configured (e.g. unit tests)
+    db = None
+
+# Firestore allows at most 500 writes per batch
+FIRESTORE_BATCH_LIMIT = 500
+
+# Batches committed concurrently by one bulk_write call
+BULK_WRITE_WORKERS = int(os.getenv("BULK_WRITE_WORKERS", "4"))
+
+
+class WriteOp(NamedTuple):
+    kind: str  # "set", "update" or "delete"
+    ref: Any
+    data: Optional[dict] = None
+    merge: bool = False
+
+
+def set_op(ref, data: dict, merge: bool = False) -> WriteOp:
+    return WriteOp("set", ref, data, merge)
+
+
+def update_op(ref, data: dict) -> WriteOp:
+    return WriteOp("update", ref, data)
+
+
+def delete_op(ref) -> WriteOp:
+    return WriteOp("delete", ref)
+
+
+class BulkWriteResult:
+    """Outcome of a bulk write: how many writes landed and which documents failed"""
+
+    def __init__(self):
+        self.written = 0
+        self.failed: List[dict] = []  # {"id": document id, "error": message}
+
+    @property
+    def failed_ids(self) -> List[str]:
+        return [failure["id"] for failure in self.failed]
+
+    def merge(self, other: "BulkWriteResult"):
+        self.written += other.written
+        self.failed.extend(other.failed)
+
+
+def _add_to_batch(batch, op: WriteOp):
+    if op.kind == "set":
+        batch.set(op.ref, op.data, merge=op.merge)
+    elif op.kind == "update":
+        batch.update(op.ref, op.data)
+    elif op.kind == "delete":
+        batch.delete(op.ref)
+    else:
+        raise ValueError(f"Unknown write operation: {op.kind}")
+
+
+def _write_one(op: WriteOp):
+    if op.kind == "set":
+        op.ref.set(op.data, merge=op.merge)
+    elif op.kind == "update":
+        op.ref.update(op.data)
+    elif op.kind == "delete":
+        op.ref.delete()
+    else:
+        raise ValueError(f"Unknown write operation: {op.kind}")
+
+
+def _commit_chunk(ops: List[WriteOp]) -> BulkWriteResult:
+    result = BulkWriteResult()
+    try:
+        batch = db.batch()
+        for op in ops:
+            _add_to_batch(batch, op)
+        batch.commit()
+        result.written = len(ops)
+        return result
+    except Exception as e:
+        print(f"Batch of {len(ops)} writes failed: {e}, retrying individually")
+
+    for op in ops:
+        try:
+            _write_one(op)
+            result.written += 1
+        except Exception as e:
+            result.failed.append({"id": op.ref.id, "error": str(e)})
+    return result
+
+
+def bulk_write(ops: Iterable[WriteOp], workers: int = BULK_WRITE_WORKERS) -> BulkWriteResult:
+    """
+    Commit write operations in batches of up to FIRESTORE_BATCH_LIMIT, several batches at a time
+
+    Writes in different batches are not ordered relative to each other, so an operation
+    list should not touch the same document twice.
+    """
+    ops = list(ops)
+    chunks = [ops[i:i + FIRESTORE_BATCH_LIMIT] for i in range(0, len(ops), FIRESTORE_BATCH_LIMIT)]
+    result = BulkWriteResult()
+
+    if len(chunks) <= 1 or workers <= 1:
+        for chunk in chunks:
+            result.merge(_commit_chunk(chunk))
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks)), thread_name_prefix="bulk-write") as executor:
+            for chunk_result in executor.map(_commit_chunk, chunks):
+                result.merge(chunk_result)
+
+    # Later reads in this request must not see the documents as they were before
+    forget(op.ref for op in ops)
+
+    if result.failed:
+        print(f"Bulk write: {result.written} written, {len(result.failed)} failed")
+    return result
+
+
+def iter_query_pages(query, page_size: int = FIRESTORE_BATCH_LIMIT) -> Iterator[list]:
+    """Stream a query in pages of document references, resuming each page after the last document"""
+    query = query.select([]).order_by("__name__").limit(page_size)
+    last = None
+    while True:
+        page = list((query.start_after(last) if last is not None else query).stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+
+def bulk_delete_query(query, workers: int = BULK_WRITE_WORKERS,
+                      on_deleted: Optional[Callable[[List[str]], Any]] = None) -> BulkWriteResult:
+    """
+    Delete every document a query matches
+
+    The query is read page by page (references only) and each page is committed as one
+    batch while the following pages are fetched. `on_deleted` is called with the ids of
+    each page's deleted documents.
+    """
+    result = BulkWriteResult()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bulk-delete") as executor:
+        pages = [
+            ([doc.id for doc in page], executor.submit(_commit_chunk, [delete_op(doc.reference) for doc in page]))
+            for page in iter_query_pages(query)
+        ]
+        for page_ids, future in pages:
+            page_result = future.result()
+            result.merge(page_result)
+            if on_deleted is not None:
+                failed_ids = set(page_result.failed_ids)
+                on_deleted([doc_id for doc_id in page_ids if doc_id not in failed_ids])
+
+    if result.failed:
+        print(f"Bulk delete: {result.written} deleted, {len(result.failed)} failed")
+    return result
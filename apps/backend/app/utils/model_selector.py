@@ -1,19 +1,56 @@
 # app/utils/model_selector.py
 
-from app.core.firebase_client import db
+import os
+import time
+import threading
+from app.core.firebase_client import async_db, db
 from app.core.model_registry import MODEL_REGISTRY
 
 DEFAULT_MODEL = "groq-gemma2"
 
+# Seconds a user's model selection is served from memory. select_model updates this
+# process right away; other workers pick up the change once their entry expires.
+MODEL_SELECTION_TTL_SECONDS = float(os.getenv("MODEL_SELECTION_TTL_SECONDS", "60"))
 
-def get_model_pipeline(uid: str):
-    user_config_ref = db.collection("users").document(uid).collection("config").document("model")
-    doc = user_config_ref.get()
+_selections = {}  # uid -> (model_id, expires_at)
+_selections_lock = threading.Lock()
+
+
+def _model_config_ref(uid: str):
+    return db.collection("users").document(uid).collection("config").document("model")
+
+
+def _async_model_config_ref(uid: str):
+    return async_db.collection("users").document(uid).collection("config").document("model")
 
-    model_id = DEFAULT_MODEL
+
+def _remembered(uid: str):
+    with _selections_lock:
+        entry = _selections.get(uid)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+
+def _stored_model_id(doc) -> str:
     if doc.exists:
-        data = doc.to_dict()
-        model_id = data.get("id", DEFAULT_MODEL)
+        return doc.to_dict().get("id", DEFAULT_MODEL)
+    return DEFAULT_MODEL
+
+
+def _remember(uid: str, model_id: str):
+    with _selections_lock:
+        _selections[uid] = (model_id, time.monotonic() + MODEL_SELECTION_TTL_SECONDS)
+
+
+def get_selected_model_id(uid: str) -> str:
+    """The user's selected model id, read from users/{uid}/config/model at most once per TTL"""
+    model_id = _remembered(uid)
+    if model_id is not None:
+        return model_id
+
+    user_config_ref = _model_config_ref(uid)
+    model_id = _stored_model_id(user_config_ref.get())
 
     if model_id not in MODEL_REGISTRY:
         print(f"Warning: Model '{model_id}' is not registered. Falling back to default model '{DEFAULT_MODEL}'.")
@@ -21,4 +58,57 @@ def get_model_pipeline(uid: str):
         user_config_ref.set({"id": DEFAULT_MODEL})
         model_id = DEFAULT_MODEL
 
-    return MODEL_REGISTRY[model_id]
+    _remember(uid, model_id)
+    return model_id
+
+
+async def aget_selected_model_id(uid: str) -> str:
+    """Async variant of get_selected_model_id; a cached selection is returned without I/O"""
+    model_id = _remembered(uid)
+    if model_id is not None:
+        return model_id
+
+    user_config_ref = _async_model_config_ref(uid)
+    model_id = _stored_model_id(await user_config_ref.get())
+
+    if model_id not in MODEL_REGISTRY:
+        print(f"Warning: Model '{model_id}' is not registered. Falling back to default model '{DEFAULT_MODEL}'.")
+        await user_config_ref.set({"id": DEFAULT_MODEL})
+        model_id = DEFAULT_MODEL
+
+    _remember(uid, model_id)
+    return model_id
+
+
+def set_selected_model_id(uid: str, model_id: str):
+    """Store the user's model selection and update this process's cached copy"""
+    try:
+        _model_config_ref(uid).set({"id": model_id})
+    except Exception:
+        invalidate_model_selection(uid)
+        raise
+    _remember(uid, model_id)
+
+
+def invalidate_model_selection(uid: str):
+    with _selections_lock:
+        _selections.pop(uid, None)
+
+
+def get_model_selection(uid: str):
+    """
+    Resolve the user's selected model
+
+    Returns:
+        Tuple of (model_id, pipeline)
+    """
+    model_id = get_selected_model_id(uid)
+    return model_id, MODEL_REGISTRY[model_id]
+
+
+def get_model_pipeline(uid: str):
+    return get_model_selection(uid)[1]
+
+
+async def aget_model_pipeline(uid: str):
+    return MODEL_REGISTRY[await aget_selected_model_id(uid)]
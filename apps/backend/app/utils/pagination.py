@@ -0,0 +1,112 @@
+# app/utils/pagination.py
+
+"""
+Cursor pagination, projection and counting for Firestore listings.
+
+Listings are ordered by document id, the order Firestore returns unordered queries in,
+so paging does not change what callers saw before and documents without a given field
+are never dropped. The cursor is the id of the last document of the previous page.
+"""
+
+import json
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Sequence, Tuple, Union
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+MAX_PAGE_SIZE = 1000
+
+# Page size used while streaming a whole listing
+STREAM_PAGE_SIZE = 500
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Comma-separated field names from a query parameter, or None for whole documents"""
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+def _page_query(collection_ref, query, limit: int, cursor: Optional[str], fields: Optional[Sequence[str]]):
+    query = query.order_by("__name__")
+    if fields is not None:
+        query = query.select(list(fields))
+    if cursor:
+        query = query.start_after({"__name__": collection_ref.document(cursor)})
+    return query.limit(limit + 1)
+
+
+# Queries are built on the async client (async_db)
+
+async def acount_query(query) -> int:
+    """Number of documents a query matches, from an aggregation (no documents are read)"""
+    return (await query.count().get())[0][0].value
+
+
+async def afetch_page(collection_ref, query, limit: int, cursor: Optional[str] = None,
+                      fields: Optional[Sequence[str]] = None) -> Tuple[list, Optional[str]]:
+    """
+    One page of a query over `collection_ref`
+
+    Returns:
+        (documents, next_cursor); next_cursor is None on the last page
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # One extra document tells whether another page follows
+    docs = [doc async for doc in _page_query(collection_ref, query, limit, cursor, fields).stream()]
+    if len(docs) > limit:
+        return docs[:limit], docs[limit - 1].id
+    return docs, None
+
+
+async def aiter_query(collection_ref, query, fields: Optional[Sequence[str]] = None,
+                      page_size: int = STREAM_PAGE_SIZE) -> AsyncIterator:
+    """Every document of a query, read page by page"""
+    cursor = None
+    while True:
+        docs, cursor = await afetch_page(collection_ref, query, page_size, cursor, fields)
+        for doc in docs:
+            yield doc
+        if cursor is None:
+            return
+
+
+def json_listing_response(head: dict, key: str, items: Union[Iterable[dict], AsyncIterable[dict]]) -> StreamingResponse:
+    """
+    Stream `{**head, key: [items...]}` as one JSON document, writing items as they are read
+
+    `items` may be an async iterable. A failure mid-stream ends the list early and adds
+    an "error" member, since the status code is already sent.
+    """
+    opening = json.dumps(jsonable_encoder(head), ensure_ascii=False)[:-1] + (", " if head else "") + json.dumps(key) + ": ["
+
+    def item_json(i: int, item: dict) -> str:
+        return (", " if i else "") + json.dumps(jsonable_encoder(item), ensure_ascii=False)
+
+    def closing(error: Optional[str]) -> str:
+        return "]" + (f", \"error\": {json.dumps(error)}" if error else "") + "}"
+
+    def body():
+        yield opening
+        error = None
+        try:
+            for i, item in enumerate(items):
+                yield item_json(i, item)
+        except Exception as e:
+            print(f"Error while streaming {key}: {e}")
+            error = str(e)
+        yield closing(error)
+
+    async def abody():
+        yield opening
+        error = None
+        try:
+            i = 0
+            async for item in items:
+                yield item_json(i, item)
+                i += 1
+        except Exception as e:
+            print(f"Error while streaming {key}: {e}")
+            error = str(e)
+        yield closing(error)
+
+    return StreamingResponse(abody() if hasattr(items, "__aiter__") else body(), media_type="application/json")
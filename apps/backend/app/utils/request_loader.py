@@ -0,0 +1,133 @@
+# app/utils/request_loader.py
+
+"""
+Request-scoped Firestore document loader.
+
+Within one API request, document reads made through load_documents/load_document are
+deduplicated and batched: each document is fetched at most once, and the documents a
+call needs that were not read yet are fetched with a single get_all. Reads can be
+limited to some fields, and a full read of a document also serves projected reads.
+bulk_write and forget() drop written documents so later reads see the new data.
+
+The scope is opened per HTTP request by the middleware in main.py and travels with
+the request's context into threadpool endpoints and streaming responses. Code running
+outside a request (background jobs, scripts) reads straight from Firestore.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    from app.core.firebase_client import db
+except (ImportError, KeyError, Exception):
+    # Firebase credentials not configured (e.g. unit tests)
+    db = None
+
+
+class RequestLoader:
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+        self._snapshots: Dict[tuple, object] = {}  # (document path, fields or None) -> snapshot
+        self.fetched = 0
+        self.deduped = 0
+
+    def _cached(self, path: str, fields: Optional[tuple]):
+        snapshot = self._snapshots.get((path, None))
+        if snapshot is None and fields is not None:
+            snapshot = self._snapshots.get((path, fields))
+        return snapshot
+
+    def load_many(self, refs: Iterable, field_paths: Optional[Sequence[str]] = None) -> Dict[str, object]:
+        """Snapshots of `refs` by path, fetching only documents not read yet"""
+        fields = tuple(sorted(field_paths)) if field_paths is not None else None
+        refs = {ref.path: ref for ref in refs}
+        with self._lock:
+            found = {path: self._cached(path, fields) for path in refs}
+            missing = [refs[path] for path, snapshot in found.items() if snapshot is None]
+            self.deduped += len(refs) - len(missing)
+        if missing:
+            client = self._client or db
+            snapshots = client.get_all(missing, field_paths=list(fields)) if fields is not None else client.get_all(missing)
+            with self._lock:
+                for snapshot in snapshots:
+                    path = snapshot.reference.path
+                    self._snapshots[(path, fields)] = found[path] = snapshot
+                    self.fetched += 1
+        return {path: snapshot for path, snapshot in found.items() if snapshot is not None}
+
+    def forget(self, paths: Iterable[str]):
+        paths = set(paths)
+        with self._lock:
+            for key in [key for key in self._snapshots if key[0] in paths]:
+                del self._snapshots[key]
+
+
+_current: ContextVar[Optional[RequestLoader]] = ContextVar("request_loader", default=None)
+
+
+def current_loader() -> Optional[RequestLoader]:
+    return _current.get()
+
+
+@contextmanager
+def request_scope(client=None):
+    """Make a fresh loader current for the enclosed code"""
+    token = _current.set(RequestLoader(client))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def load_documents(refs: Iterable, field_paths: Optional[Sequence[str]] = None) -> List:
+    """
+    Snapshots of `refs` in order, with one get_all for whatever the current request has
+    not read yet (or for all of them outside a request)
+
+    Args:
+        field_paths: Only read these fields (snapshots may still carry more)
+    """
+    refs = list(refs)
+    if not refs:
+        return []
+    loader = current_loader()
+    if loader is None:
+        if field_paths is not None:
+            snapshots = db.get_all(refs, field_paths=list(field_paths))
+        else:
+            snapshots = db.get_all(refs)
+        by_path = {snapshot.reference.path: snapshot for snapshot in snapshots}
+    else:
+        by_path = loader.load_many(refs, field_paths)
+    return [by_path[ref.path] for ref in refs if ref.path in by_path]
+
+
+def load_document(ref):
+    """Snapshot of one document, read at most once per request"""
+    if current_loader() is None:
+        return ref.get()
+    return load_documents([ref])[0]
+
+
+def forget(refs: Iterable):
+    """Drop documents that were just written from the current request's loader"""
+    loader = current_loader()
+    if loader is not None:
+        loader.forget(ref.path for ref in refs)
+
+
+class RequestLoaderMiddleware:
+    """ASGI middleware giving every HTTP request its own loader"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with request_scope():
+            await self.app(scope, receive, send)
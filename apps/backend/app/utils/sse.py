@@ -0,0 +1,39 @@
+# app/utils/sse.py
+
+import json
+from typing import Any, Iterable
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+def sse_response(events: Iterable[dict]) -> StreamingResponse:
+    """
+    Stream service events as server-sent events
+
+    Every item of a {"type": "results", "results": [...]} event is sent as its own
+    `result` event; any other event is sent under its type (e.g. `summary`). A failure
+    mid-stream is reported as an `error` event, since the status code is already sent.
+    """
+    def body():
+        try:
+            for event in events:
+                if event["type"] == "results":
+                    for result in event["results"]:
+                        yield format_sse("result", result)
+                else:
+                    yield format_sse(event["type"], {k: v for k, v in event.items() if k != "type"})
+        except Exception as e:
+            print(f"Error while streaming events: {e}")
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,89 @@
+# app/utils/staged_pipeline.py
+
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List
+
+# How long a blocked stage waits before re-checking whether the pipeline was abandoned
+_POLL_SECONDS = 0.5
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def run_staged(items: Iterable, stages: List[Callable[[Any], Any]], queue_size: int = 2) -> Iterator[Any]:
+    """
+    Run each item through `stages` in order, one thread per stage, connected by bounded queues
+
+    While the caller handles the output for item N, the last stage can already work on
+    item N+1 and the first stage on item N+2. Outputs are yielded in input order. A stage
+    that raises stops the pipeline and the exception is re-raised to the caller; if the
+    caller stops iterating, the stage threads wind down.
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    def put(q: queue.Queue, value) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def feed():
+        try:
+            for item in items:
+                if not put(queues[0], item):
+                    return
+        except Exception as e:
+            put(queues[0], _StageError(e))
+            return
+        put(queues[0], _DONE)
+
+    def work(stage: Callable, inbox: queue.Queue, outbox: queue.Queue):
+        while True:
+            item = get(inbox)
+            if item is _DONE or isinstance(item, _StageError):
+                put(outbox, item)
+                return
+            try:
+                result = stage(item)
+            except BaseException as e:
+                put(outbox, _StageError(e))
+                return
+            if not put(outbox, result):
+                return
+
+    output = queue.Queue(maxsize=queue_size)
+    outboxes = queues[1:] + [output]
+    threads = [threading.Thread(target=feed, daemon=True)] + [
+        threading.Thread(target=work, args=(stage, inbox, outbox), daemon=True)
+        for stage, inbox, outbox in zip(stages, queues, outboxes)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            result = get(output)
+            if result is _DONE:
+                return
+            if isinstance(result, _StageError):
+                raise result.error
+            yield result
+    finally:
+        stop.set()
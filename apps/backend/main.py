@@ -1,10 +1,24 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.api import api_router
 from app.core.firebase_auth import verify_firebase_token
 from app.core.config import settings
+from app.pipelines.transport import HTTPTransport
+from app.services.jobs_service import resume_stale_jobs
+from app.utils.request_loader import RequestLoaderMiddleware
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pick up background jobs left unfinished by a crashed or redeployed instance
+    resume_stale_jobs()
+    yield
+    # Release pooled keep-alive connections to the LLM providers
+    await HTTPTransport.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for frontend
 app.add_middleware(
@@ -15,6 +29,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Deduplicate and batch Firestore document reads within each request
+app.add_middleware(RequestLoaderMiddleware)
+
 # ✅ Protect all routes with auth
 app.include_router(api_router, prefix="/api/v1")
 
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for assessment cache keys and the in-process tier
+"""
+
+from app.services.assessment_cache_service import assessment_key, normalize_statement
+
+
+def test_formatting_only_differences_share_a_key():
+    assert normalize_statement("  The  cat\tsat\n") == "The cat sat"
+    assert normalize_statement("ﬁne") == "fine"  # NFKC folds the ligature
+    assert assessment_key("m", "p", "The cat sat") == assessment_key("m", "p", " The  cat sat ")
+
+
+def test_model_prompt_and_statement_change_the_key():
+    key = assessment_key("m", "p", "The cat sat")
+    assert len(key) == 64
+    assert key != assessment_key("other", "p", "The cat sat")
+    assert key != assessment_key("m", "other", "The cat sat")
+    assert key != assessment_key("m", "p", "The dog sat")
+
+
+def test_memory_tier_evicts_least_recently_used_and_expired_entries(monkeypatch):
+    import app.services.assessment_cache_service as cache
+    from app.services.assessment_cache_service import _MemoryTier
+
+    tier = _MemoryTier(max_entries=2, ttl_seconds=60)
+    tier.put_many({"a": "acceptable", "b": "unacceptable"})
+    assert tier.get_many(["a"]) == {"a": "acceptable"}
+    tier.put_many({"c": "acceptable"})  # evicts "b", the least recently used
+    assert tier.get_many(["a", "b", "c"]) == {"a": "acceptable", "c": "acceptable"}
+
+    tier.invalidate(["a"])
+    assert tier.get_many(["a"]) == {}
+    stats = tier.stats()
+    assert stats["evictions"] == 1 and stats["invalidations"] == 1 and stats["memory_hits"] == 3
+
+    tier.put_many({"d": "acceptable"})
+    monkeypatch.setattr(cache.time, "time", lambda: float("inf"))
+    assert tier.get_many(["c", "d"]) == {}
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for token-budget-aware adaptive batch sizing
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.pipelines.batch_sizing import BatchSizer
+
+
+def test_short_items_share_a_batch_and_long_items_split():
+    sizer = BatchSizer()
+    short = ["Short statement."] * 40
+    assert len(sizer.plan("llama3-8b-8192", "batch_grade", short)) == 1
+
+    long_texts = ["Una frase muy larga en español " * 40] * 10
+    batches = sizer.plan("llama3-8b-8192", "batch_perturb", long_texts)
+    assert len(batches) > 1
+    assert [i for batch in batches for i in batch] == list(range(10))
+
+
+def test_larger_budget_models_pack_more():
+    sizer = BatchSizer()
+    texts = ["A statement of moderate length for perturbation purposes. " * 4] * 200
+    small = sizer.plan("llama3-8b-8192", "batch_perturb", texts)
+    large = sizer.plan("gemini-2.5-flash", "batch_perturb", texts)
+    assert len(large) < len(small)
+
+
+def test_truncation_shrinks_batches_and_raises_completion_estimate():
+    sizer = BatchSizer()
+    texts = ["Short statement."] * 80
+    before_batches = len(sizer.plan("gemma2-9b-it", "batch_grade", texts))
+    before_tokens = sizer.completion_tokens("gemma2-9b-it", "batch_grade", texts[:10])
+
+    sizer.record("gemma2-9b-it", "batch_grade", items=80, truncated=True, failed=30)
+    assert len(sizer.plan("gemma2-9b-it", "batch_grade", texts)) > before_batches
+    assert sizer.completion_tokens("gemma2-9b-it", "batch_grade", texts[:10]) > before_tokens
+    # Other models and operations are unaffected
+    assert sizer.status("llama3-8b-8192") == {}
+
+
+def test_clean_replies_grow_batches_back():
+    sizer = BatchSizer()
+    sizer.record("gemma2-9b-it", "batch_grade", items=10, truncated=False, failed=5)
+    shrunk = sizer.status("gemma2-9b-it")["batch_grade"]["scale"]
+    for _ in range(10):
+        sizer.record("gemma2-9b-it", "batch_grade", items=10, truncated=False, failed=0)
+    assert sizer.status("gemma2-9b-it")["batch_grade"]["scale"] > shrunk
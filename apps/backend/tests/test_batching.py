@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for partial-failure re-requests of batch operations
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.pipelines.batching import request_with_retries, arequest_with_retries, is_valid_grade
+
+
+def _flaky_grader(drop_once):
+    """Batch grader that omits each statement in `drop_once` the first time it is asked"""
+    calls = []
+
+    def request_batch(statements):
+        calls.append(list(statements))
+        grades = []
+        for statement in statements:
+            if statement in drop_once:
+                drop_once.remove(statement)
+                grades.append("unknown")
+            else:
+                grades.append("acceptable")
+        return grades
+
+    return request_batch, calls
+
+
+def test_only_missing_items_are_re_requested():
+    request_batch, calls = _flaky_grader({"b", "d"})
+    result = request_with_retries(["a", "b", "c", "d"], request_batch, is_valid_grade, "batch grading")
+    assert list(result) == ["acceptable"] * 4
+    assert calls == [["a", "b", "c", "d"], ["b", "d"]]
+    assert result.retried == [1, 3]
+    assert result.failed == []
+
+
+def test_rounds_are_bounded():
+    calls = []
+
+    def request_batch(statements):
+        calls.append(list(statements))
+        return ["acceptable" if s == "a" else "unknown" for s in statements] if len(calls) == 1 else ["unknown"] * len(statements)
+
+    result = request_with_retries(["a", "b"], request_batch, is_valid_grade, "batch grading", max_rounds=3)
+    assert list(result) == ["acceptable", "unknown"]
+    # The follow-up returned nothing usable, so it is not repeated
+    assert calls == [["a", "b"], ["b"]]
+    assert result.retried == [1]
+    assert result.failed == [1]
+
+
+def test_failed_call_is_not_repeated():
+    calls = []
+
+    def request_batch(statements):
+        calls.append(list(statements))
+        return ["unknown"] * len(statements)
+
+    result = request_with_retries(["a", "b"], request_batch, is_valid_grade, "batch grading")
+    assert len(calls) == 1
+    assert result.retried == []
+    assert result.failed == [0, 1]
+
+
+def test_async_variant():
+    request_batch, calls = _flaky_grader({"c"})
+
+    async def arequest_batch(statements):
+        return request_batch(statements)
+
+    result = asyncio.run(arequest_with_retries(["a", "b", "c"], arequest_batch, is_valid_grade, "batch grading"))
+    assert list(result) == ["acceptable"] * 3
+    assert calls[1] == ["c"]
+    assert result.retried == [2]
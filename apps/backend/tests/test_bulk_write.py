@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for chunked bulk Firestore writes with per-item failures
+"""
+
+import threading
+import app.utils.bulk_write as bw
+
+
+class FakeRef:
+    def __init__(self, store, doc_id):
+        self.store, self.id = store, doc_id
+
+    def set(self, data, merge=False):
+        if data.get("bad"):
+            raise ValueError("rejected")
+        self.store[self.id] = data
+
+    def delete(self):
+        self.store.pop(self.id, None)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db, self.writes = db, []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref, data))
+
+    def delete(self, ref):
+        self.writes.append((ref, None))
+
+    def commit(self):
+        # Atomic like Firestore: one rejected write fails the whole batch
+        if any(data and data.get("bad") for _, data in self.writes):
+            raise ValueError("batch rejected")
+        for ref, data in self.writes:
+            ref.set(data) if data is not None else ref.delete()
+        with self.db.lock:
+            self.db.commits.append(len(self.writes))
+
+
+class FakeDB:
+    def __init__(self):
+        self.commits = []
+        self.lock = threading.Lock()
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def test_bulk_write_chunks_and_reports_failed_items(monkeypatch):
+    store = {}
+    db = FakeDB()
+    monkeypatch.setattr(bw, "db", db)
+    monkeypatch.setattr(bw, "FIRESTORE_BATCH_LIMIT", 3)
+
+    ops = [bw.set_op(FakeRef(store, f"d{i}"), {"bad": i == 4}) for i in range(7)]
+    result = bw.bulk_write(ops, workers=2)
+
+    # Chunks of 3, 3 and 1; the chunk holding d4 is rejected and retried item by item
+    assert sorted(db.commits) == [1, 3]
+    assert result.written == 6
+    assert result.failed_ids == ["d4"]
+    assert sorted(store) == ["d0", "d1", "d2", "d3", "d5", "d6"]
+
+    result = bw.bulk_write([bw.delete_op(FakeRef(store, "d0"))])
+    assert result.written == 1 and "d0" not in store
+
+
+class FakeDoc:
+    def __init__(self, doc_id):
+        self.id = doc_id
+
+
+class FakeQuery:
+    def __init__(self, ids, limit=None, after=None):
+        self.ids, self._limit, self.after = ids, limit, after
+
+    def select(self, fields):
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, n):
+        return FakeQuery(self.ids, n, self.after)
+
+    def start_after(self, doc):
+        return FakeQuery(self.ids, self._limit, doc.id)
+
+    def stream(self):
+        ids = [i for i in sorted(self.ids) if self.after is None or i > self.after]
+        return iter([FakeDoc(i) for i in ids[:self._limit]])
+
+
+def test_iter_query_pages_resumes_after_last_document():
+    ids = [f"d{i:02d}" for i in range(7)]
+    pages = list(bw.iter_query_pages(FakeQuery(ids), page_size=3))
+    assert [[doc.id for doc in page] for page in pages] == [ids[0:3], ids[3:6], ids[6:7]]
+    assert list(bw.iter_query_pages(FakeQuery([]), page_size=3)) == []
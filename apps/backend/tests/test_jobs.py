@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for job checkpoints and task retries
+"""
+
+import app.services.jobs_service as jobs
+from app.services.jobs_service import JobProgress, run_tasks
+
+
+class FakeRef:
+    """Job document reference that records updates"""
+
+    def __init__(self):
+        self.updates = []
+
+    def update(self, data):
+        self.updates.append(data)
+
+
+def test_progress_skips_completed_tasks_and_counts_attempts(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_TASK_MAX_ATTEMPTS", 2)
+    progress = JobProgress(FakeRef(), {
+        "completed_task_ids": ["a"],
+        "failed_task_ids": ["b"],
+        "failed_attempts": {"b": 1, "c": 2},
+    })
+
+    assert progress.is_done("a") and not progress.can_retry("a")
+    assert not progress.is_done("b") and progress.can_retry("b")
+    assert not progress.can_retry("c")  # out of attempts
+    assert progress.can_retry("d")
+
+
+def test_checkpoint_records_failures_and_clears_retried_tasks():
+    ref = FakeRef()
+    progress = JobProgress(ref, {"failed_task_ids": ["b"], "failed_attempts": {"b": 1}})
+
+    progress.checkpoint(["a"], ["c"])
+    first = ref.updates[-1]
+    assert first["completed_task_ids"].values == ["a"]
+    assert first["failed_task_ids"].values == ["c"]
+    assert first["failed_attempts"] == {"b": 1, "c": 1}
+
+    progress.checkpoint(["b"])
+    assert "failed_task_ids" not in ref.updates[-2]
+    assert ref.updates[-1]["failed_task_ids"].values == ["b"]  # removed once it succeeds
+    assert progress.failed == {"c"} and progress.completed == {"a", "b"}
+
+
+def test_run_tasks_retries_failures_until_attempts_run_out(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_TASK_MAX_ATTEMPTS", 3)
+    progress = JobProgress(FakeRef(), {"completed_task_ids": ["done"]})
+    # "flaky" succeeds on its second attempt, "broken" never does
+    outcomes = {"flaky": [False, True], "broken": [False, False, False, True]}
+    calls = []
+
+    def process(tasks):
+        calls.append(list(tasks))
+        completed = [task for task in tasks if outcomes[task].pop(0)]
+        yield completed, [task for task in tasks if task not in completed]
+
+    run_tasks(progress, ["done", "flaky", "broken"], lambda task: task, process)
+
+    assert calls == [["flaky", "broken"], ["flaky", "broken"], ["broken"]]
+    assert progress.completed == {"done", "flaky"}
+    assert progress.failed == {"broken"} and progress.attempts == {"flaky": 1, "broken": 3}
+
+
+def test_run_tasks_stops_after_a_pass_without_failures():
+    progress = JobProgress(FakeRef(), {})
+    calls = []
+
+    def process(tasks):
+        calls.append(list(tasks))
+        yield tasks[:1], []
+        yield tasks[1:], []
+
+    run_tasks(progress, ["a", "b"], lambda task: task, process)
+    assert calls == [["a", "b"]] and progress.completed == {"a", "b"}
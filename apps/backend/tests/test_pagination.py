@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for listing pagination helpers
+"""
+
+import json
+import asyncio
+from app.utils.pagination import aiter_query, json_listing_response, parse_fields
+
+
+def _body(response) -> str:
+    async def collect():
+        return "".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields("title, label,,") == ["title", "label"]
+
+
+def test_streamed_listing_is_one_json_document():
+    response = json_listing_response({"topic": "T", "test_count": 2}, "tests", iter([{"id": "a"}, {"id": "b"}]))
+    assert json.loads(_body(response)) == {"topic": "T", "test_count": 2, "tests": [{"id": "a"}, {"id": "b"}]}
+
+    assert json.loads(_body(json_listing_response({}, "perturbations", iter(())))) == {"perturbations": []}
+
+
+def test_streamed_listing_reports_failures_mid_stream():
+    def items():
+        yield {"id": "a"}
+        raise RuntimeError("read failed")
+
+    assert json.loads(_body(json_listing_response({"n": 1}, "tests", items()))) == {"n": 1, "tests": [{"id": "a"}], "error": "read failed"}
+
+
+class FakeDoc:
+    def __init__(self, doc_id):
+        self.id = doc_id
+
+
+class FakeAsyncQuery:
+    """Async query over sorted ids supporting the calls the page helpers make"""
+
+    def __init__(self, ids, after=None, count=None):
+        self.ids, self.after, self.count = ids, after, count
+
+    def order_by(self, field):
+        return self
+
+    def start_after(self, values):
+        return FakeAsyncQuery(self.ids, values["__name__"], self.count)
+
+    def limit(self, count):
+        return FakeAsyncQuery(self.ids, self.after, count)
+
+    def document(self, doc_id):
+        return doc_id
+
+    async def stream(self):
+        ids = [i for i in self.ids if self.after is None or i > self.after]
+        for doc_id in ids[:self.count]:
+            yield FakeDoc(doc_id)
+
+
+def test_async_listing_reads_every_page_and_streams():
+    query = FakeAsyncQuery(["a", "b", "c", "d", "e"])
+
+    async def ids():
+        return [doc.id async for doc in aiter_query(query, query, page_size=2)]
+    assert asyncio.run(ids()) == ["a", "b", "c", "d", "e"]
+
+    async def items():
+        async for doc in aiter_query(query, query, page_size=2):
+            yield {"id": doc.id}
+    assert json.loads(_body(json_listing_response({}, "tests", items())))["tests"][-1] == {"id": "e"}
+
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-model token-bucket rate limiter
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.pipelines.rate_limiter import RateLimiter
+from app.pipelines.rate_limit_backends import MemoryBackend, SQLiteBackend
+
+
+def test_bucket_allows_burst_then_paces():
+    backend = MemoryBackend()
+    bucket = [("requests", 3, 1.0, 1)]
+    for _ in range(3):
+        assert backend.try_acquire("key", bucket, now=100.0) == 0.0
+    assert backend.try_acquire("key", bucket, now=100.0) == 1.0
+    assert backend.try_acquire("key", bucket, now=101.0) == 0.0
+
+
+def test_models_have_independent_budgets():
+    limiter = RateLimiter()
+    for _ in range(30):
+        assert limiter.try_acquire("llama3-8b-8192", "key") == 0.0
+    assert limiter.try_acquire("llama3-8b-8192", "key") > 0.0
+    # Another model and another key are unaffected
+    assert limiter.try_acquire("gemma2-9b-it", "key") == 0.0
+    assert limiter.try_acquire("llama3-8b-8192", "other-key") == 0.0
+
+
+def test_token_budget_and_usage_reconciliation():
+    limiter = RateLimiter()
+    assert limiter.try_acquire("llama3-8b-8192", "key", tokens=6000) == 0.0
+    assert limiter.wait_estimate("llama3-8b-8192", "key", tokens=1000) > 0.0
+    # Provider reported far fewer tokens than were reserved
+    limiter.record_usage("llama3-8b-8192", "key", reserved_tokens=6000, actual_tokens=500)
+    assert limiter.try_acquire("llama3-8b-8192", "key", tokens=1000) == 0.0
+
+
+def test_penalize_blocks_all_callers():
+    limiter = RateLimiter()
+    limiter.penalize("gemma2-9b-it", "key", retry_after=5.0)
+    assert limiter.try_acquire("gemma2-9b-it", "key") > 4.0
+    assert limiter.status("gemma2-9b-it", "key")["wait_estimate_seconds"] > 4.0
+
+
+def test_sqlite_backend_shares_budget_between_instances(tmp_path):
+    # Two limiters over the same file behave like two worker processes
+    path = str(tmp_path / "limits.sqlite3")
+    worker_a = RateLimiter(SQLiteBackend(path))
+    worker_b = RateLimiter(SQLiteBackend(path))
+    for i in range(30):
+        worker = worker_a if i % 2 else worker_b
+        assert worker.try_acquire("gemma2-9b-it", "key") == 0.0
+    assert worker_a.try_acquire("gemma2-9b-it", "key") > 0.0
+    assert worker_b.try_acquire("gemma2-9b-it", "key") > 0.0
+    worker_a.penalize("gemma2-9b-it", "key", retry_after=30.0)
+    assert worker_b.wait_estimate("gemma2-9b-it", "key") > 29.0
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for request-scoped document read deduplication
+"""
+
+from app.utils import request_loader as rl
+
+
+class FakeRef:
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference, self.data = ref, data
+
+
+class FakeClient:
+    def __init__(self, store):
+        self.store, self.calls = store, []
+
+    def get_all(self, refs, field_paths=None):
+        refs = list(refs)
+        self.calls.append([ref.path for ref in refs])
+        return [FakeSnapshot(ref, self.store.get(ref.path)) for ref in refs]
+
+
+def test_documents_are_fetched_once_per_request_in_one_get_all():
+    client = FakeClient({"a": 1, "b": 2, "c": 3})
+    with rl.request_scope(client) as loader:
+        first = rl.load_documents([FakeRef("a"), FakeRef("b"), FakeRef("a")])
+        second = rl.load_documents([FakeRef("b"), FakeRef("c")])
+        assert [s.data for s in first] == [1, 2, 1]
+        assert [s.data for s in second] == [2, 3]
+        assert client.calls == [["a", "b"], ["c"]]
+        assert loader.deduped == 1
+
+        client.store["b"] = 20
+        rl.forget([FakeRef("b")])
+        assert rl.load_document(FakeRef("b")).data == 20
+        assert client.calls[-1] == ["b"]
+
+    assert rl.current_loader() is None
+
+
+def test_projected_reads_reuse_full_reads_but_not_the_reverse():
+    client = FakeClient({"a": 1, "b": 2})
+    with rl.request_scope(client):
+        rl.load_documents([FakeRef("a")])
+        rl.load_documents([FakeRef("a"), FakeRef("b")], field_paths=["title"])
+        rl.load_documents([FakeRef("b")], field_paths=["title"])
+        rl.load_documents([FakeRef("b")])
+        assert client.calls == [["a"], ["b"], ["b"]]
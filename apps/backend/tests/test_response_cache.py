@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed LLM response cache
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.pipelines.response_cache import ResponseCache, make_key
+
+
+def test_key_ignores_surrounding_whitespace_and_key_order():
+    a = make_key("grade", {"model": "m", "messages": [{"role": "user", "content": " hi "}], "temperature": 0.6})
+    b = make_key("grade", {"temperature": 0.6, "messages": [{"content": "hi", "role": "user"}], "model": "m"})
+    assert a == b
+    assert a != make_key("batch_grade", {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0.6})
+
+
+def test_cached_only_stores_valid_results():
+    cache = ResponseCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "unknown" if len(calls) == 1 else "acceptable"
+
+    is_valid = lambda label: label != "unknown"
+    assert cache.cached("grade", {"s": 1}, compute, is_valid) == "unknown"
+    assert cache.cached("grade", {"s": 1}, compute, is_valid) == "acceptable"
+    assert cache.cached("grade", {"s": 1}, compute, is_valid) == "acceptable"
+    assert len(calls) == 2
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 2
+
+
+def test_memory_tier_evicts_least_recently_used_by_size():
+    cache = ResponseCache(max_bytes=20)
+    cache.put("grade", "a", "x" * 8)
+    cache.put("grade", "b", "y" * 8)
+    assert cache.get("grade", "a") is not None  # a is now most recently used
+    cache.put("grade", "c", "z" * 8)
+    assert cache.get("grade", "b") is None
+    assert cache.get("grade", "a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_zero_ttl_disables_caching_and_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(disk_path=path, ttls={"grade": 60, "generate": 0})
+    cache.put("generate", "g", ["statement"])
+    cache.put("grade", "k", "acceptable")
+
+    restarted = ResponseCache(disk_path=path, ttls={"grade": 60, "generate": 0})
+    assert restarted.get("generate", "g") is None
+    assert restarted.get("grade", "k") == "acceptable"
+    assert restarted.stats()["disk_hits"] == 1
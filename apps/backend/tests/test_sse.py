@@ -0,0 +1,32 @@
+import json
+import asyncio
+from app.utils.sse import format_sse, sse_response
+
+
+def _collect(response) -> str:
+    async def read():
+        return "".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(read())
+
+
+def test_format_sse():
+    assert format_sse("summary", {"graded_count": 2}) == 'event: summary\ndata: {"graded_count": 2}\n\n'
+
+
+def test_sse_response_splits_results_and_reports_errors():
+    def events():
+        yield {"type": "results", "results": [{"test_id": "a"}, {"test_id": "b"}]}
+        yield {"type": "summary", "graded_count": 2}
+        raise RuntimeError("boom")
+
+    response = sse_response(events())
+    assert response.media_type == "text/event-stream"
+
+    chunks = [c for c in _collect(response).split("\n\n") if c]
+    parsed = [(c.split("\n")[0][len("event: "):], json.loads(c.split("\n")[1][len("data: "):])) for c in chunks]
+    assert parsed == [
+        ("result", {"test_id": "a"}),
+        ("result", {"test_id": "b"}),
+        ("summary", {"graded_count": 2}),
+        ("error", {"detail": "boom"}),
+    ]
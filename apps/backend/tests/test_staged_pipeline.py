@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the threaded staged pipeline used by perturbation generation
+"""
+
+import sys
+import os
+import time
+import threading
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from app.utils.staged_pipeline import run_staged
+
+
+def test_outputs_keep_input_order():
+    assert list(run_staged(range(20), [lambda x: x * 2, lambda x: x + 1])) == [x * 2 + 1 for x in range(20)]
+
+
+def test_stages_overlap():
+    def slow(x):
+        time.sleep(0.1)
+        return x
+
+    start = time.time()
+    assert list(run_staged(range(6), [slow, slow])) == list(range(6))
+    # Serial execution would take 1.2s; overlapped stages finish in about 0.7s
+    assert time.time() - start < 1.0
+
+
+def test_stage_error_is_raised_to_caller():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    seen = []
+    with pytest.raises(ValueError):
+        for x in run_staged(range(10), [fail_on_three]):
+            seen.append(x)
+    assert seen == [0, 1, 2]
+
+
+def test_abandoned_pipeline_stops_its_threads():
+    before = threading.active_count()
+    outputs = run_staged(range(1000), [lambda x: x])
+    assert next(outputs) == 0
+    outputs.close()
+    time.sleep(1.0)
+    assert threading.active_count() <= before
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Tests for JSON-mode parsing of batched LLM replies and its text fallback
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.pipelines.structured_output import (
+    batch_grade_schema, batch_perturb_schema, clean_grade, parse_items, parse_statements, validate
+)
+
+
+def test_json_reply_keyed_by_id():
+    reply = '```json\n{"1": "Acceptable", "2": "unacceptable", "3": "maybe"}\n```'
+    assert parse_items(reply, 3, batch_grade_schema(3), clean=clean_grade) == {1: "acceptable", 2: "unacceptable"}
+
+
+def test_schema_validation():
+    assert validate({"1": "acceptable", "2": "unacceptable"}, batch_grade_schema(2))
+    assert not validate({"1": "acceptable"}, batch_grade_schema(2))
+    assert not validate({"1": ""}, batch_perturb_schema(1))
+
+
+def test_text_fallback_handles_other_numbering():
+    reply = "Here are the grades:\n1) acceptable\n**2.** Unacceptable\n3: acceptable."
+    assert parse_items(reply, 3, batch_grade_schema(3), clean=clean_grade) == {
+        1: "acceptable", 2: "unacceptable", 3: "acceptable"
+    }
+
+
+def test_text_fallback_keeps_multiline_and_digit_prefixed_items():
+    reply = "1. 3 apples fell\nfrom the tree\n2. 10 people agreed"
+    assert parse_items(reply, 2, None) == {1: "3 apples fell from the tree", 2: "10 people agreed"}
+
+
+def test_generated_statements():
+    assert parse_statements('{"statements": ["First statement here", "Second statement here"]}', 1, True) == ["First statement here"]
+    assert parse_statements("1) First statement here\n- Second statement here", 5, True) == [
+        "First statement here", "Second statement here"
+    ]
@@ -56,7 +56,7 @@ export function AnalyzeAIBehaviorButton({
       const result = await generatePerturbations({
         topic: currentTopic,
         test_ids: selectedTestIds
-      })
+      }, job => console.log(`Perturbation job ${job.status}: ${job.completed_tasks}/${job.total_tasks ?? "?"} tasks, ETA ${job.eta_seconds ?? "?"}s`))
       
       console.log("API response:", result)
 
@@ -1,6 +1,7 @@
 import { getAuth } from "firebase/auth"
 import { API_BASE_URL } from "@/lib/api"
 import { PerturbationResponse } from "@/types/perturbations"
+import { postEventStream } from "./sse"
 
 export interface GeneratePerturbationsRequest {
   topic: string
@@ -13,7 +14,23 @@ export interface GeneratePerturbationsResponse {
   perturbations: PerturbationResponse[]
 }
 
-export async function generatePerturbations(perturbationData: GeneratePerturbationsRequest): Promise<GeneratePerturbationsResponse> {
+export interface PerturbationJobResponse {
+  job_id: string
+  status: "queued" | "running" | "completed" | "failed"
+}
+
+export interface PerturbationJobStatus extends PerturbationJobResponse {
+  total_tasks: number | null
+  completed_tasks: number
+  failed_tasks: number
+  remaining_tasks: number | null
+  eta_seconds: number | null
+  error?: string | null
+}
+
+const JOB_POLL_INTERVAL_MS = 2000
+
+export async function startPerturbationJob(perturbationData: GeneratePerturbationsRequest): Promise<PerturbationJobResponse> {
   const user = getAuth().currentUser
   if (!user) throw new Error("User not authenticated")
 
@@ -36,6 +53,93 @@ export async function generatePerturbations(perturbationData: GeneratePerturbati
   return await res.json()
 }
 
+export async function fetchPerturbationJob(jobId: string): Promise<PerturbationJobStatus> {
+  const user = getAuth().currentUser
+  if (!user) throw new Error("User not authenticated")
+
+  const token = await user.getIdToken()
+
+  const res = await fetch(`${API_BASE_URL}/api/v1/perturbations/jobs/${encodeURIComponent(jobId)}`, {
+    method: 'GET',
+    headers: {
+      Authorization: `Bearer ${token}`,
+      'Content-Type': 'application/json'
+    }
+  })
+
+  if (!res.ok) {
+    const errorData = await res.json().catch(() => ({}))
+    throw new Error(errorData.detail || "Failed to fetch perturbation job")
+  }
+
+  return await res.json()
+}
+
+export async function fetchPerturbationJobResults(jobId: string): Promise<{ perturbations: PerturbationResponse[] }> {
+  const user = getAuth().currentUser
+  if (!user) throw new Error("User not authenticated")
+
+  const token = await user.getIdToken()
+
+  const res = await fetch(`${API_BASE_URL}/api/v1/perturbations/jobs/${encodeURIComponent(jobId)}/results`, {
+    method: 'GET',
+    headers: {
+      Authorization: `Bearer ${token}`,
+      'Content-Type': 'application/json'
+    }
+  })
+
+  if (!res.ok) {
+    const errorData = await res.json().catch(() => ({}))
+    throw new Error(errorData.detail || "Failed to fetch perturbation job results")
+  }
+
+  return await res.json()
+}
+
+// Starts a background perturbation job and polls it until it finishes
+export async function generatePerturbations(
+  perturbationData: GeneratePerturbationsRequest,
+  onProgress?: (job: PerturbationJobStatus) => void
+): Promise<GeneratePerturbationsResponse> {
+  const { job_id } = await startPerturbationJob(perturbationData)
+
+  for (;;) {
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS))
+    const job = await fetchPerturbationJob(job_id)
+    onProgress?.(job)
+    if (job.status === "completed") break
+    if (job.status === "failed") throw new Error(job.error || "Perturbation job failed")
+  }
+
+  const { perturbations } = await fetchPerturbationJobResults(job_id)
+  return {
+    message: `Generated ${perturbations.length} perturbations`,
+    perturbations
+  }
+}
+
+export interface PerturbationStreamSummary {
+  message: string
+  generated_count: number
+  failed_count: number
+}
+
+// Generates perturbations, receiving each one as soon as its batch is stored
+export async function streamPerturbations(
+  perturbationData: GeneratePerturbationsRequest,
+  onPerturbation: (perturbation: PerturbationResponse) => void
+): Promise<PerturbationStreamSummary> {
+  let summary: PerturbationStreamSummary = { message: "", generated_count: 0, failed_count: 0 }
+
+  await postEventStream("/api/v1/perturbations/generate/stream", perturbationData, ({ event, data }) => {
+    if (event === "result") onPerturbation(data)
+    else if (event === "summary") summary = data
+  }, "Failed to generate perturbations")
+
+  return summary
+}
+
 export async function fetchPerturbationsByTopic(topic: string): Promise<GeneratePerturbationsResponse> {
   const user = getAuth().currentUser
   if (!user) throw new Error("User not authenticated")
@@ -0,0 +1,67 @@
+import { getAuth } from "firebase/auth"
+import { API_BASE_URL } from "@/lib/api"
+
+export interface ServerSentEvent {
+  event: string
+  data: any
+}
+
+// POSTs to a streaming endpoint and calls onEvent for every server-sent event as it arrives.
+// Resolves once the stream ends; an `error` event from the server is thrown.
+export async function postEventStream(
+  path: string,
+  body: unknown,
+  onEvent: (event: ServerSentEvent) => void,
+  fallbackError: string
+): Promise<void> {
+  const user = getAuth().currentUser
+  if (!user) throw new Error("User not authenticated")
+
+  const token = await user.getIdToken()
+
+  const res = await fetch(`${API_BASE_URL}${path}`, {
+    method: 'POST',
+    headers: {
+      Authorization: `Bearer ${token}`,
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream'
+    },
+    body: JSON.stringify(body)
+  })
+
+  if (!res.ok || !res.body) {
+    const errorData = await res.json().catch(() => ({}))
+    throw new Error(errorData.detail || fallbackError)
+  }
+
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ""
+
+  const dispatch = (chunk: string) => {
+    let event = "message"
+    const data: string[] = []
+    for (const line of chunk.split("\n")) {
+      if (line.startsWith("event:")) event = line.slice(6).trim()
+      else if (line.startsWith("data:")) data.push(line.slice(5).trim())
+    }
+    if (data.length === 0) return
+    const parsed = JSON.parse(data.join("\n"))
+    if (event === "error") throw new Error(parsed.detail || fallbackError)
+    onEvent({ event, data: parsed })
+  }
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    // Events are separated by a blank line
+    let boundary
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      dispatch(buffer.slice(0, boundary))
+      buffer = buffer.slice(boundary + 2)
+    }
+  }
+  if (buffer.trim()) dispatch(buffer)
+}
@@ -1,5 +1,6 @@
 import { getAuth } from "firebase/auth"
 import { API_BASE_URL } from "@/lib/api"
+import { postEventStream } from "./sse"
 
 export interface TestResponse {
   id: string
@@ -279,6 +280,8 @@ export interface AutoGradeTestsRequest {
 
 export interface AutoGradeTestsResponse {
   graded_count: number
+  cache_hits?: number
+  cache_misses?: number
   results: Array<{
     test_id: string
     statement: string
@@ -307,4 +310,21 @@ export async function autoGradeTests(testIds: string[]): Promise<AutoGradeTestsR
   }
 
   return await res.json()
+}
+
+export type AutoGradeResult = AutoGradeTestsResponse["results"][number]
+
+// Auto grades tests, receiving each assessment as soon as its batch is stored
+export async function streamAutoGradeTests(
+  testIds: string[],
+  onResult: (result: AutoGradeResult) => void
+): Promise<Omit<AutoGradeTestsResponse, "results">> {
+  let summary: Omit<AutoGradeTestsResponse, "results"> = { graded_count: 0 }
+
+  await postEventStream("/api/v1/tests/auto-grade/stream", { test_ids: testIds }, ({ event, data }) => {
+    if (event === "result") onResult(data)
+    else if (event === "summary") summary = data
+  }, "Failed to auto grade tests")
+
+  return summary
 }
\ No newline at end of file